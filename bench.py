@@ -0,0 +1,401 @@
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import snake_game
+from snake_game import RODS, PHASE_TIMERS
+from session_store import SqliteStore, StaleSession, dump_game, load_game, SHM_DIR
+
+# Headless benchmarks for the game loop, serialization and the Flask routes.
+#
+#   python bench.py                   run every case and print a report
+#   python bench.py --save            ... and store the results as the baseline
+#   python bench.py --check           ... and exit 1 if a case ends in a
+#                                     different state than the baseline
+#   python bench.py --check --timings ... or is slower than the baseline
+#
+# Each case builds a Game from a fixed seed and drives the same scripted
+# inputs, so two runs on the same code end in the same state (the digest
+# column) and only the timings differ. A changed digest means the change
+# altered game behaviour, which --check always fails on. Timings depend on
+# the machine, so they are only compared with --timings and only against a
+# baseline saved on the same host.
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# (fish, casts in flight) for each tick case
+DEFAULT_CASES = ((5, 0), (50, 10), (500, 40))
+
+# Slower than baseline by more than this fraction counts as a regression
+DEFAULT_TOLERANCE = 0.30
+
+# Direction held on each tick of the 40-tick movement cycle
+MOVE_CYCLE = (['FORWARD'] * 15 + ['LEFT'] * 5 + ['FORWARD'] * 10 +
+              ['RIGHT'] * 5 + ['BACKWARD'] * 5)
+
+
+def build_game(seed, fish, engine):
+    # A fixed clock as well as a fixed seed, so power-up times match too
+    if engine == 'numpy':
+        if snake_game.FishArrays is None:
+            sys.exit('NumPy is not installed')
+        game = snake_game.NumpyGame(seed=seed, clock=lambda: 0.0)
+    else:
+        game = snake_game.Game(seed=seed, clock=lambda: 0.0)
+
+    # Every rod, plenty of tackle and a player that cannot die, so the
+    # script runs to the end
+    player = game.player
+    player.rods = list(RODS)
+    player.tackle_box = {'flies': 10 ** 6, 'spinners': 10 ** 6, 'crankbaits': 10 ** 6}
+    player.health = 10 ** 9
+    top_up_fish(game, fish)
+    return game
+
+
+def top_up_fish(game, fish):
+    missing = fish - len(game.fish)
+    if missing > 0:
+        game.spawn_fish(missing)
+
+
+def top_up_casts(game, casts, tick):
+    # Extra casts fanned out around the player on top of the scripted shots
+    missing = casts - len(game.player.casts)
+    for i in range(missing):
+        rod = RODS['basic']
+        game.create_cast(game.player.angle + (tick + i) * 0.7, rod['damage'], rod['speed'])
+
+
+def script_inputs(game, tick):
+    # What a player holding keys and shooting would send during one tick
+    direction = MOVE_CYCLE[tick % len(MOVE_CYCLE)]
+    game.queue_input(direction, 1, tick % 4 == 0)
+    if tick % 7 == 0:
+        # Mouse-look burst
+        game.queue_input('LOOK', 0.3 if tick % 14 else -0.3, False)
+    if tick % 100 == 0:
+        rods = list(RODS)
+        game.player.current_rod = rods[(tick // 100) % len(rods)]
+
+
+def drive_tick(game, tick, fish, casts):
+    script_inputs(game, tick)
+    top_up_fish(game, fish)
+    top_up_casts(game, casts, tick)
+    game.tick()
+
+
+def drive(game, ticks, fish, casts):
+    for tick in range(ticks):
+        drive_tick(game, tick, fish, casts)
+
+
+def state_digest(game):
+    state = json.dumps(game.get_state(), sort_keys=True)
+    return hashlib.md5(state.encode()).hexdigest()[:12]
+
+
+def phase_totals():
+    return {phase: timer.total for phase, timer in PHASE_TIMERS.items()}
+
+
+def run_tick_case(seed, ticks, fish, casts, engine):
+    # Untimed warm-up so the timed run starts from a busy lake
+    game = build_game(seed, fish, engine)
+    drive(game, 20, fish, casts)
+
+    gc.collect()
+    phases_before = phase_totals()
+    blocks_before = sys.getallocatedblocks()
+    started = time.perf_counter()
+    drive(game, ticks, fish, casts)
+    elapsed = time.perf_counter() - started
+    blocks_after = sys.getallocatedblocks()
+    phases_after = phase_totals()
+
+    # Transient allocations: how far traced memory rises above where each
+    # tick started, over a short second pass. tracemalloc is too slow to
+    # leave on for the timed run.
+    alloc_ticks = min(ticks, 100)
+    transient = 0
+    tracemalloc.start()
+    for tick in range(alloc_ticks):
+        tracemalloc.reset_peak()
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        drive_tick(game, tick, fish, casts)
+        _, peak = tracemalloc.get_traced_memory()
+        transient += peak - start_bytes
+    tracemalloc.stop()
+
+    return {
+        'ticks_per_second': ticks / elapsed,
+        'tick_us': elapsed / ticks * 1e6,
+        'phase_us': {phase: (phases_after[phase] - phases_before[phase]) / ticks * 1e6
+                     for phase in phases_after},
+        'alloc_kib_per_tick': transient / alloc_ticks / 1024.0,
+        'block_growth': blocks_after - blocks_before,
+        'digest': state_digest(game)
+    }
+
+
+def run_serialize_case(seed, rounds, fish, engine):
+    game = build_game(seed, fish, engine)
+    drive(game, 20, fish, 0)
+
+    # One snapshot per tick, as clients see them: most ticks send only what
+    # the player can see, every few send everything (see interest.py)
+    json_total = binary_total = 0.0
+    json_bytes = binary_bytes = 0
+    for _ in range(rounds):
+        game.tick()
+        started = time.perf_counter()
+        json_bytes += len(game.snapshot_json())
+        json_total += time.perf_counter() - started
+        started = time.perf_counter()
+        binary_bytes += len(game.snapshot_binary())
+        binary_total += time.perf_counter() - started
+
+    # Delta frames against the previous tick, as a polling client sees them
+    ack = game.frame()['seq']
+    delta_total = 0.0
+    delta_bytes = 0
+    for _ in range(rounds):
+        game.tick()
+        started = time.perf_counter()
+        frame = game.frame(ack)
+        delta_total += time.perf_counter() - started
+        delta_bytes += len(json.dumps(frame, separators=(',', ':')))
+        ack = frame['seq']
+
+    return {
+        'json_us': json_total / rounds * 1e6,
+        'json_bytes': json_bytes // rounds,
+        'binary_us': binary_total / rounds * 1e6,
+        'binary_bytes': binary_bytes // rounds,
+        'delta_us': delta_total / rounds * 1e6,
+        'delta_bytes': delta_bytes // rounds
+    }
+
+
+def run_store_case(seed, rounds, fish, engine):
+    # What a shared session store costs per session: the write-back the
+    # owner makes about once a second, and the load and claim another
+    # worker makes to take a session over
+    game = build_game(seed, fish, engine)
+    drive(game, 20, fish, 0)
+    directory = SHM_DIR if os.path.isdir(SHM_DIR) else None
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        store = SqliteStore(os.path.join(tmp, 'sessions.db'))
+        version = store.save('bench', 0, dump_game(game))
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            version = store.save('bench', version, dump_game(game))
+        save_us = (time.perf_counter() - started) / rounds * 1e6
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            version, state = store.load('bench')
+            load_game(state)
+            version = store.claim('bench', version)
+        load_us = (time.perf_counter() - started) / rounds * 1e6
+
+        try:
+            store.save('bench', version - 1, state)
+            sys.exit('store accepted a stale write')
+        except StaleSession:
+            pass
+
+    return {'save_us': save_us, 'load_us': load_us, 'bytes': len(state)}
+
+
+def run_route_case(seed, rounds):
+    random.seed(seed)
+    client = snake_game.app.test_client()
+    client.post('/reset')
+    # The first request starts the tick loop; stop it and tick by hand so
+    # only handler time is measured
+    snake_game.ticker.stop()
+    game = snake_game.sessions.games()[0]
+    page_etag = client.get('/', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+
+    requests = (
+        ('POST /move', lambda tick: client.post('/move', json={
+            'direction': MOVE_CYCLE[tick % len(MOVE_CYCLE)], 'shoot': tick % 4 == 0})),
+        ('POST /move batch=8', lambda tick: client.post('/move', json={'inputs': [
+            {'seq': tick * 8 + i + 1, 'direction': MOVE_CYCLE[(tick * 8 + i) % len(MOVE_CYCLE)]}
+            for i in range(8)]})),
+        ('GET /game-state', lambda tick: client.get('/game-state')),
+        ('GET /game-state?delta=1', lambda tick: client.get('/game-state?delta=1&ack=%d' % (game.version - 1))),
+        ('POST /switch-rod', lambda tick: client.post('/switch-rod', json={'rod': 'basic'})),
+        ('GET / gzip', lambda tick: client.get('/', headers={'Accept-Encoding': 'gzip'})),
+        ('GET / revalidate', lambda tick: client.get('/', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': page_etag}))
+    )
+    totals = dict.fromkeys((name for name, _ in requests), 0.0)
+    for tick in range(rounds):
+        for name, send in requests:
+            started = time.perf_counter()
+            response = send(tick)
+            totals[name] += time.perf_counter() - started
+            if response.status_code not in (200, 304):
+                sys.exit('%s returned %d' % (name, response.status_code))
+        game.tick()
+        if game.game_over:
+            client.post('/reset')
+
+    return {name: total / rounds * 1e6 for name, total in totals.items()}
+
+
+def run_all(args):
+    results = {'engine': args.engine, 'seed': args.seed, 'ticks': args.ticks, 'host': platform.node(),
+               'cases': {}}
+    for fish, casts in args.cases:
+        name = 'tick fish=%d casts=%d' % (fish, casts)
+        results['cases'][name] = run_tick_case(args.seed, args.ticks, fish, casts, args.engine)
+    for fish, _ in args.cases:
+        name = 'serialize fish=%d' % fish
+        results['cases'][name] = run_serialize_case(args.seed, args.rounds, fish, args.engine)
+    for fish, _ in args.cases:
+        name = 'store fish=%d' % fish
+        results['cases'][name] = run_store_case(args.seed, args.rounds, fish, args.engine)
+    if not args.skip_routes:
+        results['cases']['routes'] = run_route_case(args.seed, args.rounds)
+    return results
+
+
+def print_report(results):
+    for name, case in results['cases'].items():
+        if name.startswith('tick'):
+            phases = ' '.join('%s=%.1f' % (phase, us) for phase, us in case['phase_us'].items())
+            print('%-26s %9.0f ticks/s %8.1f us/tick  alloc=%.1fKiB/tick  blocks%+d  digest=%s' % (
+                name, case['ticks_per_second'], case['tick_us'],
+                case['alloc_kib_per_tick'], case['block_growth'], case['digest']))
+            print('%-26s phases (us): %s' % ('', phases))
+        elif name.startswith('serialize'):
+            print('%-26s json %8.1f us %7d B   binary %8.1f us %7d B   delta %8.1f us %7d B' % (
+                name, case['json_us'], case['json_bytes'], case['binary_us'], case['binary_bytes'],
+                case['delta_us'], case['delta_bytes']))
+        elif name.startswith('store'):
+            print('%-26s save %8.1f us   load+claim %8.1f us %7d B' % (
+                name, case['save_us'], case['load_us'], case['bytes']))
+        else:
+            for route, us in case.items():
+                print('%-26s %8.1f us/request' % (route, us))
+
+
+def compare_digests(results, baseline):
+    # Returns a list of tick cases that end in a different state than the
+    # baseline; both runs must use the same engine, seed and tick count
+    settings = ('engine', 'seed', 'ticks')
+    if any(baseline.get(key) != results[key] for key in settings):
+        return ['baseline was recorded with %s; run with the same settings' % ' '.join(
+            '%s=%s' % (key, baseline.get(key)) for key in settings)]
+    mismatches = []
+    for name, case in results['cases'].items():
+        old = baseline['cases'].get(name)
+        if name.startswith('tick') and old is not None and case['digest'] != old['digest']:
+            mismatches.append('%s: digest %s (baseline %s)' % (name, case['digest'], old['digest']))
+    return mismatches
+
+
+def compare(results, baseline, tolerance):
+    # Returns a list of regressions; throughput must not drop and times
+    # must not grow by more than tolerance
+    regressions = []
+    for name, case in results['cases'].items():
+        old = baseline['cases'].get(name)
+        if old is None:
+            continue
+        checks = []
+        if name.startswith('tick'):
+            checks.append(('ticks_per_second', case['ticks_per_second'], old['ticks_per_second'], True))
+        elif name.startswith('serialize'):
+            checks.extend((metric, case[metric], old[metric], False)
+                          for metric in ('json_us', 'binary_us', 'delta_us') if metric in old)
+        elif name.startswith('store'):
+            checks.extend((metric, case[metric], old[metric], False) for metric in ('save_us', 'load_us'))
+        else:
+            checks.extend((route, us, old[route], False) for route, us in case.items() if route in old)
+
+        for metric, value, old_value, higher_is_better in checks:
+            if higher_is_better:
+                regressed = value < old_value * (1 - tolerance)
+            else:
+                regressed = value > old_value * (1 + tolerance)
+            if regressed:
+                regressions.append('%s %s: %.1f (baseline %.1f)' % (name, metric, value, old_value))
+    return regressions
+
+
+def parse_cases(text):
+    cases = []
+    for item in text.split(','):
+        fish, _, casts = item.partition(':')
+        cases.append((int(fish), int(casts or 0)))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless game loop benchmarks')
+    parser.add_argument('--ticks', type=int, default=500, help='timed ticks per case')
+    parser.add_argument('--rounds', type=int, default=200, help='serializations/requests per case')
+    parser.add_argument('--cases', type=parse_cases, default=list(DEFAULT_CASES),
+                        help='comma-separated fish:casts pairs, e.g. 5:0,50:10')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--engine', choices=('python', 'numpy'), default='python')
+    parser.add_argument('--skip-routes', action='store_true', help='leave out the Flask route case')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--check', action='store_true',
+                        help='exit 1 if a case ends in a different state than the baseline')
+    parser.add_argument('--timings', action='store_true',
+                        help='with --check, also exit 1 if slower than a baseline saved on this host')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run_all(args)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.check:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            sys.exit('no baseline at %s; run with --save first' % args.baseline)
+        failures = ['MISMATCH %s' % mismatch for mismatch in compare_digests(results, baseline)]
+        if args.timings:
+            if baseline.get('host') == results['host']:
+                failures.extend('REGRESSION %s' % regression
+                                for regression in compare(results, baseline, args.tolerance))
+            else:
+                print('note: baseline was saved on %s, not %s; timings not compared' % (
+                    baseline.get('host'), results['host']))
+        for failure in failures:
+            print(failure)
+        if failures:
+            sys.exit(1)
+        print('no %s against %s' % ('changes or regressions' if args.timings else 'changes', args.baseline))
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('saved baseline to %s' % args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; browsers all take gzip
+    brotli = None
+
+# The browser client: a small HTML shell plus one script bundle, both read
+# and compressed once at startup instead of rendered on every page load.
+#
+# The bundle is served at a URL carrying a hash of its contents, so it can
+# be cached forever; a new build gets a new URL. The shell names that URL
+# and is revalidated on every load, which costs a 304 with no body while
+# nothing has changed. Each encoding has its own strong ETag, since the
+# bytes differ.
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'client')
+SHELL_FILE = 'index.html'
+SCRIPT_FILE = 'game.js'
+
+# Where the shell says to load the bundle from
+SCRIPT_PLACEHOLDER = '{{ game_js }}'
+SCRIPT_ROUTE = '/client/'
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gz', 'identity': ''}
+
+
+class Asset:
+    def __init__(self, body, content_type, cache_control):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.version = hashlib.sha256(body).hexdigest()[:16]
+
+        # Preferred encodings first
+        self.bodies = {}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=11)
+        self.bodies['gzip'] = gzip.compress(body, 9, mtime=0)
+        self.bodies['identity'] = body
+        self.encodings = list(self.bodies)
+        self.etags = {encoding: self.version + ETAG_SUFFIXES[encoding] for encoding in self.bodies}
+
+    def stats(self):
+        return {encoding: len(body) for encoding, body in self.bodies.items()}
+
+
+class ClientBundle:
+    def __init__(self, directory=CLIENT_DIR):
+        with open(os.path.join(directory, SCRIPT_FILE), 'rb') as f:
+            self.script = Asset(f.read(), 'application/javascript; charset=utf-8', IMMUTABLE)
+        root, extension = os.path.splitext(SCRIPT_FILE)
+        self.script_name = '%s.%s%s' % (root, self.script.version, extension)
+
+        with open(os.path.join(directory, SHELL_FILE), 'rb') as f:
+            shell = f.read().replace(SCRIPT_PLACEHOLDER.encode(), (SCRIPT_ROUTE + self.script_name).encode())
+        self.shell = Asset(shell, 'text/html; charset=utf-8', REVALIDATE)
+
+    def stats(self):
+        return {'script': self.script_name, 'shell_bytes': self.shell.stats(),
+                'script_bytes': self.script.stats()}
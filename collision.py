@@ -0,0 +1,196 @@
+import math
+from collections import deque
+
+
+class CollisionMap:
+    # A level grid compiled once into a flat occupancy bitmap (1 = wall)
+    # plus a clearance field: for each free cell, how many rings of cells
+    # around it are free. Anything outside the map counts as wall.
+    def __init__(self, grid):
+        self.height = len(grid)
+        self.width = len(grid[0])
+        width = self.width
+
+        self.blocked = bytearray(width * self.height)
+        for row, cells in enumerate(grid):
+            for col, cell in enumerate(cells):
+                if cell != 0:
+                    self.blocked[row * width + col] = 1
+
+        self.clearance = self._build_clearance()
+
+    @classmethod
+    def compiled(cls, width, height, blocked, clearance):
+        # From a bitmap and clearance field built earlier (see levels.py);
+        # any buffers indexable by cell, e.g. views of a mapped file
+        collision = cls.__new__(cls)
+        collision.width = width
+        collision.height = height
+        collision.blocked = blocked
+        collision.clearance = clearance
+        return collision
+
+    def _build_clearance(self):
+        # Multi-source BFS over 8-neighbours from every wall cell and the
+        # ring just outside the map. A free cell whose nearest wall is d
+        # steps away (Chebyshev) has d - 1 free rings around it.
+        width = self.width
+        height = self.height
+        distance = [0 if blocked else -1 for blocked in self.blocked]
+
+        # Every wall before any edge cell, so the queue stays in distance
+        # order and each cell is reached first from its nearest wall
+        frontier = deque(index for index, blocked in enumerate(self.blocked) if blocked)
+        for row in range(height):
+            for col in range(width):
+                index = row * width + col
+                if distance[index] == -1 and (row in (0, height - 1) or col in (0, width - 1)):
+                    # Next to the outside of the map
+                    distance[index] = 1
+                    frontier.append(index)
+
+        while frontier:
+            index = frontier.popleft()
+            row, col = divmod(index, width)
+            next_distance = distance[index] + 1
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    r = row + d_row
+                    c = col + d_col
+                    if 0 <= r < height and 0 <= c < width:
+                        neighbour = r * width + c
+                        if distance[neighbour] == -1:
+                            distance[neighbour] = next_distance
+                            frontier.append(neighbour)
+
+        return bytearray(min(255, max(0, d - 1)) for d in distance)
+
+    def is_free(self, x, y):
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return False
+        return not self.blocked[int(y) * self.width + int(x)]
+
+    def free_cell(self, col, row):
+        if col < 0 or row < 0 or col >= self.width or row >= self.height:
+            return False
+        return not self.blocked[row * self.width + col]
+
+    def clearance_at(self, col, row):
+        # For a cell inside the map
+        return self.clearance[row * self.width + col]
+
+    def window(self, col0, row0, cols, rows):
+        # Bitmap of a rectangle inside the map, row by row
+        width = self.width
+        blocked = self.blocked
+        return b''.join(blocked[(row0 + r) * width + col0:(row0 + r) * width + col0 + cols] for r in range(rows))
+
+    def sweep(self, x0, y0, x1, y1):
+        # Trace the segment (x0, y0) -> (x1, y1) through the grid. Returns
+        # (hit, x, y): the point where it first enters a wall, or the end
+        # point when the path is clear.
+        if not self.is_free(x0, y0):
+            return True, x0, y0
+
+        dx = x1 - x0
+        dy = y1 - y0
+        col = int(x0)
+        row = int(y0)
+
+        # Short moves well away from walls need no traversal
+        if max(abs(dx), abs(dy)) <= self.clearance_at(col, row):
+            return False, x1, y1
+
+        # Amanatides & Woo DDA: t runs from 0 at the start to 1 at the end
+        if dx > 0:
+            step_col = 1
+            t_delta_x = 1.0 / dx
+            t_max_x = (col + 1 - x0) * t_delta_x
+        elif dx < 0:
+            step_col = -1
+            t_delta_x = -1.0 / dx
+            t_max_x = (x0 - col) * t_delta_x
+        else:
+            step_col = 0
+            t_delta_x = t_max_x = math.inf
+
+        if dy > 0:
+            step_row = 1
+            t_delta_y = 1.0 / dy
+            t_max_y = (row + 1 - y0) * t_delta_y
+        elif dy < 0:
+            step_row = -1
+            t_delta_y = -1.0 / dy
+            t_max_y = (y0 - row) * t_delta_y
+        else:
+            step_row = 0
+            t_delta_y = t_max_y = math.inf
+
+        while True:
+            if t_max_x < t_max_y:
+                t = t_max_x
+                if t > 1:
+                    break
+                col += step_col
+                t_max_x += t_delta_x
+            else:
+                t = t_max_y
+                if t > 1:
+                    break
+                row += step_row
+                t_max_y += t_delta_y
+
+            if not self.free_cell(col, row):
+                return True, x0 + dx * t, y0 + dy * t
+
+        return False, x1, y1
+
+
+class ChunkedCollisionMap(CollisionMap):
+    # The same map stored as square chunks of 1 << chunk_shift cells on a
+    # side, each chunk's bitmap and then clearance field row by row, read in
+    # place from a buffer such as a mapped file (see levels.py). Only the
+    # chunks a query touches are read, so queries cost the same however big
+    # the map is.
+    def __init__(self, width, height, data, offset, chunks_x, chunk_shift, chunk_stride):
+        self.width = width
+        self.height = height
+        self.data = data
+        self.offset = offset
+        self.chunks_x = chunks_x
+        self.chunk_shift = chunk_shift
+        self.chunk_mask = (1 << chunk_shift) - 1
+        self.chunk_stride = chunk_stride
+        self.clearance_plane = 1 << (2 * chunk_shift)
+
+    def _cell(self, col, row):
+        # Byte offset of the cell in the bitmap plane
+        shift = self.chunk_shift
+        mask = self.chunk_mask
+        return (self.offset + ((row >> shift) * self.chunks_x + (col >> shift)) * self.chunk_stride +
+                ((row & mask) << shift) + (col & mask))
+
+    def is_free(self, x, y):
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return False
+        return not self.data[self._cell(int(x), int(y))]
+
+    def free_cell(self, col, row):
+        if col < 0 or row < 0 or col >= self.width or row >= self.height:
+            return False
+        return not self.data[self._cell(col, row)]
+
+    def clearance_at(self, col, row):
+        return self.data[self._cell(col, row) + self.clearance_plane]
+
+    def window(self, col0, row0, cols, rows):
+        parts = []
+        for row in range(row0, row0 + rows):
+            col = col0
+            end = col0 + cols
+            while col < end:
+                count = min(end, (col | self.chunk_mask) + 1) - col
+                start = self._cell(col, row)
+                parts.append(self.data[start:start + count])
+                col += count
+        return b''.join(parts)
@@ -0,0 +1,156 @@
+import os
+
+# Entity collections sent as created/changed/removed sets, keyed by entity id.
+# The first entry is the name on the wire, the second is where it lives in
+# the full game state.
+COLLECTIONS = (
+    ('fish', None),
+    ('power_ups', None),
+    ('pickups', None),
+    ('casts', 'player'),
+    ('explosions', 'player'),
+    ('active_power_ups', 'player')
+)
+
+# Player fields that are entity lists rather than plain values
+PLAYER_COLLECTIONS = {'casts': 'casts', 'explosions': 'explosions', 'power_ups': 'active_power_ups'}
+
+# Top-level values other than player and the collections
+GLOBALS = ('score', 'game_over')
+
+# Server-side bookkeeping that changes every tick but is never drawn, so
+# frames leave it out (the full JSON state still has it)
+SERVER_ONLY = {
+    'fish': frozenset(('state_timer', 'speed')),
+    'casts': frozenset(('distance', 'max_distance', 'speed', 'active')),
+    'pickups': frozenset(('time',))
+}
+
+# Decimal places kept for floats; also keeps jitter from counting as a change
+PRECISION = int(os.environ.get('DELTA_PRECISION', 3))
+
+
+def _compact(value):
+    if isinstance(value, float):
+        return round(value, PRECISION)
+    if isinstance(value, dict):
+        return {key: _compact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    return value
+
+
+def _index(name, entities):
+    hidden = SERVER_ONLY.get(name, ())
+    return {
+        entity['id']: {key: _compact(value) for key, value in entity.items() if key not in hidden}
+        for entity in entities
+    }
+
+
+def flatten(state):
+    # Copy a Game.get_state() result into {name: {id: entity}} form so it can
+    # be kept in the history and diffed later
+    player = state['player']
+    flat = {
+        'player': {key: _compact(value) for key, value in player.items() if key not in PLAYER_COLLECTIONS}
+    }
+    for key in GLOBALS:
+        flat[key] = state[key]
+
+    for key, name in PLAYER_COLLECTIONS.items():
+        flat[name] = _index(name, player.get(key, []))
+    for name, owner in COLLECTIONS:
+        if owner is None:
+            flat[name] = _index(name, state.get(name, []))
+    return flat
+
+
+def carry(flat, previous, hidden):
+    # Copy entities an interest view left out ({name: ids}) from the
+    # previous flattened state, so frames keep their last known values
+    # instead of deleting them
+    for name, ids in hidden.items():
+        current = flat[name]
+        before = previous[name]
+        for entity_id in ids:
+            entity = before.get(entity_id)
+            if entity is not None:
+                current[entity_id] = entity
+
+
+def keyframe(seq, flat):
+    frame = {'seq': seq, 'keyframe': True, 'player': flat['player']}
+    for key in GLOBALS:
+        frame[key] = flat[key]
+    for name, _ in COLLECTIONS:
+        frame[name] = list(flat[name].values())
+    return frame
+
+
+def diff(base_seq, base, seq, flat):
+    # Only what changed between two flattened snapshots
+    frame = {'seq': seq, 'base': base_seq}
+
+    player = {key: value for key, value in flat['player'].items() if base['player'].get(key) != value}
+    if player:
+        frame['player'] = player
+
+    for key in GLOBALS:
+        if base[key] != flat[key]:
+            frame[key] = flat[key]
+
+    for name, _ in COLLECTIONS:
+        old = base[name]
+        new = flat[name]
+        added = []
+        updated = []
+        for entity_id, entity in new.items():
+            previous = old.get(entity_id)
+            if previous is None or previous.keys() != entity.keys():
+                added.append(entity)
+            elif previous != entity:
+                change = {key: value for key, value in entity.items() if previous[key] != value}
+                change['id'] = entity_id
+                updated.append(change)
+        removed = [entity_id for entity_id in old if entity_id not in new]
+
+        if added or updated or removed:
+            change = {}
+            if added:
+                change['add'] = added
+            if updated:
+                change['upd'] = updated
+            if removed:
+                change['del'] = removed
+            frame[name] = change
+
+    return frame
+
+
+def apply(base, frame):
+    # The flattened state a frame was made from, given the one it was
+    # diffed against (or None for a keyframe); what the client does, here
+    # for tests and tools
+    if frame.get('keyframe'):
+        flat = {'player': dict(frame['player'])}
+        for key in GLOBALS:
+            flat[key] = frame[key]
+        for name, _ in COLLECTIONS:
+            flat[name] = {entity['id']: entity for entity in frame[name]}
+        return flat
+
+    flat = {'player': dict(base['player'], **frame.get('player', {}))}
+    for key in GLOBALS:
+        flat[key] = frame.get(key, base[key])
+    for name, _ in COLLECTIONS:
+        entities = dict(base[name])
+        change = frame.get(name, {})
+        for entity_id in change.get('del', ()):
+            entities.pop(entity_id, None)
+        for entity in change.get('add', ()):
+            entities[entity['id']] = entity
+        for update in change.get('upd', ()):
+            entities[update['id']] = dict(entities[update['id']], **update)
+        flat[name] = entities
+    return flat
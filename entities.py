@@ -0,0 +1,230 @@
+from itertools import zip_longest
+from operator import attrgetter
+
+from pool import EntityPool
+
+# Game entities as __slots__ classes instead of string-keyed dicts. Each
+# class lists the fields the client gets in WIRE, in wire order. OPTIONAL
+# fields are only sent when they are not None, matching the dicts that used
+# to leave those keys out, and NESTED fields hold lists of entities.
+
+
+def _compile_to_wire(cls):
+    # Build to_wire() from source once per class, the way dataclasses build
+    # __init__, so each call is a single dict display with no loops
+    lines = ['def to_wire(self):', '    wire = {']
+    for name in cls.WIRE:
+        if name in cls.NESTED:
+            lines.append('        %r: [item.to_wire() for item in self.%s],' % (name, name))
+        else:
+            lines.append('        %r: self.%s,' % (name, name))
+    lines.append('    }')
+    for name in cls.OPTIONAL:
+        lines.append('    if self.%s is not None:' % name)
+        lines.append('        wire[%r] = self.%s' % (name, name))
+    lines.append('    return wire')
+
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    to_wire = namespace['to_wire']
+    to_wire.__qualname__ = '%s.to_wire' % cls.__name__
+    return to_wire
+
+
+class Entity:
+    __slots__ = ()
+    WIRE = ()
+    OPTIONAL = ()
+    NESTED = ()
+    FIELDS = ()  # every slot, base classes first
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = cls.FIELDS + cls.__dict__.get('__slots__', ())
+        cls.to_wire = _compile_to_wire(cls)
+        cls._field_values = attrgetter(*cls.FIELDS)
+
+    def to_wire(self):
+        return {}
+
+    # Pickled as a plain tuple of slot values when a session moves between
+    # workers; the default slots protocol is several times slower
+    def __getstate__(self):
+        return self._field_values(self)
+
+    def __setstate__(self, state):
+        # Slots added since the session was saved come back as None
+        for name, value in zip_longest(self.FIELDS, state):
+            object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.to_wire())
+
+
+class Fish(Entity):
+    __slots__ = ('id', 'x', 'y', 'type', 'speed', 'health', 'direction', 'state', 'state_timer',
+                 'target_x', 'target_y', 'projectiles', 'ai_tick')
+    WIRE = ('id', 'x', 'y', 'type', 'speed', 'health', 'direction', 'state', 'state_timer')
+    OPTIONAL = ('target_x', 'target_y', 'projectiles')
+
+    def __init__(self, id, x, y, type, speed, health, direction, state='patrol', state_timer=0):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.type = type
+        self.speed = speed
+        self.health = health
+        self.direction = direction
+        self.state = state
+        self.state_timer = state_timer
+        # Only set by charge and projectile attacks
+        self.target_x = None
+        self.target_y = None
+        self.projectiles = None
+        # Game tick the fish last ran its AI on (see lod.py); server-side only
+        self.ai_tick = None
+
+
+class Cast(Entity):
+    __slots__ = ('id', 'x', 'y', 'angle', 'speed', 'damage', 'distance', 'max_distance', 'active',
+                 'explosion_radius')
+    WIRE = ('id', 'x', 'y', 'angle', 'speed', 'damage', 'distance', 'max_distance', 'active')
+    OPTIONAL = ('explosion_radius',)
+
+    def __init__(self, id, x, y, angle, speed, damage, max_distance, explosion_radius=None):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.angle = angle
+        self.speed = speed
+        self.damage = damage
+        self.distance = 0
+        self.max_distance = max_distance
+        self.active = True
+        self.explosion_radius = explosion_radius
+
+
+class Projectile(Entity):
+    # Fired by a projectile fish at the player (Game.fish_attack). Kept on
+    # the server only: the client shows the hit as a splash on the player.
+    __slots__ = ('id', 'x', 'y', 'angle', 'speed', 'damage', 'distance', 'max_distance')
+    WIRE = __slots__
+
+    def __init__(self, id, x, y, angle, speed, damage, max_distance):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.angle = angle
+        self.speed = speed
+        self.damage = damage
+        self.distance = 0
+        self.max_distance = max_distance
+
+
+class Explosion(Entity):
+    __slots__ = ('id', 'x', 'y', 'size', 'time', 'color')
+    WIRE = ('id', 'x', 'y', 'size', 'time')
+    OPTIONAL = ('color',)
+
+    def __init__(self, id, x, y, size, time, color=None):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.size = size
+        self.time = time
+        self.color = color
+
+
+class PowerUp(Entity):
+    # A power-up lying on the map
+    __slots__ = ('id', 'x', 'y', 'type', 'color', 'effect', 'multiplier', 'duration', 'rotation',
+                 'bob_offset')
+    WIRE = __slots__
+
+    def __init__(self, id, x, y, type, color, effect, multiplier, duration, rotation, bob_offset):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.type = type
+        self.color = color
+        self.effect = effect
+        self.multiplier = multiplier
+        self.duration = duration
+        self.rotation = rotation
+        self.bob_offset = bob_offset
+
+
+class ActivePowerUp(Entity):
+    # A collected power-up still in effect on the player
+    __slots__ = ('id', 'type', 'effect', 'multiplier', 'duration', 'start_time')
+    WIRE = __slots__
+
+    def __init__(self, id, type, effect, multiplier, duration, start_time):
+        self.id = id
+        self.type = type
+        self.effect = effect
+        self.multiplier = multiplier
+        self.duration = duration
+        self.start_time = start_time
+
+
+class Pickup(Entity):
+    __slots__ = ('id', 'type', 'x', 'y', 'time')
+    WIRE = __slots__
+
+
+class RodPickup(Pickup):
+    __slots__ = ('rod',)
+    WIRE = ('id', 'type', 'rod', 'x', 'y', 'time')
+
+    def __init__(self, id, rod, x, y, time):
+        self.id = id
+        self.type = 'rod'
+        self.rod = rod
+        self.x = x
+        self.y = y
+        self.time = time
+
+
+class TacklePickup(Pickup):
+    __slots__ = ('tackle_type', 'amount')
+    WIRE = ('id', 'type', 'tackle_type', 'amount', 'x', 'y', 'time')
+
+    def __init__(self, id, tackle_type, amount, x, y, time):
+        self.id = id
+        self.type = 'tackle'
+        self.tackle_type = tackle_type
+        self.amount = amount
+        self.x = x
+        self.y = y
+        self.time = time
+
+
+class Player(Entity):
+    __slots__ = ('x', 'y', 'angle', 'health', 'armor', 'current_rod', 'rods', 'tackle_box',
+                 'rod_cooldown', 'casts', 'explosions', 'power_ups', 'lures', 'lure_power',
+                 'lure_speed', 'casting_speed')
+    WIRE = __slots__
+    NESTED = ('casts', 'explosions', 'power_ups')
+
+    def __init__(self):
+        self.x = 2.0
+        self.y = 2.0
+        self.angle = 0.0
+        self.health = 100
+        self.armor = 0
+        self.current_rod = 'basic'
+        self.rods = ['basic']
+        self.tackle_box = {
+            'flies': 50,
+            'spinners': 0,
+            'crankbaits': 0
+        }
+        self.rod_cooldown = 0
+        self.casts = EntityPool()
+        self.explosions = EntityPool()
+        self.power_ups = EntityPool()
+        self.lures = 10  # Assuming 10 is the starting count of lures
+        self.lure_power = 1.0
+        self.lure_speed = 1.0
+        self.casting_speed = 1.0
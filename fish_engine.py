@@ -0,0 +1,431 @@
+import math
+
+import numpy as np
+
+# Struct-of-arrays fish storage for large lakes. Slot i holds the i-th live
+# fish in spawn order, so slots line up with positions in the dict list the
+# client gets from get_state().
+
+PATROL = 0
+CHASE = 1
+CHARGE = 2
+STATE_NAMES = ('patrol', 'chase', 'charge')
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+# One fish in the binary state encoding; must match wire.FISH
+WIRE_DTYPE = np.dtype([
+    ('id', '<u4'),
+    ('x', '<u4'),
+    ('y', '<u4'),
+    ('type', 'u1'),
+    ('state', 'u1'),
+    ('direction', '<u2'),
+    ('health', '<f4')
+])
+
+FIELDS = (
+    ('id', np.int64),
+    ('x', np.float64),
+    ('y', np.float64),
+    ('direction', np.float64),
+    ('speed', np.float64),
+    ('health', np.float64),
+    ('state', np.int8),
+    ('state_timer', np.int32),
+    ('type', np.int16),
+    ('target_x', np.float64),  # where a charge is headed
+    ('target_y', np.float64),
+    ('ai_tick', np.int64)  # game tick the fish last ran its AI on, -1 for never (see lod.py)
+)
+
+
+def _number(value):
+    # Keep whole numbers as ints on the wire, like the dict engine does
+    # until a fish takes fractional damage
+    return int(value) if value.is_integer() else value
+
+
+class FishArrays:
+    def __init__(self, fish_types, walls, capacity=64):
+        self.type_names = list(fish_types)
+        self.type_codes = {name: code for code, name in enumerate(self.type_names)}
+        self.attach_walls(walls)
+
+        self.count = 0
+        self.capacity = 0
+        self._grow(capacity)
+
+    def attach_walls(self, walls):
+        # Nonzero where a fish cannot be, anything outside counting as wall:
+        # rows by columns, or for a chunked level (levels.Level.wall_array)
+        # chunk row, chunk column, row and column in the chunk, the chunks
+        # past the edge of the map padded with walls
+        self.walls = walls
+        if walls.ndim == 4:
+            chunks_y, chunks_x, self.chunk_size, _ = walls.shape
+            self.rows = chunks_y * self.chunk_size
+            self.cols = chunks_x * self.chunk_size
+        else:
+            self.chunk_size = None
+            self.rows, self.cols = walls.shape
+
+    # The walls are shared by every game and can be a view of a mapped
+    # file, so they are left out of the pickle; the owner attaches them
+    # again on load
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['walls']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Fields added since the session was saved start out zero
+        for name, dtype in FIELDS:
+            if name not in state:
+                setattr(self, name, np.zeros(self.capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, capacity):
+        for name, dtype in FIELDS:
+            array = np.zeros(capacity, dtype=dtype)
+            if self.capacity:
+                array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def clear(self):
+        self.count = 0
+
+    def add(self, fish):
+        if self.count == self.capacity:
+            self._grow(self.capacity * 2)
+        slot = self.count
+        self.id[slot] = fish.id
+        self.x[slot] = fish.x
+        self.y[slot] = fish.y
+        self.direction[slot] = fish.direction
+        self.speed[slot] = fish.speed
+        self.health[slot] = fish.health
+        self.state[slot] = STATE_CODES[fish.state]
+        self.state_timer[slot] = fish.state_timer
+        self.type[slot] = self.type_codes[fish.type]
+        self.target_x[slot] = fish.target_x or 0.0
+        self.target_y[slot] = fish.target_y or 0.0
+        self.ai_tick[slot] = -1 if fish.ai_tick is None else fish.ai_tick
+        self.count += 1
+        return slot
+
+    def remove(self, slot):
+        # Shift later fish down one slot to keep spawn order
+        last = self.count - 1
+        if slot < last:
+            for name, _ in FIELDS:
+                array = getattr(self, name)
+                array[slot:last] = array[slot + 1:self.count]
+        self.count = last
+
+    def type_name(self, slot):
+        return self.type_names[self.type[slot]]
+
+    def to_dict(self, slot):
+        fish = {
+            'id': int(self.id[slot]),
+            'x': float(self.x[slot]),
+            'y': float(self.y[slot]),
+            'type': self.type_names[self.type[slot]],
+            'speed': float(self.speed[slot]),
+            'health': _number(float(self.health[slot])),
+            'direction': float(self.direction[slot]),
+            'state': STATE_NAMES[self.state[slot]],
+            'state_timer': int(self.state_timer[slot])
+        }
+        if self.state[slot] == CHARGE:
+            fish['target_x'] = float(self.target_x[slot])
+            fish['target_y'] = float(self.target_y[slot])
+        return fish
+
+    def _columns(self, slots):
+        # Live slots, or just the given ones
+        if slots is None:
+            n = self.count
+            return lambda array: array[:n]
+        return lambda array: array[slots]
+
+    def to_dicts(self, slots=None):
+        # Same dicts the Python engine keeps, built column by column
+        column = self._columns(slots)
+        type_names = self.type_names
+        fish = [
+            {
+                'id': fish_id,
+                'x': x,
+                'y': y,
+                'type': type_names[type_code],
+                'speed': speed,
+                'health': _number(health),
+                'direction': direction,
+                'state': STATE_NAMES[state],
+                'state_timer': state_timer
+            }
+            for fish_id, x, y, type_code, speed, health, direction, state, state_timer in zip(
+                column(self.id).tolist(), column(self.x).tolist(), column(self.y).tolist(),
+                column(self.type).tolist(), column(self.speed).tolist(), column(self.health).tolist(),
+                column(self.direction).tolist(), column(self.state).tolist(),
+                column(self.state_timer).tolist())
+        ]
+        # Charging fish also carry their target, as Fish objects do
+        for i in np.flatnonzero(column(self.state) == CHARGE).tolist():
+            fish[i]['target_x'] = float(column(self.target_x)[i])
+            fish[i]['target_y'] = float(column(self.target_y)[i])
+        return fish
+
+    def pack_wire(self, position_scale, angle_scale, slots=None):
+        # Returns (count, bytes) of WIRE_DTYPE records, built column by column
+        column = self._columns(slots)
+        ids = column(self.id)
+        records = np.empty(len(ids), dtype=WIRE_DTYPE)
+        records['id'] = ids
+        records['x'] = np.clip(np.rint(column(self.x) * position_scale), 0, 0xFFFFFFFF)
+        records['y'] = np.clip(np.rint(column(self.y) * position_scale), 0, 0xFFFFFFFF)
+        records['type'] = column(self.type)
+        records['state'] = column(self.state)
+        records['direction'] = np.rint(column(self.direction) * angle_scale).astype(np.int64) & 0xFFFF
+        records['health'] = column(self.health)
+        return len(records), records.tobytes()
+
+    def in_view(self, x, y, angle, radius, cos_half_fov, near):
+        # Interest test (see interest.py) without the wall check: returns
+        # (near, cone), the slots within near and the slots further out but
+        # inside the view cone, which still need a line-of-sight test
+        n = self.count
+        dx = self.x[:n] - x
+        dy = self.y[:n] - y
+        distance_sq = dx * dx + dy * dy
+        close = distance_sq < near * near
+        ahead = dx * math.cos(angle) + dy * math.sin(angle) >= cos_half_fov * np.sqrt(distance_sq)
+        cone = ~close & (distance_sq < radius * radius) & ahead
+        return np.flatnonzero(close), np.flatnonzero(cone)
+
+    def due(self, x, y, angle, radius, cos_half_fov, near, far_ticks, tick_count):
+        # Slots whose AI runs on tick_count and the ticks each makes up (see
+        # lod.py): those in view, plus every far_ticks-th slot in turn.
+        # Marks them as having run.
+        n = self.count
+        dx = self.x[:n] - x
+        dy = self.y[:n] - y
+        distance_sq = dx * dx + dy * dy
+        due = (distance_sq < near * near) | (
+            (distance_sq < radius * radius) &
+            (dx * math.cos(angle) + dy * math.sin(angle) >= cos_half_fov * np.sqrt(distance_sq)))
+        due[tick_count % far_ticks::far_ticks] = True
+        slots = np.flatnonzero(due)
+        last = self.ai_tick[slots]
+        steps = np.where(last < 0, 1, np.clip(tick_count - last, 1, far_ticks))
+        self.ai_tick[slots] = tick_count
+        return slots, steps
+
+    def distance_sq(self, x, y):
+        n = self.count
+        dx = self.x[:n] - x
+        dy = self.y[:n] - y
+        return dx * dx + dy * dy
+
+    def first_within(self, x, y, radius):
+        # Oldest fish strictly closer than radius, or None
+        hits = np.flatnonzero(self.distance_sq(x, y) < radius * radius)
+        return int(hits[0]) if hits.size else None
+
+    def any_within(self, x, y, radius):
+        return bool(np.any(self.distance_sq(x, y) < radius * radius))
+
+    def attackers(self, x, y, radius, ranged):
+        # Slots of fish closer than radius that could start a ranged attack:
+        # of a type ranged (indexed by type code) marks, and not already
+        # charging
+        n = self.count
+        return np.flatnonzero((self.distance_sq(x, y) < radius * radius) & ranged[self.type[:n]] &
+                              (self.state[:n] != CHARGE))
+
+    def start_charge(self, slot, target_x, target_y, ticks):
+        self.state[slot] = CHARGE
+        self.state_timer[slot] = ticks
+        self.target_x[slot] = target_x
+        self.target_y[slot] = target_y
+
+    def valid_positions(self, xs, ys):
+        # Vectorized Game.is_valid_position
+        return self.free_cells(np.floor(xs), np.floor(ys))
+
+    def free_cells(self, cols, rows):
+        inside = (cols >= 0) & (rows >= 0) & (cols < self.cols) & (rows < self.rows)
+        cols = np.where(inside, cols, 0).astype(np.intp)
+        rows = np.where(inside, rows, 0).astype(np.intp)
+        size = self.chunk_size
+        if size is None:
+            return inside & (self.walls[rows, cols] == 0)
+        return inside & (self.walls[rows // size, cols // size, rows % size, cols % size] == 0)
+
+    def clear_paths(self, x0, y0, x1, y1):
+        # Vectorized CollisionMap.sweep: True where the segment from (x0, y0)
+        # to (x1, y1) starts free and never enters a wall. Only paths that
+        # leave their first cell are traced; each pass steps all of those
+        # still going into their next cell (Amanatides & Woo), so there are
+        # as many passes as cells the longest move crosses.
+        clear = self.valid_positions(x0, y0)
+        col0 = np.floor(x0)
+        row0 = np.floor(y0)
+        slots = np.flatnonzero(clear & ((np.floor(x1) != col0) | (np.floor(y1) != row0)))
+        if not slots.size:
+            return clear
+
+        x0 = x0[slots]
+        y0 = y0[slots]
+        dx = x1[slots] - x0
+        dy = y1[slots] - y0
+        col = col0[slots]
+        row = row0[slots]
+        step_col = np.sign(dx)
+        step_row = np.sign(dy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_delta_x = np.where(dx != 0, 1 / np.abs(dx), np.inf)
+            t_delta_y = np.where(dy != 0, 1 / np.abs(dy), np.inf)
+            t_max_x = np.where(dx > 0, (col + 1 - x0) * t_delta_x,
+                               np.where(dx < 0, (x0 - col) * t_delta_x, np.inf))
+            t_max_y = np.where(dy > 0, (row + 1 - y0) * t_delta_y,
+                               np.where(dy < 0, (y0 - row) * t_delta_y, np.inf))
+
+        going = np.ones(slots.size, dtype=bool)
+        while True:
+            across = t_max_x < t_max_y
+            going &= np.where(across, t_max_x, t_max_y) <= 1
+            if not going.any():
+                return clear
+            across_x = going & across
+            across_y = going & ~across
+            col[across_x] += step_col[across_x]
+            t_max_x[across_x] += t_delta_x[across_x]
+            row[across_y] += step_row[across_y]
+            t_max_y[across_y] += t_delta_y[across_y]
+            hit = going & ~self.free_cells(col, row)
+            clear[slots[hit]] = False
+            going &= ~hit
+
+    def step(self, player_x, player_y, rng, flow=None, sight=None, slots=None, steps=1):
+        # The patrol/chase state machine and movement for the fish in slots
+        # (every fish by default), each making up steps ticks (one number,
+        # or one per slot; see lod.py), with chasing fish following flow
+        # (see flowfield.py) when given, and only fish that sight(xs, ys)
+        # says can see the player starting a chase. Returns the slots of
+        # fish that end up touching the player.
+        if slots is None:
+            slots = slice(0, self.count)
+        x = self.x[slots]
+        y = self.y[slots]
+        n = len(x)
+        if n == 0:
+            return np.flatnonzero(self.distance_sq(player_x, player_y) < 0.25).tolist()
+        direction = self.direction[slots]
+        state = self.state[slots]
+        timer = self.state_timer[slots]
+
+        # State changes
+        timer -= steps
+        expired = timer <= 0
+        patrolling = expired & (state == PATROL)
+        chasing = expired & (state != PATROL)  # chases and charges that are over
+
+        # 30% chance to chase the player if close enough and in sight
+        dx = x - player_x
+        dy = y - player_y
+        in_range = patrolling & (dx * dx + dy * dy < 100)
+        if sight is not None and in_range.any():
+            candidates = np.flatnonzero(in_range)
+            in_range[candidates] = sight(x[candidates].tolist(), y[candidates].tolist())
+        start_chase = in_range & (rng.random(n) < 0.3)
+        turn = patrolling & ~start_chase
+        state[start_chase] = CHASE
+        timer[start_chase] = rng.integers(50, 101, size=int(start_chase.sum()))
+        direction[turn] = rng.uniform(0, 2 * np.pi, size=int(turn.sum()))
+        timer[turn] = rng.integers(50, 151, size=int(turn.sum()))
+        state[chasing] = PATROL
+        timer[chasing] = rng.integers(50, 151, size=int(chasing.sum()))
+
+        # Patrolling fish occasionally change direction
+        patrol = state == PATROL
+        chase = state == CHASE
+        charge = state == CHARGE
+        jitter = patrol & (rng.random(n) < 1 - 0.99 ** steps)
+        direction[jitter] = rng.uniform(0, 2 * np.pi, size=int(jitter.sum()))
+
+        # Chasing fish head for the next cell on the way to the player, or
+        # the player once in the same cell, with some randomness
+        target_x = player_x
+        target_y = player_y
+        if flow is not None:
+            cols = x.astype(np.intp) - flow.col0
+            rows = y.astype(np.intp) - flow.row0
+            inside = (cols >= 0) & (rows >= 0) & (cols < flow.cols) & (rows < flow.rows)
+            cells = np.where(inside, rows * flow.cols + cols, 0)
+            next_cell = np.where(inside, np.frombuffer(flow.cells, dtype=np.intc)[cells], -1)
+            follow = next_cell >= 0
+            target_x = np.where(follow, next_cell % flow.width + 0.5, player_x)
+            target_y = np.where(follow, next_cell // flow.width + 0.5, player_y)
+        angle = np.arctan2(target_y - y, target_x - x) + rng.uniform(-0.1, 0.1, size=n)
+        direction[chase] = angle[chase]
+
+        # Slower when patrolling, faster when chasing
+        base_speed = self.speed[slots] * steps
+        speed = base_speed * np.where(patrol, 0.5, 1.2)
+
+        # Charging fish rush at where the player was when the charge started
+        if charge.any():
+            charge_dx = self.target_x[slots] - x
+            charge_dy = self.target_y[slots] - y
+            direction[charge] = np.arctan2(charge_dy, charge_dx)[charge]
+            speed[charge] = np.minimum(base_speed * 2, np.hypot(charge_dx, charge_dy))[charge]
+        new_x = x + np.cos(direction) * speed
+        new_y = y + np.sin(direction) * speed
+
+        # Move where the whole path is clear, as CollisionMap.sweep decides
+        # for the Python engine; bounce off walls back into patrol
+        valid = self.clear_paths(x, y, new_x, new_y)
+        x[valid] = new_x[valid]
+        y[valid] = new_y[valid]
+        blocked = ~valid
+        direction[blocked] += np.pi + rng.uniform(-0.5, 0.5, size=int(blocked.sum()))
+        state[blocked] = PATROL
+
+        # Slices above are views; write back what fancy indexing copied
+        if not isinstance(slots, slice):
+            self.x[slots] = x
+            self.y[slots] = y
+            self.direction[slots] = direction
+            self.state[slots] = state
+            self.state_timer[slots] = timer
+
+        return np.flatnonzero(self.distance_sq(player_x, player_y) < 0.25).tolist()
+
+
+class FishView:
+    # Read-only sequence over FishArrays so len() and indexing work without
+    # building every dict
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __len__(self):
+        return self.arrays.count
+
+    def __bool__(self):
+        return self.arrays.count > 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.arrays.count
+        if not 0 <= index < self.arrays.count:
+            raise IndexError('fish index out of range')
+        return self.arrays.to_dict(index)
+
+    def __iter__(self):
+        return iter(self.arrays.to_dicts())
@@ -0,0 +1,135 @@
+import heapq
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+# Flow fields for chasing fish. One Dijkstra pass from the player's cell
+# over the CollisionMap gives every free cell the next cell on a shortest
+# path to the player, so a chasing fish steers with one lookup instead of
+# heading straight at the player and into the nearest wall.
+#
+# A field depends only on the map and the goal cell, so fields are cached
+# by goal cell and shared by every game: one is built the first time a
+# player stands in a cell and reused until it falls out of the LRU. The
+# cost is the same however many fish are chasing.
+#
+# A field only covers the cells within FLOW_RADIUS of the goal, so building
+# one costs the same on any size of lake. Outside it a fish is too far off
+# to be chasing and just heads straight for the player.
+
+# Fields kept; each is 4 bytes per cell of its window
+FLOW_CACHE_SIZE = int(os.environ.get('FLOW_CACHE_SIZE', 256))
+
+# Cells from the goal to the edge of a field's window
+FLOW_RADIUS = int(os.environ.get('FLOW_RADIUS', 20))
+
+# Step costs: diagonals about sqrt(2) times an orthogonal step
+ORTHOGONAL_COST = 2
+DIAGONAL_COST = 3
+
+NEIGHBOURS = (
+    (-1, 0, ORTHOGONAL_COST), (1, 0, ORTHOGONAL_COST), (0, -1, ORTHOGONAL_COST), (0, 1, ORTHOGONAL_COST),
+    (-1, -1, DIAGONAL_COST), (1, -1, DIAGONAL_COST), (-1, 1, DIAGONAL_COST), (1, 1, DIAGONAL_COST)
+)
+
+
+class FlowField:
+    # Next cells for the window of cols x rows cells from (col0, row0):
+    # cells holds, for each cell in the window row by row, the map index
+    # (row * width + col) of the next cell towards the goal, or -1 in the
+    # goal cell itself, walls and cells with no path inside the window
+    __slots__ = ('col0', 'row0', 'cols', 'rows', 'width', 'cells')
+
+    def __init__(self, col0, row0, cols, rows, width, cells):
+        self.col0 = col0
+        self.row0 = row0
+        self.cols = cols
+        self.rows = rows
+        self.width = width
+        self.cells = cells
+
+    def next_cell(self, col, row):
+        # Map index of the next cell from (col, row), or -1 for none
+        col -= self.col0
+        row -= self.row0
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return self.cells[row * self.cols + col]
+        return -1
+
+
+class FlowFields:
+    def __init__(self, collision, cache_size=FLOW_CACHE_SIZE, radius=FLOW_RADIUS):
+        self.collision = collision
+        self.cache_size = cache_size
+        self.radius = radius
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.builds = 0
+
+    def toward(self, x, y):
+        # FlowField for a goal at (x, y), or None when (x, y) is not on a
+        # free cell
+        collision = self.collision
+        if not collision.is_free(x, y):
+            return None
+        goal = (int(x), int(y))
+        with self.lock:
+            field = self.cache.get(goal)
+            if field is not None:
+                self.cache.move_to_end(goal)
+                return field
+            field = self._build(*goal)
+            self.cache[goal] = field
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            self.builds += 1
+            return field
+
+    def _build(self, goal_col, goal_row):
+        # Dijkstra outwards from the goal over its window; each cell reached
+        # points back at the cell it was reached from. Diagonal steps need
+        # both orthogonal cells free, so following the field never clips a
+        # wall corner.
+        collision = self.collision
+        radius = self.radius
+        col0 = max(0, goal_col - radius)
+        row0 = max(0, goal_row - radius)
+        width = min(collision.width, goal_col + radius + 1) - col0
+        height = min(collision.height, goal_row + radius + 1) - row0
+        blocked = collision.window(col0, row0, width, height)
+        map_width = collision.width
+        size = width * height
+
+        next_cell = array('i', [-1]) * size
+        cost = [-1] * size
+        goal = (goal_row - row0) * width + goal_col - col0
+        cost[goal] = 0
+        heap = [(0, goal)]
+        while heap:
+            distance, index = heapq.heappop(heap)
+            if distance > cost[index]:
+                continue
+            row, col = divmod(index, width)
+            # Fields point at map indexes
+            target = (row0 + row) * map_width + col0 + col
+            for d_col, d_row, step in NEIGHBOURS:
+                c = col + d_col
+                r = row + d_row
+                if c < 0 or r < 0 or c >= width or r >= height:
+                    continue
+                neighbour = r * width + c
+                if blocked[neighbour]:
+                    continue
+                if d_col and d_row and (blocked[row * width + c] or blocked[r * width + col]):
+                    continue
+                new_cost = distance + step
+                if cost[neighbour] == -1 or new_cost < cost[neighbour]:
+                    cost[neighbour] = new_cost
+                    next_cell[neighbour] = target
+                    heapq.heappush(heap, (new_cost, neighbour))
+
+        return FlowField(col0, row0, width, height, map_width, next_cell)
+
+    def stats(self):
+        return {'cached': len(self.cache), 'builds': self.builds}
@@ -0,0 +1,80 @@
+import math
+import os
+
+# Interest management: each frame a client gets only the fish, power-ups
+# and pickups it could actually see -- within INTEREST_RADIUS, inside a cone
+# around where the player faces and not behind a wall -- plus anything
+# close enough to matter whichever way the player is looking. Everything
+# else rides along on every INTEREST_REFRESH_TICKS-th tick, so far-off
+# entities still reach the client, just less often.
+#
+# The refresh is keyed to tick_count rather than to when frames are built,
+# so a snapshot stays a pure function of the game state.
+
+INTEREST = os.environ.get('INTEREST', '1') != '0'
+
+# The client ray-casts walls out to 20 cells but fish are small dots well
+# before that
+INTEREST_RADIUS = float(os.environ.get('INTEREST_RADIUS', 14))
+
+# The client draws fish up to 60 degrees either side of the view direction;
+# the extra 20 covers turning between frames
+INTEREST_HALF_FOV = math.radians(float(os.environ.get('INTEREST_HALF_FOV', 80)))
+
+# Always sent: within biting or pickup range
+INTEREST_NEAR = 2.0
+
+INTEREST_REFRESH_TICKS = int(os.environ.get('INTEREST_REFRESH_TICKS', 10))
+
+
+class InterestView:
+    # What one frame sends. fish is whatever the game's fish_wire() and
+    # fish_binary() take (Fish objects or NumPy slots); hidden maps each
+    # collection name to the ids left out, so delta frames can keep
+    # showing their last known state instead of deleting them.
+    __slots__ = ('fish', 'power_ups', 'pickups', 'hidden')
+
+    def __init__(self, fish, power_ups, pickups, hidden):
+        self.fish = fish
+        self.power_ups = power_ups
+        self.pickups = pickups
+        self.hidden = hidden
+
+
+class InterestFilter:
+    def __init__(self, collision, radius=INTEREST_RADIUS, half_fov=INTEREST_HALF_FOV, near=INTEREST_NEAR):
+        self.collision = collision
+        self.radius = radius
+        self.cos_half_fov = math.cos(half_fov)
+        self.near = near
+
+    def refresh_due(self, tick_count):
+        return tick_count % INTEREST_REFRESH_TICKS == 0
+
+    def viewer(self, x, y, angle):
+        # Returns sees(ex, ey) for a player at (x, y) facing angle
+        facing_x = math.cos(angle)
+        facing_y = math.sin(angle)
+        radius_sq = self.radius * self.radius
+        near_sq = self.near * self.near
+        cos_half_fov = self.cos_half_fov
+        sweep = self.collision.sweep
+
+        def sees(ex, ey):
+            dx = ex - x
+            dy = ey - y
+            distance_sq = dx * dx + dy * dy
+            if distance_sq < near_sq:
+                return True
+            if distance_sq >= radius_sq:
+                return False
+            # Inside the cone when the angle to the facing direction is
+            # within half_fov, i.e. cos(angle) * distance >= cos(half_fov) * distance
+            if dx * facing_x + dy * facing_y < cos_half_fov * math.sqrt(distance_sq):
+                return False
+            return not sweep(x, y, ex, ey)[0]
+
+        return sees
+
+    def clear_line(self, x, y, ex, ey):
+        return not self.collision.sweep(x, y, ex, ey)[0]
@@ -0,0 +1,88 @@
+import json
+import os
+import secrets
+import time
+
+# Append-only record of everything that can change a game from outside:
+# the seed and clock epoch it started from, each input applied by a tick and
+# each direct action (/spawn-fish, /hit-fish, /switch-rod, /reset). With the
+# game's own RNG and tick-based clock that is enough to re-run a session
+# exactly; replay.py does that.
+#
+# One JSON document per line. The first line is a header object, the rest
+# are compact arrays [tick, action, *args] where tick is the game's
+# tick_count when the record was made.
+
+# Sessions write journals here when set; unset disables journalling
+JOURNAL_DIR = os.environ.get('JOURNAL_DIR')
+
+# A state digest is written every this many ticks so replays can check
+# they still match
+JOURNAL_CHECKPOINT_TICKS = int(os.environ.get('JOURNAL_CHECKPOINT_TICKS', 100))
+
+FORMAT_VERSION = 1
+
+
+class Journal:
+    def __init__(self, path, checkpoint_ticks=JOURNAL_CHECKPOINT_TICKS):
+        self.path = path
+        self.checkpoint_ticks = checkpoint_ticks
+        self.file = open(path, 'a', encoding='utf-8')
+        self.records = 0
+
+    @classmethod
+    def create(cls, directory=JOURNAL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        name = '%d-%s.jsonl' % (time.time(), secrets.token_hex(4))
+        return cls(os.path.join(directory, name))
+
+    def __getstate__(self):
+        # A session moving to another worker carries on appending to the
+        # same file (see session_store.py)
+        if not self.file.closed:
+            self.file.flush()
+        return {'path': self.path, 'checkpoint_ticks': self.checkpoint_ticks, 'records': self.records}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def _write(self, document):
+        self.file.write(json.dumps(document, separators=(',', ':')))
+        self.file.write('\n')
+        self.records += 1
+
+    def start(self, seed, engine, epoch):
+        self._write({'version': FORMAT_VERSION, 'seed': seed, 'engine': engine, 'epoch': epoch})
+        self.file.flush()
+
+    def record(self, tick, action, *args):
+        self._write([tick, action] + list(args))
+
+    def checkpoint(self, tick, digest):
+        self._write([tick, 'checkpoint', digest])
+        # Checkpoints are the natural place to make the journal durable
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_journal(path):
+    # Returns (header, records)
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError('unsupported journal version: %r' % header.get('version'))
+        records = []
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A worker killed mid-write leaves a torn last line
+                break
+        return header, records
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from collision import CollisionMap, ChunkedCollisionMap
+
+try:
+    import numpy as np
+except ImportError:  # Only the NumPy fish engine needs wall arrays
+    np = None
+
+# Levels live in LEVELS_DIR as JSON:
+#
+#   {"wall_textures": {"1": "wood", ...},
+#    "grid": ["1111", "1001", ...]}     one digit per cell, 0 = water
+#
+# named for the file, e.g. levels/lake.json is "lake". Each is compiled
+# into a binary file holding everything the server would otherwise work
+# out at startup: wall types, the occupancy bitmap, the clearance field
+# (see collision.py) and the list of free cells. Compiled files go in
+# LEVEL_CACHE_DIR named by a hash of the source, so editing a level just
+# compiles a new file, and they are memory-mapped rather than read, so
+# every worker on a host shares one read-only copy.
+#
+# The grids are stored in square chunks of CHUNK_SIZE cells, a page per
+# grid per chunk, so the cells around any point sit on a handful of pages
+# however big the lake is. Small levels are copied out into flat arrays at
+# load. Bigger ones (over FLAT_LEVEL_CELLS) are read in place: a chunk is
+# paged in the first time something looks at it, and retain() gives back
+# the pages of chunks no player or fish has been near since the last call,
+# so a worker's memory follows where people are fishing rather than the
+# size of the lake.
+#
+# "python levels.py" compiles every level ahead of a deploy.
+
+LEVELS_DIR = os.environ.get('LEVELS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels'))
+LEVEL_CACHE_DIR = os.environ.get('LEVEL_CACHE_DIR', os.path.join(LEVELS_DIR, '.compiled'))
+LEVEL = os.environ.get('LEVEL', 'lake')
+
+# Levels up to this many cells are flattened into plain arrays at load
+FLAT_LEVEL_CELLS = int(os.environ.get('FLAT_LEVEL_CELLS', 256 * 256))
+
+# 64 x 64 one-byte cells fill a 4 KiB page
+CHUNK_SHIFT = 6
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+PAGE_SIZE = 4096
+
+# Planes of a chunk, in file order
+BLOCKED, CLEARANCE, CELLS = range(3)
+PLANES = 3
+
+# Compiled layout, little-endian:
+#
+#   header      magic, format version, chunk size, width, height, bytes of
+#               texture table, number of free cells
+#   textures    wall_textures as UTF-8 JSON; header and table padded to a
+#               page
+#   chunks      chunks_x * chunks_y chunks, row by row, each the blocked,
+#               clearance and wall type planes of CHUNK_SIZE^2 bytes, row
+#               by row; cells past the edge of the map are walls
+#   free        uint32 cell index (row * width + col) of each free cell, in
+#               index order
+MAGIC = b'FLVL'
+# 3: clearance next to the map edge no longer overstated
+FORMAT_VERSION = 3
+HEADER = struct.Struct('<4sHHIIII')
+
+
+class Level:
+    def __init__(self, name, data, path=None):
+        # data is the compiled bytes or an mmap of them
+        magic, version, chunk_size, width, height, textures_size, free_count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or chunk_size != CHUNK_SIZE:
+            raise ValueError('%s is not a version %d compiled level' % (path or name, FORMAT_VERSION))
+        self.name = name
+        self.path = path
+        self.data = data
+        self.width = width
+        self.height = height
+        self.chunked = width * height > FLAT_LEVEL_CELLS
+
+        view = memoryview(data)
+        textures = json.loads(bytes(view[HEADER.size:HEADER.size + textures_size]))
+        self.wall_textures = {int(cell): texture for cell, texture in textures.items()}
+
+        self.chunks_x = (width + CHUNK_SIZE - 1) >> CHUNK_SHIFT
+        self.chunks_y = (height + CHUNK_SIZE - 1) >> CHUNK_SHIFT
+        self.chunks_offset = _padded(HEADER.size + textures_size, PAGE_SIZE)
+        self.chunk_stride = PLANES * CHUNK_SIZE * CHUNK_SIZE
+        offset = self.chunks_offset + self.chunks_x * self.chunks_y * self.chunk_stride
+        self.free_cells = view[offset:offset + 4 * free_count].cast('I')
+
+        # Row-major copies of each plane, for small levels only
+        self.flat = None if self.chunked else [self._flat_plane(plane) for plane in range(PLANES)]
+
+        # Chunks kept by the last retain()
+        self.resident = set()
+        self.released = 0
+
+    def _flat_plane(self, plane):
+        width = self.width
+        rows = []
+        for row in range(self.height):
+            chunk_row, inner_row = divmod(row, CHUNK_SIZE)
+            for chunk_col in range(self.chunks_x):
+                start = (self.chunks_offset + (chunk_row * self.chunks_x + chunk_col) * self.chunk_stride +
+                         (plane * CHUNK_SIZE + inner_row) * CHUNK_SIZE)
+                rows.append(self.data[start:start + min(CHUNK_SIZE, width - chunk_col * CHUNK_SIZE)])
+        return bytearray(b''.join(rows))
+
+    def collision_map(self):
+        if self.flat is not None:
+            return CollisionMap.compiled(self.width, self.height, self.flat[BLOCKED], self.flat[CLEARANCE])
+        return ChunkedCollisionMap(self.width, self.height, self.data, self.chunks_offset, self.chunks_x,
+                                   CHUNK_SHIFT, self.chunk_stride)
+
+    def wall_array(self):
+        # Nonzero where a fish cannot be, for fish_engine.FishArrays: rows by
+        # columns for a flat level; chunk row, chunk column, row and column
+        # in the chunk for a chunked one, viewing the mapped file in place
+        if self.flat is not None:
+            return np.frombuffer(self.flat[BLOCKED], dtype=np.uint8).reshape(self.height, self.width)
+        return np.ndarray((self.chunks_y, self.chunks_x, CHUNK_SIZE, CHUNK_SIZE), dtype=np.uint8,
+                          buffer=self.data, offset=self.chunks_offset,
+                          strides=(self.chunks_x * self.chunk_stride, self.chunk_stride, CHUNK_SIZE, 1))
+
+    def grid(self):
+        # Rows of wall types, as MAP used to be written
+        width = self.width
+        cells = self.flat[CELLS] if self.flat is not None else self._flat_plane(CELLS)
+        return [list(cells[row * width:(row + 1) * width]) for row in range(self.height)]
+
+    def to_wire(self):
+        return {
+            'name': self.name,
+            'width': self.width,
+            'height': self.height,
+            'grid': self.grid(),
+            'wall_textures': self.wall_textures
+        }
+
+    def chunks_near(self, x, y, radius):
+        col0 = max(0, int(x - radius)) >> CHUNK_SHIFT
+        col1 = min(self.width - 1, int(x + radius)) >> CHUNK_SHIFT
+        row0 = max(0, int(y - radius)) >> CHUNK_SHIFT
+        row1 = min(self.height - 1, int(y + radius)) >> CHUNK_SHIFT
+        chunks_x = self.chunks_x
+        return [row * chunks_x + col for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+
+    def retain(self, areas):
+        # Keep the chunks within any (x, y, radius) of areas and give back
+        # the pages of those kept last time that nothing is near any more;
+        # touching them again reads them back from the page cache or the
+        # file. Returns the number of chunks given back.
+        if not self.chunked:
+            return 0
+        keep = set()
+        for x, y, radius in areas:
+            keep.update(self.chunks_near(x, y, radius))
+        idle = self.resident - keep
+        if hasattr(self.data, 'madvise'):
+            for chunk in idle:
+                self.data.madvise(mmap.MADV_DONTNEED, self.chunks_offset + chunk * self.chunk_stride,
+                                  self.chunk_stride)
+        self.resident = keep
+        self.released += len(idle)
+        return len(idle)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'width': self.width,
+            'height': self.height,
+            'chunked': self.chunked,
+            'resident_chunks': len(self.resident),
+            'released_chunks': self.released
+        }
+
+
+def _padded(size, alignment):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def parse_level(source):
+    # Source JSON -> (rows of wall types, wall_textures)
+    level = json.loads(source)
+    grid = [[int(cell) for cell in row] for row in level['grid']]
+    if not grid or any(len(row) != len(grid[0]) for row in grid):
+        raise ValueError('level grid must be a non-empty rectangle')
+    return grid, {str(cell): texture for cell, texture in level.get('wall_textures', {}).items()}
+
+
+def compile_level(source):
+    grid, wall_textures = parse_level(source)
+    collision = CollisionMap(grid)
+    width = collision.width
+    height = collision.height
+
+    textures = json.dumps(wall_textures, sort_keys=True).encode('utf-8')
+    free = [index for index, blocked in enumerate(collision.blocked) if not blocked]
+    cells = bytes(cell for row in grid for cell in row)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, CHUNK_SIZE, width, height, len(textures), len(free))
+
+    # Each plane with what its cells past the edge of the map hold
+    planes = ((collision.blocked, b'\1'), (collision.clearance, b'\0'), (cells, b'\0'))
+    parts = [(header + textures).ljust(_padded(len(header) + len(textures), PAGE_SIZE), b'\0')]
+    for chunk_row in range(0, height, CHUNK_SIZE):
+        for chunk_col in range(0, width, CHUNK_SIZE):
+            count = min(CHUNK_SIZE, width - chunk_col)
+            for plane, fill in planes:
+                for row in range(chunk_row, chunk_row + CHUNK_SIZE):
+                    if row < height:
+                        start = row * width + chunk_col
+                        parts.append(bytes(plane[start:start + count]).ljust(CHUNK_SIZE, fill))
+                    else:
+                        parts.append(fill * CHUNK_SIZE)
+    parts.append(struct.pack('<%dI' % len(free), *free))
+    return b''.join(parts)
+
+
+def compiled_path(name, source, cache_dir=LEVEL_CACHE_DIR):
+    digest = hashlib.sha256(source).hexdigest()[:16]
+    return os.path.join(cache_dir, '%s-v%d-%s.bin' % (name, FORMAT_VERSION, digest))
+
+
+def compile_to_cache(name, levels_dir=LEVELS_DIR, cache_dir=LEVEL_CACHE_DIR):
+    # Returns the compiled file for level `name`, compiling it if the cache
+    # has no file for this version of the source
+    with open(os.path.join(levels_dir, name + '.json'), 'rb') as f:
+        source = f.read()
+    path = compiled_path(name, source, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written aside and renamed so a worker starting at the same moment
+        # never maps a half-written file
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            f.write(compile_level(source))
+        os.replace(temp_path, path)
+    return path
+
+
+def load_level(name=LEVEL, levels_dir=LEVELS_DIR, cache_dir=LEVEL_CACHE_DIR):
+    path = compile_to_cache(name, levels_dir, cache_dir)
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return Level(name, data, path)
+
+
+def level_names(levels_dir=LEVELS_DIR):
+    return sorted(name[:-len('.json')] for name in os.listdir(levels_dir) if name.endswith('.json'))
+
+
+def main():
+    for name in level_names():
+        started = time.perf_counter()
+        path = compile_to_cache(name)
+        print('%-20s %s  %.1f ms' % (name, os.path.relpath(path), (time.perf_counter() - started) * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
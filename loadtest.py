@@ -0,0 +1,640 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+# Load generator: N simulated players playing at once, to find out how many
+# one worker (or a set of workers) can serve.
+#
+#   python loadtest.py --clients 50                  in-process, Flask test client
+#   python loadtest.py --clients 200 --url http://127.0.0.1:5001 --pid 1234
+#   python loadtest.py --clients 200 --url http://127.0.0.1:5001,http://127.0.0.1:5002 --pid 1234 --pid 1235
+#   python loadtest.py ... --save                    ... and keep the run
+#   python loadtest.py --compare OLD.json NEW.json   compare two saved runs
+#
+# Each player is a pair of asyncio tasks doing what client/game.js does:
+# load the page, script, level and wire schema, then every 50 ms poll
+# /game-state?delta=1 on one connection and send the inputs queued since
+# the last flush to /move on another. Inputs come from held keys, mouse-look
+# bursts and shots; now and then the player switches rods, and they reset
+# the game every minute or so or when it ends.
+#
+# The report gives throughput and p50/p95/p99 latency and error rate per
+# route, plus server CPU: against --url, the CPU time of --pid and its
+# child processes (e.g. a gunicorn master and its workers) from /proc;
+# in-process, this whole process, load generator included. In-process runs
+# share one interpreter with the server, so they compare builds rather than
+# measure capacity. Saved runs go to LOADTEST_DIR as JSON.
+#
+# Several comma-separated --url instances are loaded as nginx-snake-game.conf
+# would spread them: a player's requests go to the instance their session
+# cookie hashes to, and before they have one to an instance picked per
+# connection. Give --pid once per instance to count all their CPU.
+
+LOADTEST_DIR = os.environ.get('LOADTEST_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'loadtest_runs'))
+
+SESSION_COOKIE = 'fishing_sid'
+
+# The client's poll and input flush intervals
+POLL_INTERVAL = 0.05
+FLUSH_INTERVAL = 0.05
+
+# Player behaviour, per flush interval unless noted
+DIRECTIONS = ('FORWARD', 'FORWARD', 'FORWARD', 'LEFT', 'RIGHT', 'BACKWARD', None)
+HOLD_SECONDS = (0.3, 2.0)
+LOOK_BURST_CHANCE = 0.03
+LOOK_BURST_TICKS = (5, 15)
+SHOT_CHANCE = 0.05
+ROD_SWITCH_SECONDS = (15, 30)
+RESET_SECONDS = (45, 90)
+
+REQUEST_TIMEOUT = 10.0
+
+PERCENTILES = (50, 95, 99)
+
+
+def route_name(method, path):
+    # Per-route bucket: no query string, one bucket for the hashed script
+    path = path.split('?', 1)[0]
+    if path.startswith('/client/'):
+        path = '/client/*'
+    return '%s %s' % (method, path)
+
+
+class Response:
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers  # lower-cased names
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class HttpChannel:
+    # One keep-alive HTTP/1.1 connection, used for one request at a time
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None, headers=()):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s:%d' % (self.host, self.port)]
+        lines.extend('%s: %s' % header for header in headers)
+        if body is not None:
+            lines.append('Content-Length: %d' % len(body))
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+        try:
+            return await self._read_response()
+        except BaseException:
+            self.close()
+            raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed')
+        version, status = status_line.split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            # Several Set-Cookie headers may come back; the session is all we keep
+            if name in headers and name == 'set-cookie':
+                value = headers[name] + ', ' + value
+            headers[name] = value
+
+        if 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked()
+        else:
+            body = await self.reader.read()
+            self.close()
+        if version == b'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+            self.close()
+        return Response(int(status), headers, body)
+
+    async def _read_chunked(self):
+        parts = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return b''.join(parts)
+            parts.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+class StickyChannel:
+    # One connection per instance, each request sent to the instance its
+    # session cookie hashes to
+    def __init__(self, addresses, first):
+        self.channels = [HttpChannel(host, port) for host, port in addresses]
+        self.first = first  # instance for requests before there is a cookie
+
+    async def request(self, method, path, body=None, headers=()):
+        index = self.first
+        for name, value in headers:
+            if name == 'Cookie' and value.startswith(SESSION_COOKIE + '='):
+                index = zlib.crc32(value.split('=', 1)[1].encode()) % len(self.channels)
+        return await self.channels[index].request(method, path, body, headers)
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+
+
+class HttpTransport:
+    # Running servers, e.g. python snake_game.py or gunicorn; more than one
+    # url is routed by session as the bundled nginx config does
+    def __init__(self, urls, rng=None):
+        self.addresses = []
+        for url in urls.split(','):
+            parts = urlsplit(url.strip())
+            self.addresses.append((parts.hostname or '127.0.0.1', parts.port or 80))
+        self.rng = rng or random.Random()
+
+    def channel(self):
+        if len(self.addresses) == 1:
+            return HttpChannel(*self.addresses[0])
+        return StickyChannel(self.addresses, self.rng.randrange(len(self.addresses)))
+
+    def instances(self):
+        return [HttpChannel(host, port) for host, port in self.addresses]
+
+
+class TestClientChannel:
+    def __init__(self, client, executor):
+        self.client = client
+        self.executor = executor
+
+    async def request(self, method, path, body=None, headers=()):
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self.executor, partial(
+            self.client.open, path, method=method, data=body, headers=list(headers)))
+        headers = {name.lower(): value for name, value in response.headers.items()}
+        return Response(response.status_code, headers, response.get_data())
+
+    def close(self):
+        pass
+
+
+class TestClientTransport:
+    # The app in this process; requests run on a thread pool, as the
+    # threaded dev server would run them
+    def __init__(self, threads):
+        import snake_game
+        self.app = snake_game.app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='loadtest')
+
+    def channel(self):
+        # Cookies are handled by Player, as for HttpChannel
+        return TestClientChannel(self.app.test_client(use_cookies=False), self.executor)
+
+    def instances(self):
+        return [self.channel()]
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = Counter()
+
+
+class Recorder:
+    def __init__(self):
+        self.routes = {}
+
+    def route(self, name):
+        stats = self.routes.get(name)
+        if stats is None:
+            stats = self.routes[name] = RouteStats()
+        return stats
+
+    def record(self, name, seconds, status):
+        stats = self.route(name)
+        stats.latencies.append(seconds)
+        stats.statuses[status] += 1
+        if status >= 400:
+            stats.errors += 1
+
+    def failed(self, name, error):
+        stats = self.route(name)
+        stats.errors += 1
+        stats.statuses[type(error).__name__] += 1
+
+    def summary(self, duration):
+        routes = {}
+        for name, stats in sorted(self.routes.items()):
+            latencies = sorted(stats.latencies)
+            requests = sum(stats.statuses.values())
+            entry = {
+                'requests': requests,
+                'per_second': requests / duration,
+                'errors': stats.errors,
+                'error_rate': stats.errors / requests if requests else 0.0,
+                'statuses': {str(status): count for status, count in sorted(stats.statuses.items(), key=str)}
+            }
+            for percentile in PERCENTILES:
+                entry['p%d_ms' % percentile] = percentile_of(latencies, percentile) * 1000
+            entry['max_ms'] = latencies[-1] * 1000 if latencies else 0.0
+            routes[name] = entry
+        return routes
+
+
+def percentile_of(ordered, percentile):
+    # Nearest-rank percentile of a sorted list
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * percentile // 100))
+    return ordered[int(rank) - 1]
+
+
+class Player:
+    def __init__(self, transport, recorder, rng, until):
+        self.transport = transport
+        self.recorder = recorder
+        self.rng = rng
+        self.until = until
+        self.cookie = None
+        self.accept = None
+        self.rods = ['basic']
+
+        self.seq = 0
+        self.pending = []
+        self.ack = None
+        self.game_over = False
+
+        self.held = None
+        self.hold_until = 0.0
+        self.look_ticks = 0
+        self.look_step = 0.0
+
+    async def send(self, channel, method, path, payload=None, headers=()):
+        # Returns the response, or None after an error; either way recorded
+        headers = list(headers)
+        if self.cookie is not None:
+            headers.append(('Cookie', '%s=%s' % (SESSION_COOKIE, self.cookie)))
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers.append(('Content-Type', 'application/json'))
+        name = route_name(method, path)
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(channel.request(method, path, body, headers), REQUEST_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as error:
+            channel.close()
+            self.recorder.failed(name, error)
+            return None
+        self.recorder.record(name, time.perf_counter() - started, response.status)
+        match = re.search(r'%s=([^;,\s]+)' % SESSION_COOKIE, response.headers.get('set-cookie', ''))
+        if match:
+            self.cookie = match.group(1)
+        return response
+
+    def state_headers(self):
+        return [('Accept', self.accept)] if self.accept else []
+
+    async def run(self, delay):
+        await asyncio.sleep(delay)
+        inputs = self.transport.channel()
+        polls = self.transport.channel()
+        try:
+            await self.start(inputs)
+            await asyncio.gather(self.poll(polls), self.play(inputs))
+        finally:
+            inputs.close()
+            polls.close()
+
+    async def start(self, channel):
+        # Page, script and level, as a first visit loads them
+        page = await self.send(channel, 'GET', '/', headers=[('Accept-Encoding', 'gzip')])
+        if page is not None and page.status == 200:
+            body = page.body
+            if page.headers.get('content-encoding') == 'gzip':
+                body = gzip.decompress(body)
+            match = re.search(rb'src="(/client/[^"]+)"', body)
+            if match:
+                await self.send(channel, 'GET', match.group(1).decode(), headers=[('Accept-Encoding', 'gzip')])
+        await self.send(channel, 'GET', '/level')
+        schema = await self.send(channel, 'GET', '/wire-schema')
+        if schema is not None and schema.status == 200:
+            schema = schema.json()
+            self.accept = '%s, application/json;q=0.5' % schema['content_type']
+            self.rods = schema['rods'] or self.rods
+        await self.reset(channel)
+
+    async def reset(self, channel):
+        self.pending = []
+        self.game_over = False
+        await self.send(channel, 'POST', '/reset')
+
+    async def poll(self, channel):
+        loop = asyncio.get_running_loop()
+        next_poll = loop.time()
+        while next_poll < self.until:
+            path = '/game-state?delta=1' + ('&ack=%d' % self.ack if self.ack is not None else '')
+            response = await self.send(channel, 'GET', path)
+            if response is not None and response.status == 200:
+                frame = response.json()
+                self.ack = frame.get('seq', self.ack)
+                self.game_over = frame.get('game_over', self.game_over)
+            next_poll = await wait_for_next(loop, next_poll, POLL_INTERVAL)
+
+    async def play(self, channel):
+        loop = asyncio.get_running_loop()
+        rng = self.rng
+        now = loop.time()
+        next_rod_switch = now + rng.uniform(*ROD_SWITCH_SECONDS)
+        next_reset = now + rng.uniform(*RESET_SECONDS)
+        next_flush = now
+        while next_flush < self.until:
+            now = loop.time()
+            if self.game_over or now >= next_reset:
+                await self.reset(channel)
+                next_reset = now + rng.uniform(*RESET_SECONDS)
+            if now >= next_rod_switch:
+                await self.send(channel, 'POST', '/switch-rod', {'rod': rng.choice(self.rods)},
+                                self.state_headers())
+                next_rod_switch = now + rng.uniform(*ROD_SWITCH_SECONDS)
+
+            self.queue_inputs(now)
+            if self.pending:
+                response = await self.send(channel, 'POST', '/move', {'inputs': self.pending}, self.state_headers())
+                if response is not None and response.status == 200:
+                    ack = int(response.headers.get('x-input-ack', 0))
+                    self.pending = [item for item in self.pending if item['seq'] > ack]
+            next_flush = await wait_for_next(loop, next_flush, FLUSH_INTERVAL)
+
+    def queue_inputs(self, now):
+        # One flush interval of held keys, mouse look and shots
+        rng = self.rng
+        if now >= self.hold_until:
+            self.held = rng.choice(DIRECTIONS)
+            self.hold_until = now + rng.uniform(*HOLD_SECONDS)
+        if self.held is not None:
+            self.queue({'direction': self.held, 'amount': 1})
+
+        if not self.look_ticks and rng.random() < LOOK_BURST_CHANCE:
+            self.look_ticks = rng.randint(*LOOK_BURST_TICKS)
+            self.look_step = rng.choice((-1, 1)) * rng.uniform(0.05, 0.3)
+        if self.look_ticks:
+            # A few mousemove events per interval while dragging
+            for _ in range(rng.randint(1, 3)):
+                self.queue({'direction': 'LOOK', 'amount': self.look_step})
+            self.look_ticks -= 1
+
+        if rng.random() < SHOT_CHANCE:
+            self.queue({'shoot': True})
+
+    def queue(self, item):
+        self.seq += 1
+        item['seq'] = self.seq
+        self.pending.append(item)
+
+
+async def wait_for_next(loop, scheduled, interval):
+    # Fixed-rate schedule; when a slow response makes us miss slots, skip
+    # them rather than bursting, as setInterval does
+    scheduled += interval
+    now = loop.time()
+    if scheduled < now:
+        scheduled += (now - scheduled) // interval * interval + interval
+    await asyncio.sleep(scheduled - now)
+    return scheduled
+
+
+def process_cpu_seconds(pid):
+    # User + system CPU of pid and its children, or None without /proc
+    try:
+        pids = [pid] + [int(name) for name in os.listdir('/proc') if name.isdigit() and _parent(int(name)) == pid]
+        ticks = 0
+        for each in pids:
+            fields = _stat_fields(each)
+            if fields is not None:
+                ticks += int(fields[11]) + int(fields[12])
+        return ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError):
+        return None
+
+
+def _stat_fields(pid):
+    # Fields of /proc/<pid>/stat after the command name
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            return f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+
+
+def _parent(pid):
+    fields = _stat_fields(pid)
+    return int(fields[1]) if fields is not None else None
+
+
+def server_cpu_seconds(args):
+    # None when there is no way to tell
+    if args.url:
+        if not args.pid:
+            return None
+        seconds = [process_cpu_seconds(pid) for pid in args.pid]
+        return None if None in seconds else sum(seconds)
+    return time.process_time()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def server_stats(transport):
+    # /sessions of each instance, or None if any can't be read
+    stats = []
+    for channel in transport.instances():
+        try:
+            response = await channel.request('GET', '/sessions')
+            if response.status != 200:
+                return None
+            stats.append(response.json())
+        except (OSError, ValueError):
+            return None
+        finally:
+            channel.close()
+    return stats
+
+
+async def run(args, transport):
+    recorder = Recorder()
+    loop = asyncio.get_running_loop()
+    rng = random.Random(args.seed)
+    started = loop.time()
+    until = started + args.ramp + args.duration
+
+    before = await server_stats(transport)
+    cpu_before = server_cpu_seconds(args)
+    wall_started = time.perf_counter()
+
+    # Starts spread over the ramp so the clients don't poll in lockstep
+    players = [Player(transport, recorder, random.Random(rng.random()), until) for _ in range(args.clients)]
+    await asyncio.gather(*(player.run(args.ramp * i / args.clients) for i, player in enumerate(players)))
+
+    elapsed = time.perf_counter() - wall_started
+    cpu_after = server_cpu_seconds(args)
+    after = await server_stats(transport)
+
+    routes = recorder.summary(elapsed)
+    requests = sum(route['requests'] for route in routes.values())
+    errors = sum(route['errors'] for route in routes.values())
+    result = {
+        'label': args.label,
+        'revision': git_revision(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(time.time() - elapsed)),
+        'target': args.url or 'test-client',
+        'clients': args.clients,
+        'duration': elapsed,
+        'requests': requests,
+        'per_second': requests / elapsed,
+        'errors': errors,
+        'error_rate': errors / requests if requests else 0.0,
+        'cpu': None,
+        'routes': routes
+    }
+    if cpu_before is not None and cpu_after is not None:
+        result['cpu'] = {
+            'source': ('pid %s and children' % ', '.join(map(str, args.pid)) if args.pid
+                       else 'this process (server and load generator)'),
+            'seconds': cpu_after - cpu_before,
+            'cores': (cpu_after - cpu_before) / elapsed
+        }
+    if before and after:
+        # Summed over instances, slowest last tick
+        loops = [(old.get('tick_loop', {}), new.get('tick_loop', {})) for old, new in zip(before, after)]
+        result['tick_loop'] = {
+            'ticks': sum(new.get('ticks', 0) - old.get('ticks', 0) for old, new in loops),
+            'skipped_ticks': sum(new.get('skipped_ticks', 0) - old.get('skipped_ticks', 0) for old, new in loops),
+            'last_tick_seconds': max(new.get('last_tick_seconds') or 0 for old, new in loops),
+            'last_tick_games': sum(new.get('last_tick_games') or 0 for old, new in loops)
+        }
+    return result
+
+
+def print_report(result):
+    print('%s: %d clients for %.1f s, %d requests (%.0f/s), %d errors (%.2f%%)' % (
+        result['target'], result['clients'], result['duration'], result['requests'], result['per_second'],
+        result['errors'], result['error_rate'] * 100))
+    print('%-28s %9s %8s %9s %9s %9s %9s %7s' % ('route', 'requests', 'per s', 'p50 ms', 'p95 ms', 'p99 ms',
+                                               'max ms', 'errors'))
+    for name, route in result['routes'].items():
+        print('%-28s %9d %8.1f %9.2f %9.2f %9.2f %9.2f %6.2f%%' % (
+            name, route['requests'], route['per_second'], route['p50_ms'], route['p95_ms'], route['p99_ms'],
+            route['max_ms'], route['error_rate'] * 100))
+    cpu = result['cpu']
+    if cpu is not None:
+        print('cpu: %.1f s, %.2f cores (%s)' % (cpu['seconds'], cpu['cores'], cpu['source']))
+    ticks = result.get('tick_loop')
+    if ticks is not None:
+        print('tick loop: %d ticks, %d skipped, last tick %.2f ms for %s games' % (
+            ticks['ticks'], ticks['skipped_ticks'], (ticks['last_tick_seconds'] or 0) * 1000,
+            ticks['last_tick_games']))
+
+
+def save(result, directory=LOADTEST_DIR):
+    os.makedirs(directory, exist_ok=True)
+    name = '%s-%s-%dc.json' % (result['started'].replace(':', ''), result['label'] or result['revision'] or 'run',
+                               result['clients'])
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for run_result in (old, new):
+        print('%s  %s  %s, %d clients' % (run_result['started'], run_result['label'] or run_result['revision'],
+                                        run_result['target'], run_result['clients']))
+    print('%-28s %19s %19s %19s %15s' % ('route', 'per s', 'p95 ms', 'p99 ms', 'errors %'))
+    for name in sorted(set(old['routes']) | set(new['routes'])):
+        before = old['routes'].get(name)
+        after = new['routes'].get(name)
+        if before is None or after is None:
+            print('%-28s only in %s' % (name, 'new' if before is None else 'old'))
+            continue
+        print('%-28s %9.1f -> %7.1f %9.2f -> %7.2f %9.2f -> %7.2f %6.2f -> %6.2f' % (
+            name, before['per_second'], after['per_second'], before['p95_ms'], after['p95_ms'],
+            before['p99_ms'], after['p99_ms'], before['error_rate'] * 100, after['error_rate'] * 100))
+    if old['cpu'] and new['cpu']:
+        print('%-28s %9.2f -> %7.2f cores' % ('cpu', old['cpu']['cores'], new['cpu']['cores']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated players against the game server')
+    parser.add_argument('--clients', type=int, default=20, help='concurrent players')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of full load, after the ramp')
+    parser.add_argument('--ramp', type=float, default=2, help='seconds over which players join')
+    parser.add_argument('--url', help='server to load, e.g. http://127.0.0.1:5001, or several separated by '
+                                      'commas; default in-process')
+    parser.add_argument('--pid', type=int, action='append',
+                        help='server process to measure CPU of, with its children; once per instance')
+    parser.add_argument('--threads', type=int, default=32, help='request threads for the in-process server')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--label', help='name for the run, e.g. the build or worker count; default git revision')
+    parser.add_argument('--save', action='store_true', help='keep the run in LOADTEST_DIR')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved runs and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.pid and not args.url:
+        sys.exit('--pid only applies with --url')
+
+    transport = HttpTransport(args.url, random.Random(args.seed)) if args.url else TestClientTransport(args.threads)
+    result = asyncio.run(run(args, transport))
+    print_report(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    if args.save:
+        print('saved to %s' % save(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import math
+import os
+from operator import attrgetter
+
+from interest import INTEREST_RADIUS, INTEREST_HALF_FOV
+
+# Level of detail for fish AI. Fish the player can see -- inside the view
+# cone out to INTEREST_RADIUS -- or that are about to reach them, within
+# LOD_NEAR, run the patrol/chase state machine every tick exactly as
+# before. The rest run it every LOD_FAR_TICKS-th tick, staggered so each
+# tick takes an even share of them. Per-tick AI cost then follows the
+# number of fish in front of and right next to the player rather than the
+# number on the map.
+#
+# Neither tier is found by testing every fish. The Python engine asks its
+# spatial hash for the fish around the player and keeps the rest in
+# StaggerBuckets, one bucket per tick of the cycle, so a tick touches the
+# fish near the player and one bucket. The NumPy engine gets the near ones
+# from a batch distance and cone test over the arrays and takes every
+# LOD_FAR_TICKS-th slot as a strided slice (FishArrays.due).
+#
+# A fish that runs makes up all the ticks since it last ran (Fish.ai_tick),
+# whichever tier it is in, so a fish moving between tiers gets neither more
+# nor fewer ticks of AI than the game has had. Catch-up is capped at
+# LOD_FAR_TICKS, the longest a scheduled fish ever waits.
+#
+# Unseen fish still make the same decisions -- one inside chase range can
+# still start chasing and swim up behind the player -- just a few ticks at
+# a time. interest.py only sends them every INTEREST_REFRESH_TICKS anyway,
+# so the coarser steps never show. The cone test skips interest.py's wall
+# check: a fish behind a wall just keeps its every-tick updates, which is
+# cheaper than finding out.
+#
+# NumPy slots shift down when a fish is caught, so a fish there can change
+# stagger bucket; it then waits at most one extra cycle, and the catch-up
+# cap keeps it from jumping further than a scheduled fish would.
+
+LOD = os.environ.get('LOD', '1') != '0'
+
+# Biting range (0.5) plus well over LOD_FAR_TICKS of the fastest chase, so
+# fish close in on the player one tick at a time
+LOD_NEAR = float(os.environ.get('LOD_NEAR', 3))
+
+LOD_FAR_TICKS = int(os.environ.get('LOD_FAR_TICKS', 4))
+
+
+class StaggerBuckets:
+    # Fish by id % far_ticks; the fish whose (tick_count + id) % far_ticks
+    # is 0 are the ones due on tick_count
+    def __init__(self, far_ticks, fish=()):
+        self.buckets = [{} for _ in range(far_ticks)]
+        for each in fish:
+            self.add(each)
+
+    def add(self, fish):
+        self.buckets[fish.id % len(self.buckets)][fish.id] = fish
+
+    def remove(self, fish):
+        self.buckets[fish.id % len(self.buckets)].pop(fish.id, None)
+
+    def due(self, tick_count):
+        return self.buckets[-tick_count % len(self.buckets)].values()
+
+
+class AIScheduler:
+    def __init__(self, near=LOD_NEAR, far_ticks=LOD_FAR_TICKS, radius=INTEREST_RADIUS,
+                 half_fov=INTEREST_HALF_FOV):
+        self.near = near
+        self.far_ticks = far_ticks
+        self.radius = radius
+        self.cos_half_fov = math.cos(half_fov)
+
+    def buckets(self, fish=()):
+        return StaggerBuckets(self.far_ticks, fish)
+
+    def steps(self, last_tick, tick_count):
+        # Ticks of AI a fish that last ran on last_tick (None for never)
+        # makes up when it runs on tick_count
+        if last_tick is None:
+            return 1
+        return max(1, min(tick_count - last_tick, self.far_ticks))
+
+    def due(self, fish_index, buckets, x, y, angle, tick_count):
+        # [(fish, steps)] for the fish whose AI runs this tick, oldest first,
+        # for a player at (x, y) facing angle; marks them as having run
+        facing_x = math.cos(angle)
+        facing_y = math.sin(angle)
+        near_sq = self.near * self.near
+        cos_half_fov = self.cos_half_fov
+
+        due = {fish.id: fish for fish in buckets.due(tick_count)}
+        for fish in fish_index.query(x, y, max(self.near, self.radius)):
+            if fish.id in due:
+                continue
+            dx = fish.x - x
+            dy = fish.y - y
+            distance_sq = dx * dx + dy * dy
+            if distance_sq < near_sq or dx * facing_x + dy * facing_y >= cos_half_fov * math.sqrt(distance_sq):
+                due[fish.id] = fish
+
+        scheduled = []
+        for fish in sorted(due.values(), key=attrgetter('id')):
+            scheduled.append((fish, self.steps(fish.ai_tick, tick_count)))
+            fish.ai_tick = tick_count
+        return scheduled
+
+    def due_slots(self, arrays, x, y, angle, tick_count):
+        # The same for FishArrays: (slots, steps) arrays
+        return arrays.due(x, y, angle, self.radius, self.cos_half_fov, self.near, self.far_ticks, tick_count)
@@ -0,0 +1,255 @@
+import bisect
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+# Prometheus-style counters, gauges and histograms kept in process memory
+# and rendered in the text exposition format for /metrics.
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    inner = ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in pairs)
+    return '{' + inner + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+
+    def labels(self, *values):
+        # Look up (or create) the child for one label combination. Bind the
+        # result once at module level on hot paths.
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        for values, child in sorted(self.children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def _render_child(self, values, child):
+        return ['%s%s %s' % (self.name, _format_labels(self.labelnames, values), _format_value(child.value))]
+
+
+class _GaugeChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        # collect() is called at scrape time and returns {label values: value}
+        # (or a plain number for unlabelled gauges)
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.children[()].set(value)
+
+    def render(self):
+        if self.collect is not None:
+            collected = self.collect()
+            if not self.labelnames:
+                collected = {(): collected}
+            for values, value in collected.items():
+                if not isinstance(values, tuple):
+                    values = (values,)
+                self.labels(*values).set(value)
+        return super().render()
+
+    def _render_child(self, values, child):
+        return ['%s%s %s' % (self.name, _format_labels(self.labelnames, values), _format_value(child.value))]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'total', 'count', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.total += value
+            self.count += 1
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets) + (float('inf'),)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def _render_child(self, values, child):
+        with child.lock:
+            counts = list(child.counts)
+            total = child.total
+            count = child.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, values, ('le', _format_value(float(bound))))
+            lines.append('%s_bucket%s %d' % (self.name, labels, cumulative))
+        labels = _format_labels(self.labelnames, values)
+        lines.append('%s_sum%s %s' % (self.name, labels, repr(total)))
+        lines.append('%s_count%s %d' % (self.name, labels, count))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), collect=None):
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# Logging: handlers run on a background thread so request and tick threads
+# only pay for putting a record on a queue, and only when the level is on.
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING').upper()
+LOG_SAMPLE_EVERY = int(os.environ.get('LOG_SAMPLE_EVERY', 100))
+
+log = logging.getLogger('fishing_game')
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    global _listener
+    if _listener is not None:
+        return log
+
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(level)
+    log.propagate = False
+    return log
+
+
+class SampledLogger:
+    # Logs one in every `every` calls, for messages that fire per entity
+    # per tick. Uses a counter rather than random() so sampling never
+    # touches the game's RNG.
+    def __init__(self, logger, every=LOG_SAMPLE_EVERY):
+        self.logger = logger
+        self.every = max(1, every)
+        self.calls = 0
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        self.calls += 1
+        if self.calls % self.every == 0:
+            self.logger.log(level, msg, *args)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
@@ -0,0 +1,71 @@
+class EntityPool:
+    # Live entities of one kind packed into a list, with a map from id to
+    # position. remove() moves the last entity into the gap, so it is O(1)
+    # where list.remove() scans and shifts; the price is that the order is
+    # not kept. Game.new_id() never hands out an id twice, so an id works
+    # as a generational handle: get() on a removed entity's id returns None
+    # rather than whatever has taken its place.
+    #
+    # Iterate with reversed() to remove entities along the way: taking out
+    # the current entity only moves one that has already been visited, so
+    # no copy of the list is needed. Entities added during the loop are not
+    # visited, as with iterating over a copy.
+    __slots__ = ('items', 'positions')
+
+    def __init__(self, entities=()):
+        self.items = []
+        self.positions = {}  # id -> index into items
+        for entity in entities:
+            self.add(entity)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __reversed__(self):
+        # The list's own reverse iterator re-checks the length at each step,
+        # which is all swap-removal of the current entity needs
+        return reversed(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __contains__(self, entity):
+        return self.positions.get(entity.id) is not None
+
+    def add(self, entity):
+        self.positions[entity.id] = len(self.items)
+        self.items.append(entity)
+
+    def remove(self, entity):
+        # Returns False if the entity was not in the pool
+        index = self.positions.pop(entity.id, None)
+        if index is None:
+            return False
+        items = self.items
+        last = items.pop()
+        if last is not entity:
+            items[index] = last
+            self.positions[last.id] = index
+        return True
+
+    def get(self, entity_id):
+        index = self.positions.get(entity_id)
+        return self.items[index] if index is not None else None
+
+    def clear(self):
+        self.items.clear()
+        self.positions.clear()
+
+    # Pickled as the entity list alone; positions are rebuilt on load
+    def __getstate__(self):
+        return self.items
+
+    def __setstate__(self, items):
+        self.items = items
+        self.positions = {entity.id: index for index, entity in enumerate(items)}
+
+    def __repr__(self):
+        return 'EntityPool(%r)' % self.items
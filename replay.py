@@ -0,0 +1,111 @@
+import argparse
+import cProfile
+import pstats
+import sys
+import time
+
+import snake_game
+from journal import read_journal
+
+# Re-run a session journal (see journal.py) as fast as possible.
+#
+#   python replay.py journals/1700000000-ab12cd34.jsonl
+#   python replay.py --profile journal.jsonl    ... under cProfile
+#
+# Every checkpoint in the journal is compared with the replayed state, so a
+# change that alters game behaviour shows up as a mismatch. Exits 1 on any
+# mismatch.
+
+
+class ReplayError(Exception):
+    pass
+
+
+def make_game(header):
+    if header['engine'] == 'numpy':
+        if snake_game.FishArrays is None:
+            raise ReplayError('journal was recorded with the NumPy engine, which is not installed')
+        game_class = snake_game.NumpyGame
+    else:
+        game_class = snake_game.Game
+    # The clock is only read on reset, and journalled resets carry their own
+    # epoch, so the header epoch is all the replay ever needs
+    epoch = header['epoch']
+    return game_class(seed=header['seed'], clock=lambda: epoch)
+
+
+def replay(header, records, stop_on_mismatch=False):
+    game = make_game(header)
+    checkpoints = 0
+    mismatches = []
+
+    for record in records:
+        tick, action, args = record[0], record[1], record[2:]
+
+        # Records are stamped with tick_count, so catch up on the ticks
+        # that passed without anything to record
+        while game.tick_count < tick:
+            if game.game_over:
+                raise ReplayError('game over at tick %d but the journal continues at tick %d'
+                                  % (game.tick_count, tick))
+            game.tick()
+
+        if action == 'move':
+            game.queue_input(*args)
+        elif action == 'checkpoint':
+            checkpoints += 1
+            if game.state_digest() != args[0]:
+                mismatches.append(tick)
+                if stop_on_mismatch:
+                    break
+        elif action in game.actions:
+            game.act(action, *args)
+        else:
+            raise ReplayError('unknown journal action %r at tick %d' % (action, tick))
+
+    # Moves recorded last were applied by one more tick
+    if game.inputs:
+        game.tick()
+
+    return game, checkpoints, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a session journal')
+    parser.add_argument('journal')
+    parser.add_argument('--profile', action='store_true', help='run under cProfile and print the top functions')
+    parser.add_argument('--top', type=int, default=25, help='functions to show with --profile')
+    parser.add_argument('--stop', action='store_true', help='stop at the first checkpoint mismatch')
+    args = parser.parse_args()
+
+    header, records = read_journal(args.journal)
+
+    profiler = cProfile.Profile() if args.profile else None
+    started = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        game, checkpoints, mismatches = replay(header, records, args.stop)
+    except ReplayError as e:
+        sys.exit('replay failed: %s' % e)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+    elapsed = time.perf_counter() - started
+
+    print('%d records, %d ticks in %.3f s (%.0f ticks/s)' % (
+        len(records), game.tick_count, elapsed, game.tick_count / elapsed if elapsed else 0))
+    print('final score %d, digest %s' % (game.score, game.state_digest()))
+    print('%d checkpoints, %d mismatched' % (checkpoints, len(mismatches)))
+    if mismatches:
+        print('first mismatch at tick %d' % mismatches[0])
+
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.top)
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger('fishing_game.scores')
+
+# High scores shared by every worker process, in SQLite. WAL mode lets
+# readers in every worker carry on while one of them commits, and the
+# score index keeps the top-N query cheap however many rows pile up.
+#
+# Request handlers never touch the disk for a write: submit() queues the
+# score and a background thread commits whatever has queued up in one
+# transaction, so a /reset never waits on fsync.
+
+SCORES_DB = os.environ.get('SCORES_DB', 'high_scores.db')
+
+# How long the writer waits for more scores before committing a batch
+SCORES_FLUSH_INTERVAL = float(os.environ.get('SCORES_FLUSH_INTERVAL', 0.5))  # seconds
+
+# Most scores committed in one transaction
+MAX_SCORE_BATCH = 500
+
+# Tries at the last commit when stopping; nothing runs after it to take a
+# batch put back on the queue
+STOP_COMMIT_ATTEMPTS = 3
+
+# Scores shown by /high-scores
+TOP_SCORES = 10
+
+# Rows kept after each commit; enough history for any leaderboard we show
+KEEP_SCORES = 1000
+
+# Scores from before the store, imported once into an empty table
+LEGACY_FILE = 'high_scores.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC, id);
+"""
+
+
+class ScoreStore:
+    def __init__(self, path=SCORES_DB, flush_interval=SCORES_FLUSH_INTERVAL, legacy_file=LEGACY_FILE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.local = threading.local()  # one read connection per thread
+
+        # Queued but not yet committed, so this worker's own scores show up
+        # on the leaderboard straight away
+        self.pending = []
+        self.pending_lock = threading.Lock()
+
+        # Counters for /sessions
+        self.committed = 0
+        self.batches = 0
+        self.last_batch_seconds = 0.0
+
+        self._create(legacy_file)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # Durable at each checkpoint rather than each commit; a crash can
+        # lose the last batch but never corrupts the database
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _create(self, legacy_file):
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+            if legacy_file and os.path.exists(legacy_file):
+                # BEGIN IMMEDIATE so only the first worker to start imports
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    if connection.execute('SELECT 1 FROM scores LIMIT 1').fetchone() is None:
+                        connection.executemany('INSERT INTO scores (score, date) VALUES (?, ?)',
+                                               read_legacy_scores(legacy_file))
+                    connection.execute('COMMIT')
+                except Exception:
+                    connection.execute('ROLLBACK')
+                    raise
+        finally:
+            connection.close()
+
+    def _reader(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self._connect()
+        return connection
+
+    def start(self):
+        # Safe to call on every submit; only the first call starts the thread
+        if self.thread is not None:
+            return
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='score-writer', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        # Commit everything queued so far, then stop the writer; scores that
+        # still cannot be written are logged
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, score):
+        entry = (score, time.strftime('%Y-%m-%d %H:%M:%S'))
+        with self.pending_lock:
+            self.pending.append(entry)
+        self.queue.put(entry)
+        self.start()
+
+    def run(self):
+        connection = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                batch = [self.queue.get()]
+                # Give other scores a moment to join this commit
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < MAX_SCORE_BATCH:
+                    try:
+                        batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    # Everything still queued, including any failed batch
+                    # put back behind the stop marker, goes in the last commit
+                    stopping = True
+                    batch = [entry for entry in batch + self._drain() if entry is not None]
+                    if batch:
+                        self._commit_on_stop(connection, batch)
+                elif not self._commit(connection, batch):
+                    # Put the batch back for the next commit rather than lose it
+                    for entry in batch:
+                        self.queue.put(entry)
+                    time.sleep(self.flush_interval)
+        finally:
+            connection.close()
+
+    def _drain(self):
+        entries = []
+        while True:
+            try:
+                entries.append(self.queue.get_nowait())
+            except queue.Empty:
+                return entries
+
+    def _commit_on_stop(self, connection, batch):
+        for attempt in range(STOP_COMMIT_ATTEMPTS):
+            if attempt:
+                time.sleep(self.flush_interval)
+            if self._commit(connection, batch):
+                return
+        log.error("Gave up on %d high scores at shutdown: %s", len(batch),
+                  ', '.join('%s (%s)' % entry for entry in batch))
+
+    def _commit(self, connection, batch):
+        # Returns whether the batch was written
+        started = time.monotonic()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany('INSERT INTO scores (score, date) VALUES (?, ?)', batch)
+            connection.execute(
+                'DELETE FROM scores WHERE id NOT IN '
+                '(SELECT id FROM scores ORDER BY score DESC, id LIMIT ?)', (KEEP_SCORES,))
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            log.exception("Committing %d high scores failed", len(batch))
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            return False
+
+        with self.pending_lock:
+            for entry in batch:
+                self.pending.remove(entry)
+        self.committed += len(batch)
+        self.batches += 1
+        self.last_batch_seconds = time.monotonic() - started
+        return True
+
+    def top(self, limit=TOP_SCORES):
+        rows = self._reader().execute(
+            'SELECT score, date FROM scores ORDER BY score DESC, id LIMIT ?', (limit,)).fetchall()
+        with self.pending_lock:
+            if self.pending:
+                rows = sorted(rows + self.pending, key=lambda row: row[0], reverse=True)[:limit]
+        return [{'score': score, 'date': date} for score, date in rows]
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'committed': self.committed,
+            'batches': self.batches,
+            'last_batch_seconds': self.last_batch_seconds
+        }
+
+
+def read_legacy_scores(path):
+    try:
+        with open(path) as f:
+            scores = json.load(f)['scores']
+    except (OSError, ValueError, KeyError):
+        return []
+    return [(entry['score'], entry['date']) for entry in scores]
@@ -0,0 +1,231 @@
+import os
+import pickle
+import sqlite3
+import stat
+import threading
+import time
+
+# Where sessions live so that more than one worker process can serve them.
+#
+#   SESSION_STORE=memory   games never leave the worker that created them
+#                          (the default; right for a single worker)
+#   SESSION_STORE=shm      SQLite in SESSION_STORE_DIR, a private directory
+#                          on tmpfs, shared by workers on one host without
+#                          touching the disk
+#   SESSION_STORE=sqlite   SQLite at SESSION_STORE_PATH, which also keeps
+#                          sessions across restarts
+#
+# A worker that gets a request for a session it does not hold loads the
+# game from the store and claims it by writing it back. Every write names
+# the version it read, so once another worker has claimed a session the old
+# owner's next write fails with StaleSession and it lets its copy go. The
+# owner writes changed games back every SESSION_SAVE_INTERVAL, so a session
+# that moves between workers loses up to that much play.
+#
+# That makes moving a session a failover, not a way to balance load: every
+# request for it must go to the same worker, which keeps ticking it. Behind
+# a proxy that spreads one player's requests over several workers, each
+# request reloads a copy up to SESSION_SAVE_INTERVAL old and play never
+# gets anywhere. Run a single worker per instance and route each session
+# cookie to one instance, as snake-game@.service and nginx-snake-game.conf
+# do; a shared store then carries sessions over when an instance restarts
+# or the proxy moves a cookie.
+#
+# Games are pickled, so whoever can write the store can run code in the
+# server. SqliteStore refuses a database whose directory is not owned by
+# the server's user (or root) or is writable by anyone else, or whose files
+# belong to another user; the shm store lives in a 0700 directory of its
+# own rather than in /dev/shm itself. Under systemd that is the unit's
+# RuntimeDirectory (see snake-game@.service).
+
+SESSION_STORE = os.environ.get('SESSION_STORE', 'memory')
+SESSION_STORE_PATH = os.environ.get('SESSION_STORE_PATH', 'sessions.db')
+SHM_DIR = '/dev/shm'
+SESSION_STORE_DIR = (os.environ.get('SESSION_STORE_DIR') or
+                     os.environ.get('RUNTIME_DIRECTORY', '').split(':')[0] or
+                     os.path.join(SHM_DIR, 'fishing-game-%d' % os.getuid()))
+
+# Seconds between write-backs of a game that keeps changing
+SESSION_SAVE_INTERVAL = float(os.environ.get('SESSION_SAVE_INTERVAL', 1.0))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    state BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_updated ON sessions (updated);
+"""
+
+
+class StaleSession(Exception):
+    # Another worker has written a newer version of the session
+    pass
+
+
+def check_private(path):
+    # Raises PermissionError unless only this user (or root) can have put
+    # the database at path there
+    directory = os.path.dirname(os.path.abspath(path))
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError('session store directory %s is not a directory' % directory)
+    if info.st_uid not in (os.getuid(), 0):
+        raise PermissionError('session store directory %s is owned by uid %d' % (directory, info.st_uid))
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError('session store directory %s is writable by other users (mode %o)' % (
+            directory, stat.S_IMODE(info.st_mode)))
+    for name in (path, path + '-wal', path + '-shm'):
+        try:
+            info = os.lstat(name)
+        except FileNotFoundError:
+            continue
+        if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError('session store file %s is not a file of this user' % name)
+
+
+def dump_game(game):
+    # Under the game lock so the tick loop can't change it mid-pickle
+    with game.lock:
+        return pickle.dumps(game, pickle.HIGHEST_PROTOCOL)
+
+
+def load_game(state):
+    return pickle.loads(state)
+
+
+class MemoryStore:
+    # Nothing is shared: each worker keeps its own games in its registry
+    shared = False
+    backend = 'memory'
+
+    def load(self, sid):
+        return None
+
+    def version(self, sid):
+        return None
+
+    def save(self, sid, version, state):
+        return version + 1
+
+    def claim(self, sid, version):
+        return version + 1
+
+    def delete(self, sid, version):
+        pass
+
+    def expire(self, ttl):
+        return 0
+
+    def stats(self):
+        return {'backend': self.backend}
+
+
+class SqliteStore:
+    shared = True
+
+    def __init__(self, path, backend='sqlite'):
+        self.path = path
+        self.backend = backend
+        self.local = threading.local()  # one connection per thread
+
+        # Counters for /sessions
+        self.loads = 0
+        self.saves = 0
+        self.conflicts = 0
+        self.saved_bytes = 0
+
+        check_private(path)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    def load(self, sid):
+        # Returns (version, state) or None
+        row = self._connection().execute(
+            'SELECT version, state FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        if row is not None:
+            self.loads += 1
+        return row
+
+    def version(self, sid):
+        row = self._connection().execute(
+            'SELECT version FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        return row[0] if row is not None else None
+
+    def save(self, sid, version, state):
+        # Write state over `version` and return the new version; version 0
+        # creates the session. Raises StaleSession if the stored version
+        # has moved on.
+        connection = self._connection()
+        now = time.time()
+        if version == 0:
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO sessions (sid, version, updated, state) VALUES (?, 1, ?, ?)',
+                (sid, now, state))
+        else:
+            cursor = connection.execute(
+                'UPDATE sessions SET version = version + 1, updated = ?, state = ? '
+                'WHERE sid = ? AND version = ?', (now, state, sid, version))
+            if cursor.rowcount == 0 and self.version(sid) is None:
+                # Expired from the store while this worker still held it
+                cursor = connection.execute(
+                    'INSERT OR IGNORE INTO sessions (sid, version, updated, state) VALUES (?, ?, ?, ?)',
+                    (sid, version + 1, now, state))
+        if cursor.rowcount == 0:
+            self.conflicts += 1
+            raise StaleSession(sid)
+        self.saves += 1
+        self.saved_bytes += len(state)
+        return version + 1
+
+    def claim(self, sid, version):
+        # Take over a session loaded at `version` without rewriting it;
+        # returns the new version or raises StaleSession
+        cursor = self._connection().execute(
+            'UPDATE sessions SET version = version + 1, updated = ? WHERE sid = ? AND version = ?',
+            (time.time(), sid, version))
+        if cursor.rowcount == 0:
+            self.conflicts += 1
+            raise StaleSession(sid)
+        return version + 1
+
+    def delete(self, sid, version):
+        # Only if nobody has claimed it since
+        self._connection().execute('DELETE FROM sessions WHERE sid = ? AND version = ?', (sid, version))
+
+    def expire(self, ttl):
+        # Sessions no worker has written for ttl seconds, e.g. after a crash
+        cursor = self._connection().execute(
+            'DELETE FROM sessions WHERE updated < ?', (time.time() - ttl,))
+        return cursor.rowcount
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'path': self.path,
+            'loads': self.loads,
+            'saves': self.saves,
+            'conflicts': self.conflicts,
+            'saved_bytes': self.saved_bytes
+        }
+
+
+def make_store(kind=SESSION_STORE, path=SESSION_STORE_PATH):
+    if kind == 'memory':
+        return MemoryStore()
+    if kind == 'shm':
+        os.makedirs(SESSION_STORE_DIR, mode=0o700, exist_ok=True)
+        return SqliteStore(os.path.join(SESSION_STORE_DIR, os.path.basename(path)), 'shm')
+    if kind == 'sqlite':
+        return SqliteStore(path)
+    raise ValueError('unknown SESSION_STORE %r; expected memory, shm or sqlite' % kind)
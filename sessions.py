@@ -0,0 +1,278 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from session_store import (MemoryStore, StaleSession, dump_game, load_game,
+                           SESSION_SAVE_INTERVAL)
+
+# Cookie that ties a browser to its own Game
+SESSION_COOKIE = 'fishing_sid'
+
+# Limits for one worker process (override with environment variables)
+MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', 500))
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 15 * 60))  # seconds idle before eviction
+MAX_SESSION_BYTES = int(os.environ.get('MAX_SESSION_BYTES', 64 * 1024 * 1024))
+
+# Rough memory cost of a game, used for the byte cap. GAME_BASE_BYTES was
+# measured with sys.getsizeof on a fresh game; a slotted fish with its
+# spatial-hash entry traces at about 370 bytes, and ENTITY_BYTES leaves
+# headroom for the snapshot dicts built from it.
+GAME_BASE_BYTES = 6 * 1024
+ENTITY_BYTES = 650
+
+
+def estimate_game_bytes(game):
+    player = game.player
+    entities = (
+        len(game.fish) +
+        len(game.power_ups) +
+        len(game.pickups) +
+        len(player.casts) +
+        len(player.explosions) +
+        len(player.power_ups)
+    )
+    return GAME_BASE_BYTES + entities * ENTITY_BYTES
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+class Session:
+    __slots__ = ('sid', 'game', 'last_seen', 'size', 'version', 'saved_version', 'saved_at')
+
+    def __init__(self, sid, game, now, version=0):
+        self.sid = sid
+        self.game = game
+        self.last_seen = now
+        self.size = estimate_game_bytes(game)
+        # Store version this copy of the game descends from, and the game's
+        # own version when it was last written back
+        self.version = version
+        self.saved_version = game.version
+        self.saved_at = now
+
+
+class SessionRegistry:
+    def __init__(self, factory, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL,
+                 max_bytes=MAX_SESSION_BYTES, clock=time.monotonic, on_drop=None, store=None,
+                 save_interval=SESSION_SAVE_INTERVAL):
+        self.factory = factory
+        self.on_drop = on_drop  # called with each game that leaves the registry
+        # Shared stores let any worker serve any session (see session_store.py)
+        self.store = store if store is not None else MemoryStore()
+        self.save_interval = save_interval
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+
+        # Ordered from least to most recently used
+        self.sessions = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.RLock()
+
+        self.created = 0
+        self.loaded = 0
+        # 'moved' counts sessions another worker claimed from this one
+        self.evictions = {'ttl': 0, 'capacity': 0, 'memory': 0, 'moved': 0}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, sid):
+        # Return (sid, game, created) for a session id, creating a new game
+        # when the id is unknown or has been evicted. With a shared store an
+        # id this worker doesn't hold is loaded from the store first.
+        with self.lock:
+            now = self.clock()
+            self._evict_expired(now)
+
+            session = self.sessions.get(sid) if sid else None
+            if session is not None and self.store.shared:
+                stored = self.store.version(sid)
+                if stored is not None and stored != session.version:
+                    # Another worker has played it since; take its copy
+                    self._remove(sid, 'moved')
+                    session = None
+            if session is None and sid and self.store.shared:
+                session = self._load(sid, now)
+
+            created = session is None
+            if created:
+                sid = new_session_id()
+                session = self._create(sid, now)
+            else:
+                session.last_seen = now
+                self.sessions.move_to_end(sid)
+
+            self._resize(session)
+            self._evict_for_memory(keep=sid)
+            return sid, session.game, created
+
+    def keep_alive(self, sid):
+        # Mark a session as used without a request; False if it was evicted
+        with self.lock:
+            session = self.sessions.get(sid)
+            if session is None:
+                return False
+            session.last_seen = self.clock()
+            self.sessions.move_to_end(sid)
+            return True
+
+    def touch(self, sid):
+        # Re-measure a session after its game changed size
+        with self.lock:
+            session = self.sessions.get(sid)
+            if session is not None:
+                self._resize(session)
+                self._evict_for_memory(keep=sid)
+
+    def drop(self, sid):
+        with self.lock:
+            session = self.sessions.pop(sid, None)
+            if session is not None:
+                self.total_bytes -= session.size
+                self.store.delete(sid, session.version)
+                self._dropped(session)
+
+    def games(self):
+        with self.lock:
+            return [session.game for session in self.sessions.values()]
+
+    def active_games(self, window):
+        # Games seen within the last `window` seconds, newest first
+        with self.lock:
+            cutoff = self.clock() - window
+            active = []
+            for session in reversed(self.sessions.values()):
+                if session.last_seen < cutoff:
+                    break
+                active.append(session.game)
+            return active
+
+    def sweep(self):
+        with self.lock:
+            self._evict_expired(self.clock())
+        if self.store.shared:
+            self.store.expire(self.ttl)
+            self.sync()
+
+    def sync(self, force=False):
+        # Write games that changed back to a shared store, at most once per
+        # save_interval each unless forced. Pickling happens outside the
+        # registry lock so requests aren't held up behind it.
+        if not self.store.shared:
+            return
+        now = self.clock()
+        with self.lock:
+            due = [session for session in self.sessions.values()
+                   if session.game.version != session.saved_version and
+                   (force or now - session.saved_at >= self.save_interval)]
+
+        for session in due:
+            game_version = session.game.version
+            state = dump_game(session.game)
+            with self.lock:
+                if self.sessions.get(session.sid) is not session:
+                    continue
+                try:
+                    session.version = self.store.save(session.sid, session.version, state)
+                except StaleSession:
+                    self._remove(session.sid, 'moved')
+                    continue
+                session.saved_version = game_version
+                session.saved_at = now
+
+    def stats(self):
+        with self.lock:
+            return {
+                'live_sessions': len(self.sessions),
+                'max_sessions': self.max_sessions,
+                'estimated_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'created': self.created,
+                'loaded': self.loaded,
+                'evictions': dict(self.evictions),
+                'store': self.store.stats()
+            }
+
+    def _create(self, sid, now):
+        # Make room before building the new game
+        while len(self.sessions) >= self.max_sessions:
+            self._evict_oldest('capacity')
+
+        session = Session(sid, self.factory(), now)
+        if self.store.shared:
+            session.version = self.store.save(sid, 0, dump_game(session.game))
+        self.sessions[sid] = session
+        self.total_bytes += session.size
+        self.created += 1
+        return session
+
+    def _load(self, sid, now):
+        # Claim a session from the shared store, or None if it isn't there.
+        # Claiming bumps its version so the worker that had it lets go.
+        for _ in range(3):
+            row = self.store.load(sid)
+            if row is None:
+                return None
+            version, state = row
+            try:
+                version = self.store.claim(sid, version)
+            except StaleSession:
+                continue  # claimed or saved by someone else meanwhile; read it again
+            while len(self.sessions) >= self.max_sessions:
+                self._evict_oldest('capacity')
+            session = Session(sid, load_game(state), now, version)
+            self.sessions[sid] = session
+            self.total_bytes += session.size
+            self.loaded += 1
+            return session
+        return None
+
+    def _resize(self, session):
+        size = estimate_game_bytes(session.game)
+        self.total_bytes += size - session.size
+        session.size = size
+
+    def _evict_expired(self, now):
+        # Oldest sessions come first, so stop at the first live one
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_seen < self.ttl:
+                break
+            self._evict_oldest('ttl')
+
+    def _evict_for_memory(self, keep):
+        while self.total_bytes > self.max_bytes and len(self.sessions) > 1:
+            oldest = next(iter(self.sessions))
+            if oldest == keep:
+                break
+            self._evict_oldest('memory')
+
+    def _evict_oldest(self, reason):
+        self._remove(next(iter(self.sessions)), reason)
+
+    def _remove(self, sid, reason):
+        session = self.sessions.pop(sid)
+        self.total_bytes -= session.size
+        self.evictions[reason] += 1
+        if self.store.shared:
+            if reason == 'ttl':
+                self.store.delete(sid, session.version)
+            elif reason != 'moved':
+                # Pushed out to make room; keep it in the store so this or
+                # another worker can pick it up again
+                try:
+                    self.store.save(sid, session.version, dump_game(session.game))
+                except StaleSession:
+                    pass
+        self._dropped(session)
+
+    def _dropped(self, session):
+        if self.on_drop is not None:
+            self.on_drop(session.game)
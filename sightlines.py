@@ -0,0 +1,143 @@
+import os
+
+try:
+    import numpy as np
+except ImportError:  # Misses are traced one at a time without it
+    np = None
+
+# Line of sight between fish and the player for fish AI: whether a fish
+# can see the player decides if it starts a chase or attacks at range.
+#
+# A line runs from the centre of the fish's cell to the centre of the
+# player's cell and is traced with the same grid DDA as
+# CollisionMap.sweep(). Walls never move, so the answer for a pair of
+# cells never changes: results are cached by (fish cell, player cell),
+# shared by every game, and only traced again once a fish or the player
+# moves to another cell. Each call takes a whole tick's fish at once and
+# traces every miss together as one NumPy batch, so the cost follows the
+# number of fish that changed cell rather than the number asking.
+
+# Cached cell pairs; the cache starts over once it holds this many
+SIGHT_CACHE_SIZE = int(os.environ.get('SIGHT_CACHE_SIZE', 1 << 16))
+
+# Fewer misses than this are traced one by one, which beats setting up
+# the arrays
+SIGHT_BATCH_MIN = 8
+
+
+class SightLines:
+    def __init__(self, collision, walls=None, cache_size=SIGHT_CACHE_SIZE):
+        # walls: the level's NumPy wall array (levels.Level.wall_array) for
+        # batch tracing, or None to trace with the collision map alone
+        self.collision = collision
+        self.walls = walls if np is not None else None
+        self.cache_size = cache_size
+        # Plain dict reads and writes are atomic, so games on different
+        # threads share it without a lock; at worst a pair is traced twice
+        self.cache = {}
+        self.hits = 0
+        self.traced = 0
+
+    def clear(self, x, y, ex, ey):
+        # Whether (ex, ey) and (x, y) can see each other
+        return self.clear_lines(x, y, (ex,), (ey,))[0]
+
+    def clear_lines(self, x, y, xs, ys):
+        # Whether each of the points (xs[i], ys[i]) can see (x, y), as a list
+        # of bools
+        width = self.collision.width
+        cells = width * self.collision.height
+        col = int(x)
+        row = int(y)
+        target = row * width + col
+        cache = self.cache
+
+        results = []
+        misses = []
+        for i, (ex, ey) in enumerate(zip(xs, ys)):
+            clear = cache.get((int(ey) * width + int(ex)) * cells + target)
+            if clear is None:
+                misses.append(i)
+            results.append(clear)
+        self.hits += len(results) - len(misses)
+        if not misses:
+            return results
+
+        from_cols = [int(xs[i]) for i in misses]
+        from_rows = [int(ys[i]) for i in misses]
+        if self.walls is not None and len(misses) >= SIGHT_BATCH_MIN:
+            traced = self._trace_batch(from_cols, from_rows, col, row)
+        else:
+            traced = [self._trace(c, r, col, row) for c, r in zip(from_cols, from_rows)]
+        self.traced += len(misses)
+
+        if len(cache) + len(misses) > self.cache_size:
+            cache.clear()
+        for i, c, r, clear in zip(misses, from_cols, from_rows, traced):
+            cache[(r * width + c) * cells + target] = clear
+            results[i] = clear
+        return results
+
+    def _trace(self, col, row, to_col, to_row):
+        # DDA from the centre of (col, row) to the centre of (to_col, to_row);
+        # False if any cell after the first is a wall
+        free_cell = self.collision.free_cell
+        dx = to_col - col
+        dy = to_row - row
+        step_col = (dx > 0) - (dx < 0)
+        step_row = (dy > 0) - (dy < 0)
+        t_delta_x = 1.0 / abs(dx) if dx else float('inf')
+        t_delta_y = 1.0 / abs(dy) if dy else float('inf')
+        t_max_x = 0.5 * t_delta_x
+        t_max_y = 0.5 * t_delta_y
+
+        while col != to_col or row != to_row:
+            if t_max_x < t_max_y:
+                col += step_col
+                t_max_x += t_delta_x
+            else:
+                row += step_row
+                t_max_y += t_delta_y
+            if not free_cell(col, row):
+                return False
+        return True
+
+    def _trace_batch(self, cols, rows, to_col, to_row):
+        # _trace() for many starting cells at once, all lines stepping
+        # together one cell per round until they arrive or hit a wall
+        col = np.array(cols, dtype=np.intp)
+        row = np.array(rows, dtype=np.intp)
+        dx = to_col - col
+        dy = to_row - row
+        step_col = np.sign(dx)
+        step_row = np.sign(dy)
+        with np.errstate(divide='ignore'):
+            t_delta_x = 1.0 / np.abs(dx)
+            t_delta_y = 1.0 / np.abs(dy)
+        t_max_x = 0.5 * t_delta_x
+        t_max_y = 0.5 * t_delta_y
+
+        clear = np.ones(len(col), dtype=bool)
+        moving = (dx != 0) | (dy != 0)
+        while moving.any():
+            across = moving & (t_max_x < t_max_y)
+            down = moving & ~across
+            col += np.where(across, step_col, 0)
+            row += np.where(down, step_row, 0)
+            t_max_x = np.where(across, t_max_x + t_delta_x, t_max_x)
+            t_max_y = np.where(down, t_max_y + t_delta_y, t_max_y)
+            hit = moving & self._walls_at(row, col)
+            clear &= ~hit
+            moving &= ~hit & ((col != to_col) | (row != to_row))
+        return clear.tolist()
+
+    def _walls_at(self, rows, cols):
+        walls = self.walls
+        if walls.ndim == 4:
+            # Chunked level: chunk row, chunk column, row and column within
+            size = walls.shape[2]
+            return walls[rows // size, cols // size, rows % size, cols % size] != 0
+        return walls[rows, cols] != 0
+
+    def stats(self):
+        return {'cached': len(self.cache), 'hits': self.hits, 'traced': self.traced}
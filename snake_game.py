@@ -1,50 +1,122 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, jsonify, request, g, abort
 from flask_cors import CORS
 import random
 import time
 import json
 import math
+import os
+import hashlib
+import threading
+import atexit
+from collections import deque
+from functools import partial
+
+from sessions import SessionRegistry, SESSION_COOKIE
+from session_store import make_store
+from ticker import TickLoop, TICK_RATE
+from metrics import REGISTRY, COUNT_BUCKETS, setup_logging, SampledLogger
+import delta
+import wire
+from journal import Journal, JOURNAL_DIR
+from scores import ScoreStore
+from client_assets import ClientBundle, Asset, REVALIDATE
+from spatial import SpatialHash
+from pool import EntityPool
+from interest import InterestFilter, InterestView, INTEREST, INTEREST_RADIUS
+from lod import AIScheduler, LOD
+from flowfield import FlowFields, FLOW_RADIUS
+from sightlines import SightLines
+from levels import load_level, LEVEL
+from spawning import SpawnIndex, LOCAL_SPAWN_RADIUS
+from entities import (Player, Fish, Cast, Projectile, Explosion, PowerUp, ActivePowerUp,
+                      RodPickup, TacklePickup)
+
+try:
+    from flask_sock import Sock
+except ImportError:  # Streaming is optional; clients fall back to polling
+    Sock = None
+
+try:
+    import numpy as np
+    from fish_engine import FishArrays, FishView
+except ImportError:  # The NumPy fish engine is optional
+    np = None
+    FishArrays = None
 
 app = Flask(__name__)
 CORS(app)
 
-# Load high scores from file or create new
-try:
-    with open('high_scores.json', 'r') as f:
-        HIGH_SCORES = json.load(f)
-except:
-    HIGH_SCORES = {'scores': []}
-
-# Map definition (1 = wall, 0 = empty)
-MAP = [
-    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 0, 0, 2, 2, 2, 0, 0, 0, 1, 0, 0, 0, 3, 3, 3, 0, 0, 0, 1],
-    [1, 0, 0, 2, 0, 2, 0, 0, 0, 0, 0, 0, 0, 3, 0, 3, 0, 0, 0, 1],
-    [1, 0, 0, 2, 2, 2, 0, 0, 0, 0, 0, 0, 0, 3, 3, 3, 0, 0, 0, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 1, 1, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 1, 1, 1, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 0, 0, 4, 4, 0, 0, 0, 1, 1, 1, 1, 0, 0, 0, 5, 5, 0, 0, 1],
-    [1, 0, 0, 4, 4, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 5, 5, 0, 0, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
-]
-
-# Define wall textures for different wall types
-WALL_TEXTURES = {
-    1: "wood",      # Regular wooden dock walls
-    2: "rocks",     # Rocky shore walls
-    3: "reeds",     # Reed-covered shore
-    4: "mud",       # Muddy shore
-    5: "sand"       # Sandy shore
-}
+# Levelled logging (LOG_LEVEL, default WARNING) written from a background
+# thread; per-entity messages go through the sampled logger
+log = setup_logging()
+sampled_log = SampledLogger(log)
+
+# Hot-path metrics, exposed at /metrics
+UPDATE_PHASE_SECONDS = REGISTRY.histogram(
+    'fishing_update_phase_seconds', 'Time spent in each phase of Game.update()', ['phase'])
+PHASE_TIMERS = {phase: UPDATE_PHASE_SECONDS.labels(phase)
+                for phase in ('explosions', 'casts', 'fish', 'projectiles', 'spawning', 'power_ups',
+                              'pickups')}
+GAME_TICK_SECONDS = REGISTRY.histogram(
+    'fishing_game_tick_seconds', 'Time to apply inputs and update one game')
+TICK_LOOP_SECONDS = REGISTRY.histogram(
+    'fishing_tick_loop_seconds', 'Time to tick every active game once')
+TICK_INPUTS = REGISTRY.histogram(
+    'fishing_tick_inputs', 'Inputs applied to one game in one tick', buckets=COUNT_BUCKETS)
+INPUT_BATCH_SIZE = REGISTRY.histogram(
+    'fishing_input_batch_size', 'Inputs carried by one /move request or stream message',
+    buckets=COUNT_BUCKETS)
+SERIALIZE_SECONDS = REGISTRY.histogram(
+    'fishing_serialize_seconds', 'Time to build a state snapshot', ['format'])
+SERIALIZE_JSON = SERIALIZE_SECONDS.labels('json')
+SERIALIZE_DELTA = SERIALIZE_SECONDS.labels('delta')
+SERIALIZE_BINARY = SERIALIZE_SECONDS.labels('binary')
+REQUEST_SECONDS = REGISTRY.histogram(
+    'fishing_request_seconds', 'HTTP request latency', ['route', 'method', 'status'])
+FISH_HITS = REGISTRY.counter('fishing_fish_hits_total', 'Casts that hit a fish')
+FISH_CAUGHT = REGISTRY.counter('fishing_fish_caught_total', 'Fish caught by casts')
+STREAMS_REFUSED = REGISTRY.counter('fishing_streams_refused_total',
+                                   'State streams closed at MAX_STREAMS, whose clients poll instead')
+
+# High scores shared by every worker (see scores.py); scores queued at exit
+# are committed before the process goes
+HIGH_SCORES = ScoreStore()
+atexit.register(HIGH_SCORES.stop)
+
+# The browser client, compressed once at startup (see client_assets.py)
+CLIENT = ClientBundle()
+
+# The lake being fished, compiled from levels/<LEVEL>.json and mapped
+# read-only from the compiled file (see levels.py)
+LEVEL_MAP = load_level(LEVEL)
+
+# What /level sends, encoded and compressed once; it never changes while
+# the server runs, so clients revalidate it with its ETag
+LEVEL_ASSET = Asset(json.dumps(LEVEL_MAP.to_wire(), separators=(',', ':')).encode('utf-8'),
+                    'application/json', REVALIDATE)
+
+# Occupancy bitmap and clearance field for wall tests
+COLLISION = LEVEL_MAP.collision_map()
+
+# Free cells of the level for bounded-time spawn point queries; on a
+# chunked level, things spawn near the player instead of anywhere
+SPAWNS = SpawnIndex(COLLISION, free_cells=LEVEL_MAP.free_cells,
+                    local_radius=LOCAL_SPAWN_RADIUS if LEVEL_MAP.chunked else None)
+
+# Walls for FISH_ENGINE=numpy, shared by every game
+LEVEL_WALLS = LEVEL_MAP.wall_array() if np is not None else None
+
+# What each player gets sent (see interest.py)
+INTEREST_FILTER = InterestFilter(COLLISION)
+
+# How often each fish runs its AI (see lod.py)
+AI_SCHEDULER = AIScheduler()
+
+# Shortest paths to the player's cell for chasing fish, shared by all games
+FLOW_FIELDS = FlowFields(COLLISION)
+
+# Cached fish-to-player line of sight for fish AI, shared by all games
+SIGHT_LINES = SightLines(COLLISION, LEVEL_WALLS)
 
 # Game state
 game_state = {
@@ -81,6 +153,37 @@ game_state = {
 GRID_WIDTH = 40
 GRID_HEIGHT = 40
 
+# How many past states each game keeps for delta snapshots (~3 s at 20 Hz)
+DELTA_HISTORY = 64
+
+# Most inputs taken from one batch; the rest go unacknowledged and the
+# client sends them again
+MAX_INPUT_BATCH = 64
+
+# Limits on the direct fish actions: fish one /spawn-fish may add, fish a
+# game may hold before it adds none, and damage one /hit-fish may do
+MAX_SPAWN_COUNT = 10
+MAX_SPAWNED_FISH = int(os.environ.get('MAX_SPAWNED_FISH', 200))
+MAX_HIT_DAMAGE = 10
+
+# What an input may ask for; amounts are 1 for keys and a fraction of a
+# turn for mouse look, so anything larger is not from the client
+INPUT_DIRECTIONS = ('FORWARD', 'BACKWARD', 'LEFT', 'RIGHT', 'LOOK')
+MAX_INPUT_AMOUNT = 10
+
+# Each open /stream holds one of the worker's WEB_THREADS request threads
+# (gunicorn --threads; snake-game@.service passes the same variable) for as
+# long as it lasts. MAX_STREAMS defaults to all but STREAM_RESERVED_THREADS
+# of them so plain requests always have threads left. Past it, new streams
+# are closed with 1013 (try again later) and those clients poll instead;
+# each refusal counts in fishing_streams_refused_total, which
+# prometheus-alerts.yml alerts on.
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 16))
+STREAM_RESERVED_THREADS = 4
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', max(1, WEB_THREADS - STREAM_RESERVED_THREADS)))
+STREAM_CLOSE_BUSY = 1013
+STREAM_CLOSE_BAD_MESSAGE = 1003
+
 LURE_TYPES = {
     'fly': {'damage': 1, 'speed': 2, 'cooldown': 0.3},
     'spinner': {'damage': 2, 'speed': 1.5, 'cooldown': 0.5},
@@ -131,6 +234,23 @@ FISH_TYPES = {
     }
 }
 
+# Charge and projectile fish attack a player they can see within these
+# ranges; melee fish bite on contact instead
+CHARGE_RANGE = 4
+PROJECTILE_RANGE = 8
+FISH_ATTACK_RANGE = max(CHARGE_RANGE, PROJECTILE_RANGE)
+CHARGE_TICKS = 30
+PROJECTILE_CHANCE = 0.05  # per tick
+
+# Power-ups that spawn on the map
+POWER_UP_TYPES = (
+    {'type': 'power', 'color': '#ff0000', 'effect': 'lure_power', 'multiplier': 2.0, 'duration': 30},
+    {'type': 'speed', 'color': '#00ff00', 'effect': 'lure_speed', 'multiplier': 1.5, 'duration': 30},
+    {'type': 'spread', 'color': '#0000ff', 'effect': 'spread_shot', 'multiplier': 3, 'duration': 20}
+)
+
+TACKLE_TYPES = ('flies', 'spinners', 'crankbaits')
+
 POWER_UPS = {
     'rapid_cast': {'duration': 10, 'effect': 'casting_speed', 'multiplier': 2},
     'power_lure': {'duration': 10, 'effect': 'lure_power', 'multiplier': 2},
@@ -197,16 +317,12 @@ RODS = {
     }
 }
 
+# Binary state encoding; its name tables come from the definitions above
+WIRE = wire.StateCodec(FISH_TYPES, RODS, TACKLE_TYPES, POWER_UP_TYPES)
+
 def save_high_score(score):
-    HIGH_SCORES['scores'].append({
-        'score': score,
-        'date': time.strftime('%Y-%m-%d %H:%M:%S')
-    })
-    HIGH_SCORES['scores'].sort(key=lambda x: x['score'], reverse=True)
-    HIGH_SCORES['scores'] = HIGH_SCORES['scores'][:10]  # Keep top 10
-    
-    with open('high_scores.json', 'w') as f:
-        json.dump(HIGH_SCORES, f)
+    # Queued for the background writer; never waits on the disk
+    HIGH_SCORES.submit(score)
 
 def reset_game():
     game_state['player']['x'] = 2.0
@@ -282,37 +398,305 @@ def spawn_fish():
         game_state['fish'].append(new_fish)
 
 class Game:
-    def __init__(self):
+    engine = 'python'
+    
+    def __init__(self, seed=None, clock=time.time, journal=None):
+        # Each game owns its randomness and reads the wall clock only on
+        # reset, so a session can be re-run exactly from its journal
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.inputs = deque()
+        self.tick_count = 0
+        self.version = 0  # bumped whenever the visible state changes
+        # Entity ids stay unique across resets so old acks never alias new entities
+        self.next_id = 1
+        self._attach(clock, journal)
         self.reset()
+        if journal is not None:
+            journal.start(seed, self.engine, self.epoch)
     
-    def reset(self):
-        # Initialize game state properties
-        self.player = {
-            'x': 2.0,
-            'y': 2.0,
-            'angle': 0.0,
-            'health': 100,
-            'armor': 0,
-            'current_rod': 'basic',
-            'rods': ['basic'],
-            'tackle_box': {
-                'flies': 50,
-                'spinners': 0,
-                'crankbaits': 0
-            },
-            'rod_cooldown': 0,
-            'casts': [],
-            'explosions': [],
-            'power_ups': [],
-            'lures': 10,  # Assuming 10 is the starting count of lures
-            'lure_power': 1.0,
-            'lure_speed': 1.0,
-            'casting_speed': 1.0
+    # The parts of a game that belong to one worker process. They are set
+    # up again rather than pickled when a session moves between workers
+    # (see session_store.py).
+    ATTACHED = ('clock', 'lock', 'changed', 'update_phases', '_snapshot', '_snapshot_binary',
+                '_interest', 'history', 'actions')
+    # Broadphase indexes and the lists they cover; rebuilt on load, which is
+    # cheaper than pickling them
+    INDEXES = (('fish_index', 'fish'), ('power_up_index', 'power_ups'), ('pickup_index', 'pickups'))
+    
+    def _attach(self, clock, journal):
+        self.clock = clock
+        self.journal = journal
+        
+        # The tick loop and request handlers share the game, so all access
+        # goes through this lock
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        # update() runs these in order and times each one
+        self.update_phases = (
+            ('explosions', self._update_explosions),
+            ('casts', self._update_casts),
+            ('fish', self._update_fish),
+            ('projectiles', self._update_projectiles),
+            ('spawning', self._update_spawning),
+            ('power_ups', self._update_power_ups),
+            ('pickups', self._update_pickups)
+        )
+        self._snapshot = None
+        self._snapshot_binary = None
+        self._interest = None
+        # Recent (version, flattened state) pairs that clients can ack against
+        self.history = deque(maxlen=DELTA_HISTORY)
+        # Client actions applied between ticks, by journal name
+        self.actions = {
+            'spawn_fish': self.spawn_fish,
+            'hit_fish': self.hit_fish,
+            'switch_rod': self.switch_rod,
+            'reset': self.reset
         }
-        self.fish = []
+    
+    def __getstate__(self):
+        # Pickle with the game lock held (session_store.dump_game)
+        state = self.__dict__.copy()
+        for name in self.ATTACHED:
+            del state[name]
+        for index, _ in self.INDEXES:
+            del state[index]
+        state.pop('fish_buckets', None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Sessions saved before fish fired projectiles
+        if 'projectiles' not in state:
+            self.projectiles = EntityPool()
+        self._attach(time.time, self.journal)
+        for index, entities in self.INDEXES:
+            spatial_hash = SpatialHash(COLLISION.width, COLLISION.height)
+            for entity in getattr(self, entities):
+                spatial_hash.insert(entity)
+            setattr(self, index, spatial_hash)
+        # Likewise the fish AI stagger buckets (see lod.py); NumpyGame keeps
+        # fish in arrays and staggers them by slot instead
+        if 'fish' in state:
+            self.fish_buckets = AI_SCHEDULER.buckets(self.fish)
+    
+    def new_id(self):
+        entity_id = self.next_id
+        self.next_id += 1
+        return entity_id
+    
+    def now(self):
+        # Game time in epoch seconds. It moves on by one tick interval per
+        # tick rather than following the wall clock, so replays see the
+        # same times.
+        return self.epoch + (self.tick_count - self.epoch_tick) / TICK_RATE
+    
+    def act(self, action, *args):
+        # Apply a client action between ticks and journal it
+        with self.lock:
+            if self.journal is not None:
+                self.journal.record(self.tick_count, action, *args)
+            result = self.actions[action](*args)
+            self.mark_dirty()
+            return result
+    
+    def switch_rod(self, rod):
+        if rod in RODS and rod in self.player.rods:
+            self.player.current_rod = rod
+            log.debug("Switched to rod: %s", rod)
+            return True
+        log.debug("Cannot switch to rod: %s", rod)
+        return False
+    
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+    
+    def state_digest(self):
+        # Over the whole state, whatever the player can see
+        return hashlib.md5(json.dumps(self.get_state()).encode()).hexdigest()
+    
+    def queue_input(self, direction=None, amount=1, shoot=False):
+        # Inputs are applied in order at the start of the next tick
+        self.inputs.append((direction, amount, shoot))
+    
+    def queue_inputs(self, inputs):
+        # An ordered batch of (seq, direction, amount, shoot) from the client.
+        # Sequence numbers already taken belong to a batch the client sent
+        # again after a failed request, so they are skipped. Inputs without
+        # a sequence number are always taken. Returns the last sequence
+        # number taken.
+        with self.lock:
+            for seq, direction, amount, shoot in inputs:
+                if seq is not None:
+                    if seq <= self.input_seq:
+                        continue
+                    self.input_seq = seq
+                if direction or shoot:
+                    self.inputs.append((direction, amount, shoot))
+            return self.input_seq
+    
+    def drop_inputs(self):
+        # After a failed tick (see ticker.py)
+        with self.lock:
+            self.inputs.clear()
+    
+    def tick(self):
+        with self.lock:
+            if self.game_over:
+                self.inputs.clear()
+                return
+            
+            started = time.perf_counter()
+            journal = self.journal
+            TICK_INPUTS.observe(len(self.inputs))
+            while self.inputs:
+                direction, amount, shoot = self.inputs.popleft()
+                if journal is not None:
+                    journal.record(self.tick_count, 'move', direction, amount, shoot)
+                if direction:
+                    self.move_player(direction, amount)
+                if shoot:
+                    self.shoot()
+            
+            self.update()
+            self.tick_count += 1
+            self.mark_dirty()
+            if journal is not None and self.tick_count % journal.checkpoint_ticks == 0:
+                journal.checkpoint(self.tick_count, self.state_digest())
+            GAME_TICK_SECONDS.observe(time.perf_counter() - started)
+    
+    def mark_dirty(self):
+        # Call after changing the game outside of tick()
+        with self.lock:
+            self._snapshot = None
+            self._snapshot_binary = None
+            self._interest = None
+            self.version += 1
+            self.changed.notify_all()
+    
+    def wait_for_change(self, seen_version, timeout):
+        # Block until the state moves past seen_version; returns the new version
+        with self.lock:
+            self.changed.wait_for(lambda: self.version != seen_version, timeout)
+            return self.version
+    
+    def snapshot_json(self):
+        # Serialize at most once per tick, however many clients read it
+        with self.lock:
+            if self._snapshot is None:
+                started = time.perf_counter()
+                view = self.interest_view()
+                state = self.get_state(view)
+                if view is not None:
+                    # Ids left out, which the client keeps showing as last sent
+                    state['hidden'] = view.hidden
+                self._snapshot = json.dumps(state)
+                SERIALIZE_JSON.observe(time.perf_counter() - started)
+            return self._snapshot
+    
+    def snapshot_binary(self):
+        # Same caching for the binary encoding (see wire.py)
+        with self.lock:
+            if self._snapshot_binary is None:
+                started = time.perf_counter()
+                view = self.interest_view()
+                if view is None:
+                    self._snapshot_binary = WIRE.encode(self, self.fish_binary(), self.power_ups, self.pickups)
+                else:
+                    self._snapshot_binary = WIRE.encode(self, self.fish_binary(view.fish),
+                                                        view.power_ups, view.pickups, view.hidden)
+                SERIALIZE_BINARY.observe(time.perf_counter() - started)
+            return self._snapshot_binary
+    
+    def frame(self, ack=None):
+        # Delta against the acknowledged version, or a keyframe when the
+        # client has nothing we still remember
+        with self.lock:
+            started = time.perf_counter()
+            if not self.history or self.history[-1][0] != self.version:
+                view = self.interest_view()
+                flat = delta.flatten(self.get_state(view))
+                if view is not None and self.history:
+                    # Entities out of view keep their last sent state
+                    # rather than disappearing until the next refresh
+                    delta.carry(flat, self.history[-1][1], view.hidden)
+                self.history.append((self.version, flat))
+            
+            seq, flat = self.history[-1]
+            frame = None
+            if ack is not None and ack != seq:
+                for base_seq, base in self.history:
+                    if base_seq == ack:
+                        frame = delta.diff(base_seq, base, seq, flat)
+                        break
+            elif ack == seq:
+                frame = {'seq': seq, 'base': seq}
+            if frame is None:
+                frame = delta.keyframe(seq, flat)
+            SERIALIZE_DELTA.observe(time.perf_counter() - started)
+            return frame
+    
+    def interest_view(self):
+        # The InterestView for the current version, or None on ticks that
+        # send everything (see interest.py)
+        with self.lock:
+            if self._interest is None:
+                self._interest = self._build_interest_view()
+            return self._interest or None
+    
+    def _build_interest_view(self):
+        if not INTEREST or INTEREST_FILTER.refresh_due(self.tick_count):
+            return False  # cached as "everything"
+        
+        player = self.player
+        sees = INTEREST_FILTER.viewer(player.x, player.y, player.angle)
+        fish, hidden_fish = self.fish_in_view(sees)
+        power_ups = []
+        hidden_power_ups = []
+        for power_up in self.power_ups:
+            if sees(power_up.x, power_up.y):
+                power_ups.append(power_up)
+            else:
+                hidden_power_ups.append(power_up.id)
+        pickups = []
+        hidden_pickups = []
+        for pickup in self.pickups:
+            if sees(pickup.x, pickup.y):
+                pickups.append(pickup)
+            else:
+                hidden_pickups.append(pickup.id)
+        
+        return InterestView(fish, power_ups, pickups, {
+            'fish': hidden_fish,
+            'power_ups': hidden_power_ups,
+            'pickups': hidden_pickups
+        })
+    
+    def reset(self, epoch=None):
+        # Game time starts from the wall clock here (see now())
+        self.epoch = self.clock() if epoch is None else epoch
+        self.epoch_tick = self.tick_count
+        
+        # Initialize game state properties
+        self.player = Player()
+        self.clear_fish()
         self.score = 0
         self.game_over = False
-        self.power_ups = []
+        self.power_ups = EntityPool()
+        self.pickups = EntityPool()
+        self.projectiles = EntityPool()
+        self.inputs.clear()
+        # Input sequence numbers start over too; a reloaded page counts from 1
+        # again and resets first
+        self.input_seq = 0
+        
+        # Broadphase indexes over the level grid for proximity queries
+        self.power_up_index = SpatialHash(COLLISION.width, COLLISION.height)
+        self.pickup_index = SpatialHash(COLLISION.width, COLLISION.height)
         
         # Spawn initial fish
         self.spawn_fish(5)
@@ -326,674 +710,907 @@ class Game:
         # Spawn initial tackle pickup
         self.spawn_tackle_pickup()
         
-        print("Game reset complete")
+        self.mark_dirty()
+        log.debug("Game reset complete")
     
     def spawn_fish(self, count=1):
+        # Returns False if some fish had nowhere to go
+        spawned_all = True
         for _ in range(count):
             # Choose a random fish type
-            fish_type = random.choice(list(FISH_TYPES.keys()))
+            fish_type = self.rng.choice(list(FISH_TYPES.keys()))
             
             # Get fish properties
             fish_props = FISH_TYPES[fish_type]
             
-            # Find a valid spawn position
-            valid_position = False
-            x, y = 0, 0
-            
-            while not valid_position:
-                # Spawn fish at a random position away from the player
-                angle = random.uniform(0, 2 * math.pi)
-                distance = random.uniform(5, 10)  # Spawn 5-10 units away from player
-                
-                x = self.player['x'] + math.cos(angle) * distance
-                y = self.player['y'] + math.sin(angle) * distance
-                
-                # Check if position is valid (not in a wall)
-                if self.is_valid_position(x, y):
-                    valid_position = True
+            # Spawn fish at a free position 5-10 units away from the player
+            point = SPAWNS.point_in_ring(self.rng, self.player.x, self.player.y, 5, 10)
+            if point is None:
+                log.info("No free spawn point 5-10 units from (%.2f, %.2f)", self.player.x, self.player.y)
+                spawned_all = False
+                continue
+            x, y = point
             
             # Create the fish
-            fish = {
-                'x': x,
-                'y': y,
-                'type': fish_type,
-                'speed': fish_props['speed'],
-                'health': fish_props['health'],
-                'direction': random.uniform(0, 2 * math.pi),
-                'state': 'patrol',
-                'state_timer': 0
-            }
+            fish = Fish(self.new_id(), x, y, fish_type, fish_props['speed'], fish_props['health'],
+                        self.rng.uniform(0, 2 * math.pi))
             
-            self.fish.append(fish)
-            print(f"Spawned {fish_type} at ({x:.2f}, {y:.2f})")
+            self.add_fish(fish)
+            log.debug("Spawned %s at (%.2f, %.2f)", fish_type, x, y)
         
-        return True
+        return spawned_all
+    
+    # Fish storage. Everything that reads or changes the set of fish goes
+    # through these methods so another engine can keep fish elsewhere.
+    
+    def clear_fish(self):
+        self.fish = []
+        self.fish_index = SpatialHash(COLLISION.width, COLLISION.height)
+        self.fish_buckets = AI_SCHEDULER.buckets()
+    
+    def add_fish(self, fish):
+        self.fish.append(fish)
+        self.fish_index.insert(fish)
+        self.fish_buckets.add(fish)
+    
+    def remove_fish(self, fish):
+        self.fish.remove(fish)
+        self.fish_index.remove(fish)
+        self.fish_buckets.remove(fish)
+    
+    def fish_positions(self):
+        return [(fish.x, fish.y) for fish in self.fish]
+    
+    def fish_near(self, x, y, radius):
+        # Oldest fish within radius, or None
+        return self.fish_index.first(x, y, radius)
+    
+    def any_fish_within(self, x, y, radius):
+        return self.fish_index.any_within(x, y, radius)
+    
+    def fish_in_view(self, sees):
+        # (fish to send, ids of the rest) for an interest view
+        visible = []
+        hidden = []
+        for fish in self.fish:
+            if sees(fish.x, fish.y):
+                visible.append(fish)
+            else:
+                hidden.append(fish.id)
+        return visible, hidden
+    
+    def fish_wire(self, fish=None):
+        # fish is a selection from fish_in_view(), or None for all of them
+        return [fish.to_wire() for fish in (self.fish if fish is None else fish)]
+    
+    def fish_binary(self, fish=None):
+        return WIRE.pack_fish(self.fish if fish is None else fish)
+    
+    def last_fish_spawn_time(self):
+        # Fish never record when they spawned, so there is no delay to wait out
+        return 0
+    
+    def damage_fish(self, fish, damage):
+        fish.health -= damage
+        log.debug("Fish hit! Type: %s, health before: %s, after: %s",
+                  fish.type, fish.health + damage, fish.health)
+        
+        # Check if fish is dead
+        if fish.health <= 0:
+            log.debug("Fish caught! Type: %s, Points: %s", fish.type, FISH_TYPES[fish.type]['points'])
+            FISH_CAUGHT.inc()
+            # Add score
+            self.score += FISH_TYPES[fish.type]['points']
+            
+            # Remove fish
+            self.remove_fish(fish)
+            
+            # Spawn a new fish
+            self.spawn_fish(1)
+    
+    def hit_fish(self, index, damage):
+        # Direct hit on one fish by its position in the fish list
+        if self.fish and len(self.fish) > index:
+            self.damage_fish(self.fish[index], damage)
     
     def move_player(self, direction, amount=1):
         move_speed = 0.1
         rotation_speed = 0.05
         
         if direction == 'FORWARD':
-            new_x = self.player['x'] + math.cos(self.player['angle']) * move_speed * amount
-            new_y = self.player['y'] + math.sin(self.player['angle']) * move_speed * amount
+            new_x = self.player.x + math.cos(self.player.angle) * move_speed * amount
+            new_y = self.player.y + math.sin(self.player.angle) * move_speed * amount
             if self.is_valid_position(new_x, new_y):
-                self.player['x'] = new_x
-                self.player['y'] = new_y
+                self.player.x = new_x
+                self.player.y = new_y
         
         elif direction == 'BACKWARD':
-            new_x = self.player['x'] - math.cos(self.player['angle']) * move_speed * amount
-            new_y = self.player['y'] - math.sin(self.player['angle']) * move_speed * amount
+            new_x = self.player.x - math.cos(self.player.angle) * move_speed * amount
+            new_y = self.player.y - math.sin(self.player.angle) * move_speed * amount
             if self.is_valid_position(new_x, new_y):
-                self.player['x'] = new_x
-                self.player['y'] = new_y
+                self.player.x = new_x
+                self.player.y = new_y
         
         elif direction == 'LEFT':
-            self.player['angle'] -= rotation_speed * amount
+            self.player.angle -= rotation_speed * amount
         
         elif direction == 'RIGHT':
-            self.player['angle'] += rotation_speed * amount
+            self.player.angle += rotation_speed * amount
         
         elif direction == 'LOOK':
-            self.player['angle'] += rotation_speed * amount
+            self.player.angle += rotation_speed * amount
     
     def is_valid_position(self, x, y):
-        # Check if position is within map bounds
-        if x < 0 or y < 0 or x >= len(MAP[0]) or y >= len(MAP):
-            return False
-        
-        # Check if position is in a wall
-        if MAP[int(y)][int(x)] != 0:
-            return False
-        
-        return True
+        # Inside the map and not in a wall
+        return COLLISION.is_free(x, y)
     
     def shoot(self):
         # Check if rod is on cooldown
-        if 'rod_cooldown' in self.player and self.player['rod_cooldown'] > 0:
+        if self.player.rod_cooldown > 0:
             return False
         
         # Get current rod
-        rod_name = self.player.get('current_rod', 'basic')
+        rod_name = self.player.current_rod
         
-        # Check if we have the RODS dictionary
-        if 'RODS' in globals() and rod_name in RODS:
+        if rod_name in RODS:
             rod = RODS[rod_name]
             ammo_type = rod['ammo_type']
             
-            # Check if player has tackle - make sure tackle_box is a dictionary with numeric values
-            if isinstance(self.player['tackle_box'], dict) and ammo_type in self.player['tackle_box']:
-                ammo_count = self.player['tackle_box'][ammo_type]
+            # Check if player has tackle
+            if ammo_type in self.player.tackle_box:
+                ammo_count = self.player.tackle_box[ammo_type]
                 if isinstance(ammo_count, int) and ammo_count <= 0:
-                    print(f"Out of {ammo_type}")
+                    log.debug("Out of %s", ammo_type)
                     return False
                 
                 # Consume tackle
-                self.player['tackle_box'][ammo_type] -= 1
+                self.player.tackle_box[ammo_type] -= 1
             else:
-                print("Invalid tackle box structure")
+                log.warning("Invalid tackle box structure")
                 return False
             
             # Set rod cooldown
-            self.player['rod_cooldown'] = rod['cooldown']
+            self.player.rod_cooldown = rod['cooldown']
             
             # Handle different rod types
             if 'casts' in rod:  # Spinning rod-like
                 for _ in range(rod['casts']):
-                    spread = random.uniform(-rod['spread'] * 0.01, rod['spread'] * 0.01)
-                    self.create_cast(self.player['angle'] + spread, rod['damage'], rod['speed'])
+                    spread = self.rng.uniform(-rod['spread'] * 0.01, rod['spread'] * 0.01)
+                    self.create_cast(self.player.angle + spread, rod['damage'], rod['speed'])
             elif rod_name == 'pro_rod':  # Pro rod-like
-                self.create_cast(self.player['angle'], rod['damage'], rod['speed'], explosion_radius=rod.get('explosion_radius', 0))
+                self.create_cast(self.player.angle, rod['damage'], rod['speed'], explosion_radius=rod.get('explosion_radius', 0))
             else:  # Regular rod
-                self.create_cast(self.player['angle'], rod['damage'], rod['speed'])
+                self.create_cast(self.player.angle, rod['damage'], rod['speed'])
         else:
             # Fallback to old fishing game logic
-            cast = {
-                'x': self.player['x'],
-                'y': self.player['y'],
-                'angle': self.player['angle'],
-                'speed': 0.2 * self.player.get('lure_speed', 1.0),
-                'damage': 1 * self.player.get('lure_power', 1.0),
-                'distance': 0,
-                'max_distance': 10,
-                'active': True
-            }
+            cast = Cast(self.new_id(), self.player.x, self.player.y, self.player.angle,
+                        0.2 * self.player.lure_speed, 1 * self.player.lure_power, 10)
             
             # Add cast to player
-            if 'casts' not in self.player:
-                self.player['casts'] = []
-            
-            self.player['casts'].append(cast)
+            self.player.casts.add(cast)
         
         return True
     
     def create_cast(self, angle, damage, speed, explosion_radius=0):
-        cast = {
-            'x': self.player['x'],
-            'y': self.player['y'],
-            'angle': angle,
-            'speed': speed,
-            'damage': damage,
-            'distance': 0,
-            'max_distance': 15,
-            'active': True,
-            'explosion_radius': explosion_radius
-        }
-        
-        if 'casts' not in self.player:
-            self.player['casts'] = []
-        
-        self.player['casts'].append(cast)
+        cast = Cast(self.new_id(), self.player.x, self.player.y, angle, speed, damage, 15,
+                    explosion_radius)
+        self.player.casts.add(cast)
     
     def update(self):
-        # Ensure lures is an integer
-        if 'lures' not in self.player:
-            self.player['lures'] = 10  # Default starting count
-
-        # Check if there are no lures and fish exist
-        if self.player['lures'] <= 0 and len(self.fish) > 0:
-            # Your logic here
-            pass
-
-        # Make sure we have cast and explosion arrays
-        if 'casts' not in self.player:
-            self.player['casts'] = []
-        
-        if 'explosions' not in self.player:
-            self.player['explosions'] = []
-        
-        if 'lures' not in self.player:
-            self.player['lures'] = []
-        
-        if 'lure_power' not in self.player:
-            self.player['lure_power'] = 1.0
-        
-        if 'lure_speed' not in self.player:
-            self.player['lure_speed'] = 1.0
-        
-        if 'casting_speed' not in self.player:
-            self.player['casting_speed'] = 1.0
+        # Rod cooldowns are measured in ticks
+        if self.player.rod_cooldown > 0:
+            self.player.rod_cooldown -= 1
         
+        for phase, step in self.update_phases:
+            started = time.perf_counter()
+            step()
+            PHASE_TIMERS[phase].observe(time.perf_counter() - started)
+    
+    def _update_explosions(self):
         # Update existing explosions
-        for explosion in self.player['explosions'][:]:
-            explosion['time'] -= 1
-            if explosion['time'] <= 0:
-                self.player['explosions'].remove(explosion)
+        for explosion in reversed(self.player.explosions):
+            explosion.time -= 1
+            if explosion.time <= 0:
+                self.player.explosions.remove(explosion)
         
+    def _update_casts(self):
         # Process each cast
-        print(f"Processing {len(self.player['casts'])} casts")
-        for cast in list(self.player['casts']):  # Use list() to create a copy
-            # Move cast
-            cast['x'] += math.cos(cast['angle']) * cast['speed']
-            cast['y'] += math.sin(cast['angle']) * cast['speed']
-            cast['distance'] += cast['speed']
+        for cast in reversed(self.player.casts):
+            # Move cast, stopping at the first wall along the way so fast
+            # casts cannot slip through corners
+            hit_wall, cast.x, cast.y = COLLISION.sweep(
+                cast.x, cast.y,
+                cast.x + math.cos(cast.angle) * cast.speed,
+                cast.y + math.sin(cast.angle) * cast.speed)
+            cast.distance += cast.speed
             
             # Check if cast hit a wall or exceeded max distance
-            if not self.is_valid_position(cast['x'], cast['y']) or cast['distance'] >= cast['max_distance']:
-                print(f"Cast hit wall or exceeded max distance at ({cast['x']}, {cast['y']})")
+            if hit_wall or cast.distance >= cast.max_distance:
+                sampled_log.debug("Cast hit wall or exceeded max distance at (%.2f, %.2f)", cast.x, cast.y)
                 # Create splash at wall hit
-                self.player['explosions'].append({
-                    'x': cast['x'],
-                    'y': cast['y'],
-                    'size': 0.3,
-                    'time': 5
-                })
-                self.player['casts'].remove(cast)
+                self.player.explosions.add(Explosion(self.new_id(), cast.x, cast.y, 0.3, 5))
+                self.player.casts.remove(cast)
                 continue
             
-            # Check for fish collisions
-            hit = False
-            for i, fish in enumerate(list(self.fish)):  # Use list() to create a copy
-                # Calculate distance between cast and fish
-                dx = fish['x'] - cast['x']
-                dy = fish['y'] - cast['y']
-                dist = math.sqrt(dx*dx + dy*dy)
+            # Check for fish collisions - very generous hit radius to make
+            # hitting fish easier; the oldest fish in range takes the hit
+            fish = self.fish_near(cast.x, cast.y, 2.0)
+            if fish is not None:
+                FISH_HITS.inc()
                 
-                # Very generous hit radius to make hitting fish easier
-                if dist < 2.0:
-                    print(f"CAST HIT FISH! Distance: {dist}")
-                    print(f"Cast position: ({cast['x']}, {cast['y']})")
-                    print(f"Fish position: ({fish['x']}, {fish['y']})")
-                    
-                    # Apply damage to fish
-                    damage = cast.get('damage', 1) * self.player['lure_power']
-                    fish['health'] -= damage
-                    
-                    print(f"Fish hit! Type: {fish['type']}, Health before: {fish['health'] + damage}, after: {fish['health']}")
-                    
-                    # Create splash at hit location
-                    self.player['explosions'].append({
-                        'x': cast['x'],
-                        'y': cast['y'],
-                        'size': 0.5,
-                        'time': 10
-                    })
-                    
-                    # Remove cast
-                    if cast in self.player['casts']:
-                        self.player['casts'].remove(cast)
-                    
-                    # Check if fish is dead
-                    if fish['health'] <= 0:
-                        print(f"Fish caught! Type: {fish['type']}, Points: {FISH_TYPES[fish['type']]['points']}")
-                        # Add score
-                        self.score += FISH_TYPES[fish['type']]['points']
-                        
-                        # Remove fish
-                        if fish in self.fish:
-                            self.fish.remove(fish)
-                        
-                        # Spawn a new fish
-                        self.spawn_fish(1)
-                    
-                    hit = True
-                    break
-            
-            if hit:
-                continue
+                # Create splash at hit location
+                self.player.explosions.add(Explosion(self.new_id(), cast.x, cast.y, 0.5, 10))
+                
+                # Remove cast
+                self.player.casts.remove(cast)
+                
+                # Apply damage to fish
+                self.damage_fish(fish, cast.damage * self.player.lure_power)
+        
+    def _update_fish(self):
+        # Ids of fish within chase range that can see the player, looked up
+        # once the first time a patrolling fish needs it
+        in_chase_range = None
+        
+        # Flow field towards the player, likewise looked up once the first
+        # time a chasing fish needs it
+        flow = None
+        
+        # The fish whose AI runs this tick and how many ticks each makes up:
+        # those near or in sight every tick, the rest in bigger steps every
+        # few ticks
+        player = self.player
+        if LOD:
+            scheduled = AI_SCHEDULER.due(self.fish_index, self.fish_buckets, player.x, player.y, player.angle,
+                                         self.tick_count)
+        else:
+            scheduled = [(fish, 1) for fish in self.fish]
         
         # Move fish
-        for fish in self.fish[:]:
+        for fish, steps in scheduled:
             # Update fish state
-            fish['state_timer'] -= 1
-            if fish['state_timer'] <= 0:
+            fish.state_timer -= steps
+            if fish.state_timer <= 0:
                 # Change state
-                if fish['state'] == 'patrol':
+                if fish.state == 'patrol':
                     # 30% chance to chase player if close enough
-                    dx = fish['x'] - self.player['x']
-                    dy = fish['y'] - self.player['y']
-                    dist = math.sqrt(dx**2 + dy**2)
+                    if in_chase_range is None:
+                        nearby = self.fish_index.query(player.x, player.y, 10)
+                        sight = SIGHT_LINES.clear_lines(player.x, player.y, [other.x for other in nearby],
+                                                        [other.y for other in nearby])
+                        in_chase_range = {other.id for other, clear in zip(nearby, sight) if clear}
                     
-                    if dist < 10 and random.random() < 0.3:
-                        fish['state'] = 'chase'
-                        fish['state_timer'] = random.randint(50, 100)
+                    if fish.id in in_chase_range and self.rng.random() < 0.3:
+                        fish.state = 'chase'
+                        fish.state_timer = self.rng.randint(50, 100)
                     else:
                         # Just change direction
-                        fish['direction'] = random.uniform(0, 2 * math.pi)
-                        fish['state_timer'] = random.randint(50, 150)
+                        fish.direction = self.rng.uniform(0, 2 * math.pi)
+                        fish.state_timer = self.rng.randint(50, 150)
                 
-                elif fish['state'] == 'chase':
-                    # Go back to patrol
-                    fish['state'] = 'patrol'
-                    fish['state_timer'] = random.randint(50, 150)
+                else:
+                    # A chase or charge is over; go back to patrol
+                    fish.state = 'patrol'
+                    fish.state_timer = self.rng.randint(50, 150)
+                    fish.target_x = fish.target_y = None
             
             # Move fish based on state
-            if fish['state'] == 'patrol':
+            if fish.state == 'patrol':
                 # Occasionally change direction
-                if random.random() < 0.01:
-                    fish['direction'] = random.uniform(0, 2 * math.pi)
+                if self.rng.random() < (0.01 if steps == 1 else 1 - 0.99 ** steps):
+                    fish.direction = self.rng.uniform(0, 2 * math.pi)
                 
                 # Move fish in its direction
-                speed = fish['speed'] * 0.5  # Slower when patrolling - REDUCED SPEED
-                new_x = fish['x'] + math.cos(fish['direction']) * speed
-                new_y = fish['y'] + math.sin(fish['direction']) * speed
+                speed = fish.speed * 0.5 * steps  # Slower when patrolling - REDUCED SPEED
+                new_x = fish.x + math.cos(fish.direction) * speed
+                new_y = fish.y + math.sin(fish.direction) * speed
                 
-            elif fish['state'] == 'chase':
-                # Calculate direction to player
-                dx = self.player['x'] - fish['x']
-                dy = self.player['y'] - fish['y']
+            elif fish.state == 'chase':
+                # Head for the next cell on the way to the player, or straight
+                # at the player once in the same cell
+                if flow is None:
+                    flow = FLOW_FIELDS.toward(player.x, player.y) or False
+                next_cell = flow.next_cell(int(fish.x), int(fish.y)) if flow else -1
+                if next_cell < 0:
+                    dx = player.x - fish.x
+                    dy = player.y - fish.y
+                else:
+                    row, col = divmod(next_cell, COLLISION.width)
+                    dx = col + 0.5 - fish.x
+                    dy = row + 0.5 - fish.y
                 angle = math.atan2(dy, dx)
                 
                 # Add some randomness to chase
-                angle += random.uniform(-0.1, 0.1)
+                angle += self.rng.uniform(-0.1, 0.1)
                 
                 # Move toward player
-                speed = fish['speed'] * 1.2  # Faster when chasing - REDUCED SPEED
-                new_x = fish['x'] + math.cos(angle) * speed
-                new_y = fish['y'] + math.sin(angle) * speed
+                speed = fish.speed * 1.2 * steps  # Faster when chasing - REDUCED SPEED
+                new_x = fish.x + math.cos(angle) * speed
+                new_y = fish.y + math.sin(angle) * speed
                 
                 # Update direction for rendering
-                fish['direction'] = angle
+                fish.direction = angle
+                
+            elif fish.state == 'charge':
+                # Rush at where the player was when the charge started
+                dx = fish.target_x - fish.x
+                dy = fish.target_y - fish.y
+                fish.direction = math.atan2(dy, dx)
+                speed = min(fish.speed * 2 * steps, math.hypot(dx, dy))
+                new_x = fish.x + math.cos(fish.direction) * speed
+                new_y = fish.y + math.sin(fish.direction) * speed
             
-            # Check if new position is valid
-            if self.is_valid_position(new_x, new_y):
-                fish['x'] = new_x
-                fish['y'] = new_y
+            # Check the path to the new position is clear
+            hit_wall, _, _ = COLLISION.sweep(fish.x, fish.y, new_x, new_y)
+            if not hit_wall:
+                fish.x = new_x
+                fish.y = new_y
+                self.fish_index.move(fish)
             else:
                 # If not valid, bounce off wall
-                fish['direction'] += math.pi + random.uniform(-0.5, 0.5)
-                fish['state'] = 'patrol'  # Go back to patrol after hitting wall
-            
-            # Check if fish is too close to player
-            dx = fish['x'] - self.player['x']
-            dy = fish['y'] - self.player['y']
-            dist = math.sqrt(dx**2 + dy**2)
+                fish.direction += math.pi + self.rng.uniform(-0.5, 0.5)
+                fish.state = 'patrol'  # Go back to patrol after hitting wall
+                fish.target_x = fish.target_y = None
+        
+        # Fish that ended up too close to the player attack
+        for fish in self.fish_index.query(self.player.x, self.player.y, 0.5):
+            self.fish_bites_player(fish.type)
+        
+        self._fish_attacks()
+    
+    def _fish_attacks(self):
+        # Charge and projectile fish in range attack if they can see the
+        # player: one batched, cached line-of-sight lookup for all of them
+        player = self.player
+        attackers = [fish for fish in self.fish_index.query(player.x, player.y, FISH_ATTACK_RANGE)
+                     if fish.state != 'charge' and FISH_TYPES[fish.type]['attack_type'] != 'melee']
+        if not attackers:
+            return
+        sight = SIGHT_LINES.clear_lines(player.x, player.y, [fish.x for fish in attackers],
+                                        [fish.y for fish in attackers])
+        for fish, clear in zip(attackers, sight):
+            if clear:
+                self.fish_attack(fish)
+    
+    def fish_bites_player(self, fish_type):
+        self.hurt_player(FISH_TYPES[fish_type]['damage'])
+    
+    def hurt_player(self, damage):
+        self.player.health -= damage
+        
+        # Create a red splash effect for attack
+        self.player.explosions.add(Explosion(self.new_id(), self.player.x, self.player.y, 0.5, 5, '#ff0000'))
+        
+        # Check if player is dead
+        if self.player.health <= 0:
+            self.game_over = True
+    
+    def _update_projectiles(self):
+        player = self.player
+        for projectile in reversed(self.projectiles):
+            new_x = projectile.x + math.cos(projectile.angle) * projectile.speed
+            new_y = projectile.y + math.sin(projectile.angle) * projectile.speed
+            projectile.distance += projectile.speed
+            hit_wall, _, _ = COLLISION.sweep(projectile.x, projectile.y, new_x, new_y)
+            if hit_wall or projectile.distance >= projectile.max_distance:
+                self.projectiles.remove(projectile)
+                continue
+            projectile.x = new_x
+            projectile.y = new_y
             
-            if dist < 0.5:
-                # Fish attacks player
-                self.player['health'] -= FISH_TYPES[fish['type']]['damage']
-                
-                # Create splash effect for attack
-                self.player['explosions'].append({
-                    'x': self.player['x'],
-                    'y': self.player['y'],
-                    'size': 0.5,
-                    'time': 5,
-                    'color': '#ff0000'  # Red for damage
-                })
-                
-                # Check if player is dead
-                if self.player['health'] <= 0:
-                    self.game_over = True
+            dx = player.x - new_x
+            dy = player.y - new_y
+            if dx * dx + dy * dy < 0.25:
+                self.projectiles.remove(projectile)
+                self.hurt_player(projectile.damage)
         
+    def _update_spawning(self):
         # Spawn new fish with a delay between spawns
-        current_time = time.time()
-        last_spawn_time = 0
+        current_time = self.now()
         
         # Find the most recently spawned fish
-        if self.fish:
-            last_spawn_time = max(fish.get('spawn_time', 0) for fish in self.fish)
+        last_spawn_time = self.last_fish_spawn_time()
         
         # Only spawn a new fish if enough time has passed since the last spawn
         if (current_time - last_spawn_time > 5 and  # 5 second delay between fish
-            random.random() < 0.01 and 
+            self.rng.random() < 0.01 and 
             len(self.fish) < 3):  # Maximum of 3 fish at once
             self.spawn_fish(1)
         
         # Check if player is out of lures and no fish are left
-        if self.player['lures'] <= 0 and len(self.fish) > 0:
+        if self.player.lures <= 0 and len(self.fish) > 0:
             # Check if any fish is within shooting range
-            can_shoot = False
-            for fish in self.fish:
-                dx = fish['x'] - self.player['x']
-                dy = fish['y'] - self.player['y']
-                dist = math.sqrt(dx**2 + dy**2)
-                if dist < 5:
-                    can_shoot = True
-                    break
-            
-            if not can_shoot:
+            if not self.any_fish_within(self.player.x, self.player.y, 5):
                 self.game_over = True
         
-        # Update power-ups
-        for power_up in self.power_ups[:]:
-            # Make power-ups rotate
-            power_up['rotation'] += 0.02
-            power_up['bob_offset'] += 0.05
+    def _update_power_ups(self):
+        # Make power-ups rotate
+        for power_up in self.power_ups:
+            power_up.rotation += 0.02
+            power_up.bob_offset += 0.05
+        
+        # Collect power-ups the player is close enough to
+        for power_up in self.power_up_index.query(self.player.x, self.player.y, 0.7):
+            # Apply power-up effect
+            if power_up.effect == 'lure_power':
+                self.player.lure_power = power_up.multiplier
+            elif power_up.effect == 'lure_speed':
+                self.player.lure_speed = power_up.multiplier
             
-            # Check if player collected power-up
-            dx = power_up['x'] - self.player['x']
-            dy = power_up['y'] - self.player['y']
-            dist = math.sqrt(dx**2 + dy**2)
+            # Add to active power-ups
+            self.player.power_ups.add(ActivePowerUp(
+                self.new_id(), power_up.type, power_up.effect, power_up.multiplier,
+                power_up.duration, self.now()))
             
-            if dist < 0.7:  # Player is close enough to collect
-                # Apply power-up effect
-                if power_up['effect'] == 'lure_power':
-                    self.player['lure_power'] = power_up['multiplier']
-                elif power_up['effect'] == 'lure_speed':
-                    self.player['lure_speed'] = power_up['multiplier']
-                
-                # Add to active power-ups
-                self.player['power_ups'].append({
-                    'type': power_up['type'],
-                    'effect': power_up['effect'],
-                    'multiplier': power_up['multiplier'],
-                    'duration': power_up['duration'],
-                    'start_time': time.time()
-                })
-                
-                # Remove collected power-up
-                self.power_ups.remove(power_up)
-                
-                # Spawn a new power-up elsewhere
-                self.spawn_power_ups(1)
+            # Remove collected power-up
+            self.power_ups.remove(power_up)
+            self.power_up_index.remove(power_up)
+            
+            # Spawn a new power-up elsewhere
+            self.spawn_power_ups(1)
         
         # Update active power-ups
-        current_time = time.time()
-        for power_up in self.player['power_ups'][:]:
-            elapsed = current_time - power_up['start_time']
-            if elapsed > power_up['duration']:
+        current_time = self.now()
+        for power_up in reversed(self.player.power_ups):
+            elapsed = current_time - power_up.start_time
+            if elapsed > power_up.duration:
                 # Power-up expired
-                if power_up['effect'] == 'lure_power':
-                    self.player['lure_power'] = 1.0
-                elif power_up['effect'] == 'lure_speed':
-                    self.player['lure_speed'] = 1.0
+                if power_up.effect == 'lure_power':
+                    self.player.lure_power = 1.0
+                elif power_up.effect == 'lure_speed':
+                    self.player.lure_speed = 1.0
                 
-                self.player['power_ups'].remove(power_up)
+                self.player.power_ups.remove(power_up)
         
+    def _update_pickups(self):
         # Update pickups
         if hasattr(self, 'pickups'):
-            for pickup in self.pickups[:]:
+            for pickup in reversed(self.pickups):
                 # Decrease time
-                pickup['time'] -= 1
+                pickup.time -= 1
                 
                 # Remove expired pickups
-                if pickup['time'] <= 0:
+                if pickup.time <= 0:
                     self.pickups.remove(pickup)
-                    continue
+                    self.pickup_index.remove(pickup)
+            
+            # Check if player picked up
+            for pickup in self.pickup_index.query(self.player.x, self.player.y, 1.0):
+                if pickup.type == 'rod':
+                    # Add rod to player's inventory
+                    if pickup.rod not in self.player.rods:
+                        self.player.rods.append(pickup.rod)
+                        log.debug("Player picked up rod: %s", pickup.rod)
+                        
+                        # Switch to the new rod
+                        self.player.current_rod = pickup.rod
+                        
+                        # Add some tackle for the rod
+                        ammo_type = RODS[pickup.rod]['ammo_type']
+                        if ammo_type == 'flies':
+                            self.player.tackle_box['flies'] += 20
+                        elif ammo_type == 'spinners':
+                            self.player.tackle_box['spinners'] += 8
+                        else:  # crankbaits
+                            self.player.tackle_box['crankbaits'] += 30
                 
-                # Check if player picked up
-                dx = pickup['x'] - self.player['x']
-                dy = pickup['y'] - self.player['y']
-                dist = math.sqrt(dx**2 + dy**2)
+                elif pickup.type == 'tackle':
+                    # Add tackle to player's inventory
+                    self.player.tackle_box[pickup.tackle_type] += pickup.amount
+                    log.debug("Player picked up %s %s", pickup.amount, pickup.tackle_type)
                 
-                if dist < 1.0:
-                    if pickup['type'] == 'rod':
-                        # Add rod to player's inventory
-                        if pickup['rod'] not in self.player['rods']:
-                            self.player['rods'].append(pickup['rod'])
-                            print(f"Player picked up rod: {pickup['rod']}")
-                            
-                            # Switch to the new rod
-                            self.player['current_rod'] = pickup['rod']
-                            
-                            # Add some tackle for the rod
-                            ammo_type = RODS[pickup['rod']]['ammo_type']
-                            if ammo_type == 'flies':
-                                self.player['tackle_box']['flies'] += 20
-                            elif ammo_type == 'spinners':
-                                self.player['tackle_box']['spinners'] += 8
-                            else:  # crankbaits
-                                self.player['tackle_box']['crankbaits'] += 30
-                    
-                    elif pickup['type'] == 'tackle':
-                        # Add tackle to player's inventory
-                        self.player['tackle_box'][pickup['tackle_type']] += pickup['amount']
-                        print(f"Player picked up {pickup['amount']} {pickup['tackle_type']}")
-                    
-                    # Remove the pickup
-                    self.pickups.remove(pickup)
-                    
-                    # Create splash effect
-                    self.player['explosions'].append({
-                        'x': pickup['x'],
-                        'y': pickup['y'],
-                        'size': 0.5,
-                        'time': 10,
-                        'color': '#ffff00'  # Yellow for pickups
-                    })
+                # Remove the pickup
+                self.pickups.remove(pickup)
+                self.pickup_index.remove(pickup)
+                
+                # Create a yellow splash effect
+                self.player.explosions.add(Explosion(self.new_id(), pickup.x, pickup.y, 0.5, 10, '#ffff00'))
     
-    def get_state(self):
+    def get_state(self, view=None):
+        # Plain dicts and lists in the shape the client expects; with an
+        # InterestView, only what that view sends
+        if view is None:
+            fish = self.fish_wire()
+            power_ups = self.power_ups
+            pickups = self.pickups
+        else:
+            fish = self.fish_wire(view.fish)
+            power_ups = view.power_ups
+            pickups = view.pickups
         return {
-            'player': self.player,
-            'fish': self.fish,
-            'power_ups': self.power_ups,
+            'player': self.player.to_wire(),
+            'fish': fish,
+            'power_ups': [power_up.to_wire() for power_up in power_ups],
             'score': self.score,
             'game_over': self.game_over,
-            'pickups': getattr(self, 'pickups', [])
+            'pickups': [pickup.to_wire() for pickup in pickups]
         }
 
     def spawn_power_ups(self, count):
-        power_up_types = [
-            {'type': 'power', 'color': '#ff0000', 'effect': 'lure_power', 'multiplier': 2.0, 'duration': 30},
-            {'type': 'speed', 'color': '#00ff00', 'effect': 'lure_speed', 'multiplier': 1.5, 'duration': 30},
-            {'type': 'spread', 'color': '#0000ff', 'effect': 'spread_shot', 'multiplier': 3, 'duration': 20}
-        ]
+        power_up_types = POWER_UP_TYPES
         
         for _ in range(count):
             # Find a valid position (not in a wall and not too close to player)
-            while True:
-                x = random.uniform(1, len(MAP[0]) - 2)
-                y = random.uniform(1, len(MAP) - 2)
-                
-                # Check if position is in a wall
-                if MAP[int(y)][int(x)] != 0:
-                    continue
-                
-                # Make sure power-up isn't too close to the player
-                dist = math.sqrt((x - self.player['x'])**2 + (y - self.player['y'])**2)
-                if dist < 5:
-                    continue
-                
+            point = SPAWNS.random_free_point(self.rng, avoid=(self.player.x, self.player.y), avoid_radius=5,
+                                             near=(self.player.x, self.player.y))
+            if point is None:
+                log.info("No free power-up spawn point")
                 break
+            x, y = point
             
-            power_up_type = random.choice(power_up_types)
-            self.power_ups.append({
-                'x': x,
-                'y': y,
-                'type': power_up_type['type'],
-                'color': power_up_type['color'],
-                'effect': power_up_type['effect'],
-                'multiplier': power_up_type['multiplier'],
-                'duration': power_up_type['duration'],
-                'rotation': random.uniform(0, 2 * math.pi),
-                'bob_offset': random.uniform(0, 2 * math.pi)
-            })
+            power_up_type = self.rng.choice(power_up_types)
+            power_up = PowerUp(
+                self.new_id(), x, y,
+                power_up_type['type'],
+                power_up_type['color'],
+                power_up_type['effect'],
+                power_up_type['multiplier'],
+                power_up_type['duration'],
+                self.rng.uniform(0, 2 * math.pi),  # rotation
+                self.rng.uniform(0, 2 * math.pi)   # bob offset
+            )
+            self.power_ups.add(power_up)
+            self.power_up_index.insert(power_up)
 
     def fish_attack(self, fish):
-        # Calculate distance to player
-        dx = self.player['x'] - fish['x']
-        dy = self.player['y'] - fish['y']
-        dist = math.sqrt(dx**2 + dy**2)
-        
-        # Only attack if close enough
-        if dist > 5:
-            return
-        
-        attack_type = FISH_TYPES[fish['type']]['attack_type']
-        
-        if attack_type == 'melee' and dist < 1.5:
-            # Melee attack - direct damage to player
-            if 'health' not in self.player:
-                self.player['health'] = 100
-            
-            self.player['health'] -= FISH_TYPES[fish['type']]['damage']
-            
-            # Create splash for attack visualization
-            self.player['explosions'].append({
-                'x': self.player['x'],
-                'y': self.player['y'],
-                'size': 0.5,
-                'time': 5,
-                'color': '#ff0000'
-            })
-            
-            # Check if player died
-            if self.player['health'] <= 0:
-                self.game_over = True
+        # A charge or projectile fish that can see the player attacks (see
+        # _fish_attacks)
+        dx = self.player.x - fish.x
+        dy = self.player.y - fish.y
+        dist_sq = dx * dx + dy * dy
+        attack_type = FISH_TYPES[fish.type]['attack_type']
         
-        elif attack_type == 'charge' and dist < 4:
+        if attack_type == 'charge' and dist_sq < CHARGE_RANGE * CHARGE_RANGE:
             # Charge attack - fish rushes at player
-            fish['state'] = 'charge'
-            fish['state_timer'] = 30
-            fish['target_x'] = self.player['x']
-            fish['target_y'] = self.player['y']
+            fish.state = 'charge'
+            fish.state_timer = CHARGE_TICKS
+            fish.target_x = self.player.x
+            fish.target_y = self.player.y
         
-        elif attack_type == 'projectile' and dist < 8 and random.random() < 0.05:
+        elif (attack_type == 'projectile' and dist_sq < PROJECTILE_RANGE * PROJECTILE_RANGE and
+              self.rng.random() < PROJECTILE_CHANCE):
             # Projectile attack - fish shoots at player
-            if 'projectiles' not in fish:
-                fish['projectiles'] = []
-            
-            angle = math.atan2(dy, dx)
-            fish['projectiles'].append({
-                'x': fish['x'],
-                'y': fish['y'],
-                'angle': angle,
-                'speed': 0.1,
-                'damage': FISH_TYPES[fish['type']]['damage'] / 2,
-                'distance': 0,
-                'max_distance': 10
-            })
+            self.projectiles.add(Projectile(self.new_id(), fish.x, fish.y, math.atan2(dy, dx), 0.1,
+                                            FISH_TYPES[fish.type]['damage'] / 2, 10))
 
     def spawn_rod_pickup(self):
         # Determine which rods the player doesn't have
-        available_rods = [r for r in RODS.keys() if r not in self.player['rods']]
+        available_rods = [r for r in RODS.keys() if r not in self.player.rods]
         
         if not available_rods:
             return  # Player has all rods
         
         # Choose a random rod
-        rod = random.choice(available_rods)
+        rod = self.rng.choice(available_rods)
         
         # Find a valid position
-        valid_position = False
-        x, y = 0, 0
-        
-        while not valid_position:
-            x = random.uniform(1, len(MAP[0]) - 1)
-            y = random.uniform(1, len(MAP) - 1)
-            
-            # Check if position is valid (not in a wall)
-            if self.is_valid_position(x, y):
-                valid_position = True
-        
-        # Create the pickup
-        pickup = {
-            'type': 'rod',
-            'rod': rod,
-            'x': x,
-            'y': y,
-            'time': 600  # How long the pickup stays
-        }
+        point = SPAWNS.random_free_point(self.rng, near=(self.player.x, self.player.y))
+        if point is None:
+            return
+        x, y = point
         
-        if 'pickups' not in self.__dict__:
-            self.pickups = []
+        # Create the pickup; it stays for 600 ticks
+        pickup = RodPickup(self.new_id(), rod, x, y, 600)
         
-        self.pickups.append(pickup)
-        print(f"Spawned rod pickup: {rod} at ({x}, {y})")
+        self.pickups.add(pickup)
+        self.pickup_index.insert(pickup)
+        log.debug("Spawned rod pickup: %s at (%.2f, %.2f)", rod, x, y)
 
     def spawn_tackle_pickup(self):
         # Choose a random tackle type
-        tackle_type = random.choice(['flies', 'spinners', 'crankbaits'])
+        tackle_type = self.rng.choice(TACKLE_TYPES)
         
         # Determine amount based on type
         if tackle_type == 'flies':
-            amount = random.randint(5, 20)
+            amount = self.rng.randint(5, 20)
         elif tackle_type == 'spinners':
-            amount = random.randint(2, 8)
+            amount = self.rng.randint(2, 8)
         else:  # crankbaits
-            amount = random.randint(10, 30)
+            amount = self.rng.randint(10, 30)
         
         # Find a valid position
-        valid_position = False
-        x, y = 0, 0
+        point = SPAWNS.random_free_point(self.rng, near=(self.player.x, self.player.y))
+        if point is None:
+            return
+        x, y = point
         
-        while not valid_position:
-            x = random.uniform(1, len(MAP[0]) - 1)
-            y = random.uniform(1, len(MAP) - 1)
-            
-            # Check if position is valid (not in a wall)
-            if self.is_valid_position(x, y):
-                valid_position = True
+        # Create the pickup; it stays for 600 ticks
+        pickup = TacklePickup(self.new_id(), tackle_type, amount, x, y, 600)
         
-        # Create the pickup
-        pickup = {
-            'type': 'tackle',
-            'tackle_type': tackle_type,
-            'amount': amount,
-            'x': x,
-            'y': y,
-            'time': 600  # How long the pickup stays
-        }
+        self.pickups.add(pickup)
+        self.pickup_index.insert(pickup)
+        log.debug("Spawned %s %s pickup at (%.2f, %.2f)", amount, tackle_type, x, y)
+
+# Fish types, by FishArrays type code, that attack from range
+RANGED_FISH = (np.array([FISH_TYPES[name]['attack_type'] != 'melee' for name in FISH_TYPES])
+               if np is not None else None)
+
+class NumpyGame(Game):
+    # The same game with fish kept in NumPy arrays (fish_engine.FishArrays).
+    # Fish movement, the patrol/chase state machine, wall checks and cast
+    # hits run as batch operations; fish are handled by slot number instead
+    # of by dict.
+    #
+    # Casts, explosions, power-ups and pickups stay objects in their pools:
+    # rod cooldowns keep a player to a few casts in flight (four at most
+    # with the fastest rod), and each cast's hit test is already a single
+    # batch over every fish (fish_near), so arrays for them would add
+    # conversions without removing any per-fish work.
+    engine = 'numpy'
+    INDEXES = Game.INDEXES[1:]
+    
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.fish_arrays.attach_walls(LEVEL_WALLS)
+    
+    def clear_fish(self):
+        if not hasattr(self, 'fish_arrays'):
+            self.fish_arrays = FishArrays(FISH_TYPES, LEVEL_WALLS)
+            self.fish_rng = np.random.default_rng(self.rng.getrandbits(64))
+        self.fish_arrays.clear()
+    
+    @property
+    def fish(self):
+        return FishView(self.fish_arrays)
+    
+    def add_fish(self, fish):
+        self.fish_arrays.add(fish)
+    
+    def remove_fish(self, slot):
+        self.fish_arrays.remove(slot)
+    
+    def fish_positions(self):
+        arrays = self.fish_arrays
+        return list(zip(arrays.x[:arrays.count].tolist(), arrays.y[:arrays.count].tolist()))
+    
+    def fish_near(self, x, y, radius):
+        return self.fish_arrays.first_within(x, y, radius)
+    
+    def any_fish_within(self, x, y, radius):
+        return self.fish_arrays.any_within(x, y, radius)
+    
+    def damage_fish(self, slot, damage):
+        arrays = self.fish_arrays
+        fish_type = arrays.type_name(slot)
+        arrays.health[slot] -= damage
+        log.debug("Fish hit! Type: %s, health after: %s", fish_type, arrays.health[slot])
         
-        if 'pickups' not in self.__dict__:
-            self.pickups = []
+        if arrays.health[slot] <= 0:
+            log.debug("Fish caught! Type: %s, Points: %s", fish_type, FISH_TYPES[fish_type]['points'])
+            FISH_CAUGHT.inc()
+            self.score += FISH_TYPES[fish_type]['points']
+            self.remove_fish(slot)
+            self.spawn_fish(1)
+    
+    def hit_fish(self, index, damage):
+        count = len(self.fish_arrays)
+        if count and count > index:
+            self.damage_fish(index % count, damage)
+    
+    def _update_fish(self):
+        # Only the fish due this tick (see lod.py), as one batch
+        arrays = self.fish_arrays
+        player = self.player
+        slots = steps = None
+        if LOD:
+            slots, steps = AI_SCHEDULER.due_slots(arrays, player.x, player.y, player.angle, self.tick_count)
+        flow = FLOW_FIELDS.toward(player.x, player.y)
+        sight = partial(SIGHT_LINES.clear_lines, player.x, player.y)
+        for slot in arrays.step(player.x, player.y, self.fish_rng, flow, sight, slots, steps):
+            self.fish_bites_player(arrays.type_name(slot))
+        self._fish_attacks()
+    
+    def _fish_attacks(self):
+        arrays = self.fish_arrays
+        player = self.player
+        slots = arrays.attackers(player.x, player.y, FISH_ATTACK_RANGE, RANGED_FISH).tolist()
+        if not slots:
+            return
+        sight = SIGHT_LINES.clear_lines(player.x, player.y, arrays.x[slots].tolist(), arrays.y[slots].tolist())
+        for slot, clear in zip(slots, sight):
+            if clear:
+                self.fish_attack(slot)
+    
+    def fish_attack(self, slot):
+        arrays = self.fish_arrays
+        fish_x = float(arrays.x[slot])
+        fish_y = float(arrays.y[slot])
+        dx = self.player.x - fish_x
+        dy = self.player.y - fish_y
+        dist_sq = dx * dx + dy * dy
+        fish_type = arrays.type_name(slot)
+        attack_type = FISH_TYPES[fish_type]['attack_type']
         
-        self.pickups.append(pickup)
-        print(f"Spawned {amount} {tackle_type} pickup at ({x}, {y})")
+        if attack_type == 'charge' and dist_sq < CHARGE_RANGE * CHARGE_RANGE:
+            arrays.start_charge(slot, self.player.x, self.player.y, CHARGE_TICKS)
+        elif (attack_type == 'projectile' and dist_sq < PROJECTILE_RANGE * PROJECTILE_RANGE and
+              self.rng.random() < PROJECTILE_CHANCE):
+            self.projectiles.add(Projectile(self.new_id(), fish_x, fish_y, math.atan2(dy, dx), 0.1,
+                                            FISH_TYPES[fish_type]['damage'] / 2, 10))
+    
+    def fish_in_view(self, sees):
+        # Distance and cone tests over the arrays; only fish in the cone
+        # need a wall check
+        arrays = self.fish_arrays
+        player = self.player
+        near, cone = arrays.in_view(player.x, player.y, player.angle, INTEREST_FILTER.radius,
+                                    INTEREST_FILTER.cos_half_fov, INTEREST_FILTER.near)
+        clear_line = INTEREST_FILTER.clear_line
+        xs = arrays.x
+        ys = arrays.y
+        seen = [slot for slot in cone.tolist() if clear_line(player.x, player.y, xs[slot], ys[slot])]
+        slots = np.union1d(near, np.array(seen, dtype=np.intp))
+        hidden = np.delete(arrays.id[:arrays.count], slots)
+        return slots, hidden.tolist()
+    
+    def fish_wire(self, fish=None):
+        return self.fish_arrays.to_dicts(fish)
+    
+    def fish_binary(self, fish=None):
+        return self.fish_arrays.pack_wire(wire.POSITION_SCALE, wire.ANGLE_SCALE, fish)
+
+# FISH_ENGINE=numpy stores fish in NumPy arrays; the default keeps dicts
+FISH_ENGINE = os.environ.get('FISH_ENGINE', 'python')
+if FISH_ENGINE == 'numpy' and FishArrays is None:
+    log.warning("FISH_ENGINE=numpy but NumPy is not installed; using the Python engine")
+
+def make_game():
+    # JOURNAL_DIR turns on per-session input journals for replay.py
+    journal = Journal.create(JOURNAL_DIR) if JOURNAL_DIR else None
+    if FISH_ENGINE == 'numpy' and FishArrays is not None:
+        return NumpyGame(journal=journal)
+    return Game(journal=journal)
+
+# One Game per browser session, with LRU/TTL eviction. SESSION_STORE picks
+# where they live between workers (see session_store.py); on a clean exit
+# every changed game is written back so other workers can carry on with it.
+sessions = SessionRegistry(make_game, on_drop=lambda game: game.close(), store=make_store())
+atexit.register(sessions.sync, True)
+
+# On a chunked level, the chunks kept mapped in: around each player as far
+# as anything looks (spawning, flow fields, interest) and around each fish
+PLAYER_CHUNK_RADIUS = max(LOCAL_SPAWN_RADIUS, FLOW_RADIUS, INTEREST_RADIUS)
+FISH_CHUNK_RADIUS = 1
+
+def retain_level_chunks():
+    # Runs after each session sweep; see Level.retain
+    if not LEVEL_MAP.chunked:
+        return
+    areas = []
+    for game in sessions.games():
+        with game.lock:
+            areas.append((game.player.x, game.player.y, PLAYER_CHUNK_RADIUS))
+            areas.extend((x, y, FISH_CHUNK_RADIUS) for x, y in game.fish_positions())
+    LEVEL_MAP.retain(areas)
+
+# Fixed-rate simulation for all sessions in this worker
+ticker = TickLoop(sessions, timer=TICK_LOOP_SECONDS, on_sweep=retain_level_chunks)
+
+def count_entities():
+    counts = {'fish': 0, 'casts': 0, 'explosions': 0, 'power_ups': 0, 'pickups': 0}
+    for game in sessions.games():
+        counts['fish'] += len(game.fish)
+        counts['casts'] += len(game.player.casts)
+        counts['explosions'] += len(game.player.explosions)
+        counts['power_ups'] += len(game.power_ups)
+        counts['pickups'] += len(game.pickups)
+    return counts
+
+REGISTRY.gauge('fishing_entities', 'Live entities across all sessions', ['kind'], collect=count_entities)
+REGISTRY.gauge('fishing_sessions', 'Live game sessions in this worker',
+               collect=lambda: len(sessions))
+REGISTRY.gauge('fishing_session_bytes', 'Estimated bytes held by live sessions',
+               collect=lambda: sessions.total_bytes)
+REGISTRY.gauge('fishing_session_evictions', 'Sessions evicted since start', ['reason'],
+               collect=lambda: dict(sessions.evictions))
+REGISTRY.gauge('fishing_tick_loop_skipped', 'Ticks skipped because the loop fell behind',
+               collect=lambda: ticker.skipped_ticks)
 
-game = Game()
+def current_game():
+    if 'game' not in g:
+        ticker.start()
+        sid, game, created = sessions.get(request.cookies.get(SESSION_COOKIE))
+        g.sid = sid
+        g.game = game
+        g.new_session = created
+    return g.game
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    if 'request_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(
+            time.perf_counter() - g.request_started)
+    return response
+
+@app.after_request
+def set_session_cookie(response):
+    if g.get('new_session'):
+        # A browser-session cookie: the registry's sliding TTL decides when
+        # the game expires, so a player who keeps playing keeps their game
+        response.set_cookie(SESSION_COOKIE, g.sid, httponly=True, samesite='Lax')
+    elif 'sid' in g:
+        # Entity counts may have changed during the request
+        sessions.touch(g.sid)
+    return response
+
+def asset_response(asset):
+    # Best encoding the client takes, or 304 if it already has this version
+    encoding = request.accept_encodings.best_match(asset.encodings, default='identity')
+    etag = asset.etags[encoding]
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(asset.bodies[encoding], content_type=asset.content_type)
+        if encoding != 'identity':
+            response.content_encoding = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = asset.cache_control
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/')
 def home():
-    return render_template('index.html')
+    return asset_response(CLIENT.shell)
+
+@app.route('/client/<name>')
+def client_script(name):
+    # Only the current build; it is cached as immutable under this name
+    if name != CLIENT.script_name:
+        abort(404)
+    return asset_response(CLIENT.script)
+
+@app.route('/sessions')
+def session_stats():
+    stats = sessions.stats()
+    stats['tick_loop'] = ticker.stats()
+    stats['high_scores'] = HIGH_SCORES.stats()
+    stats['flow_fields'] = FLOW_FIELDS.stats()
+    stats['sight_lines'] = SIGHT_LINES.stats()
+    stats['level'] = dict(LEVEL_MAP.stats(), wire_bytes=LEVEL_ASSET.stats())
+    stats['client'] = CLIENT.stats()
+    if Sock is not None:
+        stats['streams'] = dict(streams, limit=MAX_STREAMS)
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics_route():
+    return app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def snapshot_response(game):
+    # JSON unless the client asks for the binary encoding
+    if request.accept_mimetypes.best_match(['application/json', wire.CONTENT_TYPE]) == wire.CONTENT_TYPE:
+        response = app.response_class(game.snapshot_binary(), mimetype=wire.CONTENT_TYPE)
+    else:
+        response = app.response_class(game.snapshot_json(), mimetype='application/json')
+    response.vary.add('Accept')
+    return response
+
+@app.route('/level')
+def get_level():
+    # The map the client draws; fixed for the life of the server
+    return asset_response(LEVEL_ASSET)
+
+@app.route('/wire-schema')
+def wire_schema():
+    # Name tables for decoding binary state; fixed for the life of the server
+    return jsonify(WIRE.schema())
 
 @app.route('/high-scores')
 def get_high_scores():
-    return jsonify(HIGH_SCORES)
+    return jsonify({'scores': HIGH_SCORES.top()})
 
 @app.route('/game-state')
 def get_game_state():
-    return jsonify(game.get_state())
+    game = current_game()
+    # ?delta=1 asks for a frame relative to the acknowledged version
+    if request.args.get('delta'):
+        return jsonify(game.frame(request.args.get('ack', type=int)))
+    return snapshot_response(game)
 
 @app.route('/change-lure', methods=['POST'])
 def change_lure():
@@ -1003,29 +1620,87 @@ def change_lure():
         game_state['player']['current_lure'] = new_lure
     return jsonify(game_state)
 
+class BadInput(ValueError):
+    pass
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def parse_input(item, numbered):
+    # One (seq, direction, amount, shoot) tuple, checked here so nothing the
+    # tick loop can't apply ever gets queued
+    if not isinstance(item, dict):
+        raise BadInput('input must be an object')
+    seq = item.get('seq') if numbered else None
+    if seq is not None and not (isinstance(seq, int) and not isinstance(seq, bool)):
+        raise BadInput('seq must be an integer')
+    direction = item.get('direction')
+    if direction is not None and direction not in INPUT_DIRECTIONS:
+        raise BadInput('unknown direction %r' % (direction,))
+    amount = item.get('amount', 1)
+    if not _is_number(amount) or not math.isfinite(amount) or abs(amount) > MAX_INPUT_AMOUNT:
+        raise BadInput('amount must be a number within +/-%s' % MAX_INPUT_AMOUNT)
+    shoot = item.get('shoot', False)
+    if shoot is None:
+        shoot = False
+    if not isinstance(shoot, bool):
+        raise BadInput('shoot must be true or false')
+    return seq, direction, amount, shoot
+
+def parse_inputs(data):
+    # (seq, direction, amount, shoot) tuples from {"inputs": [...]}, or one
+    # unnumbered input from the older single-input form. Raises BadInput on
+    # anything malformed; the whole batch is refused.
+    if not isinstance(data, dict):
+        raise BadInput('expected a JSON object')
+    if 'inputs' in data:
+        items = data['inputs']
+        if not isinstance(items, list):
+            raise BadInput('inputs must be a list')
+        inputs = [parse_input(item, True) for item in items[:MAX_INPUT_BATCH]]
+    else:
+        inputs = [parse_input(data, False)]
+    INPUT_BATCH_SIZE.observe(len(inputs))
+    return inputs
+
+def parse_spawn(data):
+    # Number of fish from {"count": n}; raises BadInput
+    if not isinstance(data, dict):
+        raise BadInput('expected a JSON object')
+    count = data.get('count', 1)
+    if not (isinstance(count, int) and not isinstance(count, bool)) or not 1 <= count <= MAX_SPAWN_COUNT:
+        raise BadInput('count must be an integer from 1 to %d' % MAX_SPAWN_COUNT)
+    return count
+
+def parse_hit(data):
+    # (index, damage) from {"index": i, "damage": d}; raises BadInput
+    if not isinstance(data, dict):
+        raise BadInput('expected a JSON object')
+    index = data.get('index', 0)
+    if not (isinstance(index, int) and not isinstance(index, bool)) or index < 0:
+        raise BadInput('index must be a non-negative integer')
+    damage = data.get('damage', 1)
+    if not _is_number(damage) or not math.isfinite(damage) or not 0 < damage <= MAX_HIT_DAMAGE:
+        raise BadInput('damage must be a number above 0 and at most %s' % MAX_HIT_DAMAGE)
+    return index, damage
+
 @app.route('/move', methods=['POST'])
 def move():
-    print("Move request received")
-    if game.game_over:
-        return jsonify(game.get_state())
-
-    data = request.get_json()
-    direction = data.get('direction')
-    shoot = data.get('shoot', False)
-    amount = data.get('amount', 1)
-    
-    print(f"Move data: direction={direction}, shoot={shoot}, amount={amount}")
+    game = current_game()
+    try:
+        inputs = parse_inputs(request.get_json(silent=True))
+    except BadInput as error:
+        return jsonify({'error': str(error)}), 400
+    sampled_log.debug("Move data: %d inputs, last %s", len(inputs), inputs[-1] if inputs else None)
     
-    if direction:
-        game.move_player(direction, amount)
+    # The tick loop applies the whole batch on its next tick (or drops it if
+    # the game is over); reply with the latest snapshot and the last input
+    # sequence number taken
+    ack = game.queue_inputs(inputs)
     
-    if shoot:
-        game.shoot()
-    
-    game.update()
-    state = game.get_state()
-    print(f"Move state: {state}")
-    return jsonify(state)
+    response = snapshot_response(game)
+    response.headers['X-Input-Ack'] = str(ack)
+    return response
 
 def update_fish_positions():
     for fish in game_state['fish'][:]:
@@ -1107,61 +1782,123 @@ def update_boss_position():
 
 @app.route('/reset', methods=['POST'])
 def reset():
-    print("Reset request received")
-    if game.game_over:
-        save_high_score(game.score)
-    game.reset()
-    state = game.get_state()
-    print(f"Reset state: {state}")
-    return jsonify(state)
+    game = current_game()
+    with game.lock:
+        if game.game_over:
+            save_high_score(game.score)
+        game.act('reset', game.clock())
+    return snapshot_response(game)
+
+if Sock is not None:
+    sock = Sock(app)
+
+    # Open streams, and those turned away at MAX_STREAMS
+    streams = {'open': 0, 'refused': 0}
+    streams_lock = threading.Lock()
+
+    @sock.route('/stream')
+    def stream(ws):
+        with streams_lock:
+            busy = streams['open'] >= MAX_STREAMS
+            if busy:
+                streams['refused'] += 1
+                STREAMS_REFUSED.inc()
+            else:
+                streams['open'] += 1
+        if busy:
+            ws.close(reason=STREAM_CLOSE_BUSY, message='too many streams, poll instead')
+            return
+        try:
+            serve_stream(ws)
+        finally:
+            with streams_lock:
+                streams['open'] -= 1
+
+    def serve_stream(ws):
+        # Push every new state over one connection and take inputs on it too
+        game = current_game()
+        sid = g.sid
+        seen_version = -1
+        acked = None  # the client starts with a keyframe
+        last_keep_alive = time.monotonic()
+        
+        while True:
+            # Apply whatever input arrived since the last push
+            message = ws.receive(timeout=0)
+            while message is not None:
+                try:
+                    data = json.loads(message)
+                except ValueError:
+                    data = None
+                if not isinstance(data, dict):
+                    ws.close(reason=STREAM_CLOSE_BAD_MESSAGE, message='messages must be JSON objects')
+                    return
+                if 'ack' in data:
+                    acked = data['ack']
+                if data.get('resync'):
+                    acked = None
+                    seen_version = -1
+                if 'inputs' in data or data.get('direction') or data.get('shoot'):
+                    try:
+                        game.queue_inputs(parse_inputs(data))
+                    except BadInput as error:
+                        ws.close(reason=STREAM_CLOSE_BAD_MESSAGE, message=str(error))
+                        return
+                message = ws.receive(timeout=0)
+            
+            # Streaming clients make no HTTP requests, so keep the session ticking
+            now = time.monotonic()
+            if now - last_keep_alive >= 1.0:
+                if not sessions.keep_alive(sid):
+                    ws.close(reason=1001, message='session expired')
+                    return
+                last_keep_alive = now
+            
+            version = game.wait_for_change(seen_version, ticker.interval)
+            if version != seen_version:
+                ws.send(json.dumps(game.frame(acked), separators=(',', ':')))
+                seen_version = version
+
+    REGISTRY.gauge('fishing_streams', 'Open state streams in this worker', collect=lambda: streams['open'])
+    REGISTRY.gauge('fishing_streams_limit', 'MAX_STREAMS for this worker', collect=lambda: MAX_STREAMS)
 
 @app.route('/spawn-fish', methods=['POST'])
 def spawn_fish_route():
-    print("Spawn fish request received")
-    data = request.get_json()
-    count = data.get('count', 1)
-    
-    game.spawn_fish(count)
+    game = current_game()
+    try:
+        count = parse_spawn(request.get_json(silent=True))
+    except BadInput as error:
+        return jsonify({'error': str(error)}), 400
     
-    state = game.get_state()
-    print(f"After spawning fish: {len(state['fish'])} fish in game")
-    return jsonify(state)
+    with game.lock:
+        # Never past MAX_SPAWNED_FISH, however many requests come in
+        count = min(count, MAX_SPAWNED_FISH - len(game.fish))
+        if count > 0:
+            game.act('spawn_fish', count)
+        log.debug("After spawning fish: %d fish in game", len(game.fish))
+    return snapshot_response(game)
 
 @app.route('/hit-fish', methods=['POST'])
 def hit_fish_route():
-    print("Hit fish request received")
-    data = request.get_json()
-    index = data.get('index', 0)
-    damage = data.get('damage', 1)
+    game = current_game()
+    try:
+        index, damage = parse_hit(request.get_json(silent=True))
+    except BadInput as error:
+        return jsonify({'error': str(error)}), 400
     
-    if game.fish and len(game.fish) > index:
-        fish = game.fish[index]
-        fish['health'] -= damage
-        
-        print(f"Fish hit directly! Type: {fish['type']}, Health: {fish['health']}")
-        
-        if fish['health'] <= 0:
-            # Fish is caught
-            game.score += FISH_TYPES[fish['type']]['points']
-            game.fish.pop(index)
-            # Spawn a new fish
-            game.spawn_fish(1)
+    game.act('hit_fish', index, damage)
     
-    state = game.get_state()
-    return jsonify(state)
+    return snapshot_response(game)
 
 @app.route('/switch-rod', methods=['POST'])
 def switch_rod():
+    game = current_game()
     data = request.get_json()
     rod = data.get('rod')
     
-    if rod in RODS and rod in game.player['rods']:
-        game.player['current_rod'] = rod
-        print(f"Switched to rod: {rod}")
-    else:
-        print(f"Cannot switch to rod: {rod}")
+    game.act('switch_rod', rod)
     
-    return jsonify(game.get_state())
+    return snapshot_response(game)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,103 @@
+import math
+from operator import attrgetter
+
+
+class SpatialHash:
+    # Uniform grid of buckets laid over the level cells. Entities need id, x
+    # and y attributes; call move() whenever an indexed entity changes
+    # position so it stays in the right bucket.
+    def __init__(self, width, height, cell_size=1.0):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.inv_cell_size = 1.0 / cell_size
+        self.buckets = {}  # (col, row) -> {id: entity}
+        self.cells = {}    # id -> (col, row)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def _cell(self, x, y):
+        return (int(math.floor(x * self.inv_cell_size)), int(math.floor(y * self.inv_cell_size)))
+
+    def insert(self, entity):
+        cell = self._cell(entity.x, entity.y)
+        self.cells[entity.id] = cell
+        self.buckets.setdefault(cell, {})[entity.id] = entity
+
+    def remove(self, entity):
+        cell = self.cells.pop(entity.id, None)
+        if cell is None:
+            return
+        bucket = self.buckets[cell]
+        del bucket[entity.id]
+        if not bucket:
+            del self.buckets[cell]
+
+    def move(self, entity):
+        # Cheap when the entity stays inside its cell, which is most ticks
+        cell = self._cell(entity.x, entity.y)
+        old = self.cells.get(entity.id)
+        if old == cell:
+            return
+        if old is not None:
+            bucket = self.buckets[old]
+            del bucket[entity.id]
+            if not bucket:
+                del self.buckets[old]
+        self.cells[entity.id] = cell
+        self.buckets.setdefault(cell, {})[entity.id] = entity
+
+    def clear(self):
+        self.buckets.clear()
+        self.cells.clear()
+
+    def _candidates(self, x, y, radius):
+        col0, row0 = self._cell(x - radius, y - radius)
+        col1, row1 = self._cell(x + radius, y + radius)
+
+        # A wide query over a sparse grid is cheaper as a straight scan
+        if (col1 - col0 + 1) * (row1 - row0 + 1) >= len(self.buckets):
+            for bucket in self.buckets.values():
+                yield from bucket.values()
+            return
+
+        buckets = self.buckets
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                bucket = buckets.get((col, row))
+                if bucket:
+                    yield from bucket.values()
+
+    def query(self, x, y, radius):
+        # Entities strictly closer than radius to (x, y), oldest id first so
+        # results match iteration order of the owning list
+        radius_sq = radius * radius
+        found = []
+        for entity in self._candidates(x, y, radius):
+            dx = entity.x - x
+            dy = entity.y - y
+            if dx * dx + dy * dy < radius_sq:
+                found.append(entity)
+        found.sort(key=attrgetter('id'))
+        return found
+
+    def first(self, x, y, radius):
+        # Oldest entity within radius, or None
+        radius_sq = radius * radius
+        best = None
+        for entity in self._candidates(x, y, radius):
+            dx = entity.x - x
+            dy = entity.y - y
+            if dx * dx + dy * dy < radius_sq and (best is None or entity.id < best.id):
+                best = entity
+        return best
+
+    def any_within(self, x, y, radius):
+        radius_sq = radius * radius
+        for entity in self._candidates(x, y, radius):
+            dx = entity.x - x
+            dy = entity.y - y
+            if dx * dx + dy * dy < radius_sq:
+                return True
+        return False
@@ -0,0 +1,164 @@
+import math
+import os
+
+# How far from the player random_free_point(near=...) looks on maps too big
+# to spawn just anywhere (see levels.py)
+LOCAL_SPAWN_RADIUS = float(os.environ.get('LOCAL_SPAWN_RADIUS', 32))
+
+
+class SpawnIndex:
+    # Free cells of a CollisionMap, for picking random spawn points in
+    # bounded time. Every query looks at a fixed set of candidate cells and
+    # returns None when no point qualifies instead of retrying forever.
+    #
+    # With local_radius set, random_free_point() given a `near` point only
+    # looks within local_radius of it, so the cost and the cells touched
+    # don't grow with the map.
+    def __init__(self, collision, tries_per_cell=8, free_cells=None, local_radius=None):
+        self.collision = collision
+        self.tries_per_cell = tries_per_cell
+        self.local_radius = local_radius
+        # Cell indexes (row * width + col) in index order; a compiled level
+        # brings its own list
+        if free_cells is None:
+            free_cells = [index for index, blocked in enumerate(collision.blocked) if not blocked]
+        self.free_cells = free_cells
+        # (key, candidate cells) of the last ring query; spawning several
+        # fish around the same spot reuses them. Stored as one tuple so
+        # threads sharing the index never see a mismatched pair.
+        self._ring_cache = (None, None)
+
+    @staticmethod
+    def _cell_distances(col, row, x, y):
+        # Nearest and farthest distance from (x, y) to the unit cell
+        near_x = max(col - x, 0.0, x - (col + 1))
+        near_y = max(row - y, 0.0, y - (row + 1))
+        far_x = max(abs(x - col), abs(x - (col + 1)))
+        far_y = max(abs(y - row), abs(y - (row + 1)))
+        return math.hypot(near_x, near_y), math.hypot(far_x, far_y)
+
+    def point_in_ring(self, rng, x, y, min_radius, max_radius, avoid=None, avoid_radius=0.0):
+        # Random free point with min_radius <= distance to (x, y) < max_radius,
+        # and at least avoid_radius from the point `avoid` if given
+        key = (x, y, min_radius, max_radius, avoid, avoid_radius)
+        cached_key, cells = self._ring_cache
+        if key != cached_key:
+            cells = self._ring_cells(x, y, min_radius, max_radius, avoid, avoid_radius)
+            self._ring_cache = (key, cells)
+        candidates = list(cells)
+
+        min_sq = min_radius * min_radius
+        max_sq = max_radius * max_radius
+        avoid_sq = avoid_radius * avoid_radius
+
+        def accept(px, py):
+            dx = px - x
+            dy = py - y
+            dist_sq = dx * dx + dy * dy
+            if dist_sq < min_sq or dist_sq >= max_sq:
+                return False
+            if avoid is not None:
+                dx = px - avoid[0]
+                dy = py - avoid[1]
+                if dx * dx + dy * dy < avoid_sq:
+                    return False
+            return True
+
+        return self._pick(rng, candidates, accept)
+
+    def _ring_cells(self, x, y, min_radius, max_radius, avoid, avoid_radius):
+        collision = self.collision
+        col0 = max(0, int(math.floor(x - max_radius)))
+        col1 = min(collision.width - 1, int(math.floor(x + max_radius)))
+        row0 = max(0, int(math.floor(y - max_radius)))
+        row1 = min(collision.height - 1, int(math.floor(y + max_radius)))
+
+        candidates = []
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                if not collision.free_cell(col, row):
+                    continue
+                near, far = self._cell_distances(col, row, x, y)
+                if far < min_radius or near >= max_radius:
+                    continue
+                # Cells wholly inside the ring (and clear of `avoid`) take any point
+                exact = near >= min_radius and far < max_radius
+                if avoid is not None:
+                    avoid_near, avoid_far = self._cell_distances(col, row, avoid[0], avoid[1])
+                    if avoid_far < avoid_radius:
+                        continue
+                    exact = exact and avoid_near >= avoid_radius
+                candidates.append((col, row, exact))
+        return candidates
+
+    def random_free_point(self, rng, avoid=None, avoid_radius=0.0, near=None):
+        # Random free point anywhere on the map, or within local_radius of
+        # `near` if both are set, optionally at least avoid_radius from
+        # `avoid`
+        if near is not None and self.local_radius is not None:
+            return self._local_free_point(rng, near[0], near[1], avoid, avoid_radius)
+
+        free_cells = self.free_cells
+        width = self.collision.width
+        if not free_cells:
+            return None
+        if avoid is None:
+            row, col = divmod(free_cells[rng.randrange(len(free_cells))], width)
+            return col + rng.random(), row + rng.random()
+
+        # A few cheap draws usually succeed; otherwise narrow down the cells
+        avoid_sq = avoid_radius * avoid_radius
+        for _ in range(self.tries_per_cell):
+            row, col = divmod(free_cells[rng.randrange(len(free_cells))], width)
+            px = col + rng.random()
+            py = row + rng.random()
+            dx = px - avoid[0]
+            dy = py - avoid[1]
+            if dx * dx + dy * dy >= avoid_sq:
+                return px, py
+
+        candidates = []
+        for index in free_cells:
+            row, col = divmod(index, width)
+            avoid_near, avoid_far = self._cell_distances(col, row, avoid[0], avoid[1])
+            if avoid_far >= avoid_radius:
+                candidates.append((col, row, avoid_near >= avoid_radius))
+
+        def accept(px, py):
+            dx = px - avoid[0]
+            dy = py - avoid[1]
+            return dx * dx + dy * dy >= avoid_sq
+
+        return self._pick(rng, candidates, accept)
+
+    def _local_free_point(self, rng, x, y, avoid, avoid_radius):
+        # A few cheap draws from the square around (x, y) usually succeed;
+        # otherwise list the cells of the disc
+        radius = self.local_radius
+        collision = self.collision
+        avoid_sq = avoid_radius * avoid_radius
+        for _ in range(self.tries_per_cell):
+            px = x + rng.uniform(-radius, radius)
+            py = y + rng.uniform(-radius, radius)
+            if (px - x) ** 2 + (py - y) ** 2 >= radius * radius or not collision.is_free(px, py):
+                continue
+            if avoid is None or (px - avoid[0]) ** 2 + (py - avoid[1]) ** 2 >= avoid_sq:
+                return px, py
+        return self.point_in_ring(rng, x, y, 0.0, radius, avoid, avoid_radius)
+
+    def _pick(self, rng, candidates, accept):
+        # Try random candidate cells, dropping each one that fails; at most
+        # len(candidates) * tries_per_cell samples
+        while candidates:
+            i = rng.randrange(len(candidates))
+            col, row, exact = candidates[i]
+            if exact:
+                return col + rng.random(), row + rng.random()
+            for _ in range(self.tries_per_cell):
+                px = col + rng.random()
+                py = row + rng.random()
+                if accept(px, py):
+                    return px, py
+            candidates[i] = candidates[-1]
+            candidates.pop()
+        return None
@@ -0,0 +1,33 @@
+import json
+import os
+import platform
+
+import pytest
+
+import bench
+
+with open(bench.BASELINE_FILE) as f:
+    BASELINE = json.load(f)
+
+
+def run_tick_cases():
+    # Same shape as bench.run_all, with the baseline's settings
+    results = {key: BASELINE[key] for key in ('engine', 'seed', 'ticks')}
+    results['cases'] = {}
+    for fish, casts in bench.DEFAULT_CASES:
+        results['cases']['tick fish=%d casts=%d' % (fish, casts)] = bench.run_tick_case(
+            BASELINE['seed'], BASELINE['ticks'], fish, casts, BASELINE['engine'])
+    return results
+
+
+def test_tick_cases_end_in_the_baseline_state():
+    assert bench.compare_digests(run_tick_cases(), BASELINE) == []
+
+
+# Timings depend on the machine, so they are only compared when asked for,
+# on the host that recorded the baseline
+@pytest.mark.skipif(not os.environ.get('BENCH_TIMINGS'), reason='set BENCH_TIMINGS=1 to compare timings')
+def test_tick_cases_keep_their_speed():
+    if BASELINE.get('host') != platform.node():
+        pytest.skip('baseline was recorded on %s' % BASELINE.get('host'))
+    assert bench.compare(run_tick_cases(), BASELINE, bench.DEFAULT_TOLERANCE) == []
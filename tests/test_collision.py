@@ -0,0 +1,122 @@
+import json
+import math
+import random
+
+import levels
+from collision import CollisionMap
+
+
+def random_grid(width, height, seed, density=0.25):
+    rng = random.Random(seed)
+    return [[1 if rng.random() < density else 0 for _ in range(width)] for _ in range(height)]
+
+
+def chunked_map(grid, monkeypatch):
+    # The same grid compiled and read in place as a chunked level
+    monkeypatch.setattr(levels, 'FLAT_LEVEL_CELLS', 0)
+    source = json.dumps({'grid': [''.join(map(str, row)) for row in grid]}).encode()
+    level = levels.Level('test', levels.compile_level(source))
+    assert level.chunked
+    return level.collision_map()
+
+
+def brute_force_sweep(grid, x0, y0, x1, y1):
+    # First wall cell the segment enters, by intersecting it with every
+    # wall cell, and the ring just outside the map, that its bounding box
+    # touches
+    height = len(grid)
+    width = len(grid[0])
+    dx = x1 - x0
+    dy = y1 - y0
+    first = None
+    rows = range(max(-1, math.floor(min(y0, y1))), min(height, math.floor(max(y0, y1))) + 1)
+    cols = range(max(-1, math.floor(min(x0, x1))), min(width, math.floor(max(x0, x1))) + 1)
+    for row in rows:
+        for col in cols:
+            if 0 <= row < height and 0 <= col < width and not grid[row][col]:
+                continue
+            t_enter, t_exit = 0.0, 1.0
+            for start, step, low in ((x0, dx, col), (y0, dy, row)):
+                if step == 0:
+                    if not low <= start < low + 1:
+                        t_enter, t_exit = 1.0, 0.0
+                    continue
+                t0 = (low - start) / step
+                t1 = (low + 1 - start) / step
+                t_enter = max(t_enter, min(t0, t1))
+                t_exit = min(t_exit, max(t0, t1))
+            if t_enter < t_exit and (first is None or t_enter < first):
+                first = t_enter
+    if first is None:
+        return False, x1, y1
+    return True, x0 + dx * first, y0 + dy * first
+
+
+def assert_same_sweeps(collision, grid, seed, count=2000):
+    rng = random.Random(seed)
+    height = len(grid)
+    width = len(grid[0])
+    checked = 0
+    while checked < count:
+        x0 = rng.uniform(0, width)
+        y0 = rng.uniform(0, height)
+        if grid[int(y0)][int(x0)]:
+            continue
+        # Mostly short moves, some running off the map
+        reach = rng.choice((0.5, 2, 8, 30))
+        x1 = x0 + rng.uniform(-reach, reach)
+        y1 = y0 + rng.uniform(-reach, reach)
+        hit, x, y = collision.sweep(x0, y0, x1, y1)
+        expected_hit, expected_x, expected_y = brute_force_sweep(grid, x0, y0, x1, y1)
+        assert hit == expected_hit, (x0, y0, x1, y1)
+        assert math.isclose(x, expected_x, abs_tol=1e-9) and math.isclose(y, expected_y, abs_tol=1e-9)
+        checked += 1
+
+
+def test_sweep_matches_brute_force():
+    for seed in range(3):
+        grid = random_grid(23, 17, seed)
+        assert_same_sweeps(CollisionMap(grid), grid, seed)
+
+
+def test_chunked_sweep_matches_brute_force(monkeypatch):
+    # Wider than a chunk, so sweeps cross chunk edges
+    grid = random_grid(150, 70, 5, density=0.1)
+    assert_same_sweeps(chunked_map(grid, monkeypatch), grid, 5)
+
+
+def test_chunked_map_matches_flat(monkeypatch):
+    grid = random_grid(150, 70, 9)
+    flat = CollisionMap(grid)
+    chunked = chunked_map(grid, monkeypatch)
+    for row in range(-1, 71):
+        for col in range(-1, 151):
+            assert chunked.free_cell(col, row) == flat.free_cell(col, row)
+            if flat.free_cell(col, row):
+                assert chunked.clearance_at(col, row) == flat.clearance_at(col, row)
+    assert chunked.window(60, 3, 10, 64) == flat.window(60, 3, 10, 64)
+
+
+def test_map_borders_are_walls():
+    collision = CollisionMap([[0] * 10 for _ in range(8)])
+    assert collision.sweep(5.5, 4.5, -3, 4.5) == (True, 0.0, 4.5)
+    assert collision.sweep(5.5, 4.5, 14, 4.5) == (True, 10.0, 4.5)
+    assert collision.sweep(5.5, 4.5, 5.5, -0.5) == (True, 5.5, 0.0)
+    assert collision.sweep(5.5, 4.5, 5.5, 8.0) == (True, 5.5, 8.0)
+    assert collision.sweep(5.5, 4.5, 0.5, 4.5) == (False, 0.5, 4.5)
+    assert not collision.is_free(10, 4)
+    assert not collision.is_free(-0.01, 4)
+
+
+def test_sweep_from_inside_a_wall():
+    grid = [[0, 0, 0], [0, 1, 0], [0, 0, 0]]
+    assert CollisionMap(grid).sweep(1.5, 1.5, 0.5, 0.5) == (True, 1.5, 1.5)
+
+
+def test_clearance_counts_free_rings():
+    grid = [[0] * 7 for _ in range(7)]
+    grid[0][0] = 1
+    collision = CollisionMap(grid)
+    assert collision.clearance_at(3, 3) == 2
+    assert collision.clearance_at(1, 1) == 0
+    assert collision.clearance_at(6, 6) == 0
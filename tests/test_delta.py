@@ -0,0 +1,63 @@
+import copy
+import json
+
+import delta
+import snake_game
+
+
+def play(ticks, seed=7):
+    # Flattened states of a game driven with some movement and casting
+    game = snake_game.Game(seed=seed, clock=lambda: 0.0)
+    game.player.tackle_box = {'flies': 1000, 'spinners': 1000, 'crankbaits': 1000}
+    game.player.health = 10 ** 6
+    states = []
+    for tick in range(ticks):
+        game.queue_input(('FORWARD', 'LEFT', 'FORWARD', 'RIGHT')[tick // 10 % 4], 1, tick % 3 == 0)
+        if tick % 25 == 0:
+            game.spawn_fish(3)
+        game.tick()
+        states.append(delta.flatten(game.get_state()))
+    return states
+
+
+def over_the_wire(frame):
+    return json.loads(json.dumps(frame))
+
+
+def test_keyframe_round_trip():
+    for flat in play(30)[::10]:
+        assert delta.apply(None, over_the_wire(delta.keyframe(1, flat))) == flat
+
+
+def test_diff_round_trip_every_tick():
+    states = play(120)
+    for base, flat in zip(states, states[1:]):
+        assert delta.apply(base, over_the_wire(delta.diff(1, base, 2, flat))) == flat
+
+
+def test_diff_round_trip_across_many_ticks():
+    # Clients acknowledge late, so bases can be dozens of ticks old
+    states = play(120)
+    for gap in (5, 40, 100):
+        for i in range(0, len(states) - gap, 17):
+            base, flat = states[i], states[i + gap]
+            assert delta.apply(base, over_the_wire(delta.diff(1, base, 2, flat))) == flat
+
+
+def test_unchanged_state_sends_nothing():
+    flat = play(5)[-1]
+    assert delta.diff(4, flat, 5, flat) == {'seq': 5, 'base': 4}
+
+
+def test_entities_removed_added_and_reshaped():
+    base = next(flat for flat in reversed(play(40)) if flat['casts'])
+    flat = copy.deepcopy(base)
+    # Every fish gone, a new one, and a cast that gained a field
+    flat['fish'] = {10 ** 6: {'id': 10 ** 6, 'x': 1.5, 'y': 2.5}}
+    for cast in flat['casts'].values():
+        cast['hooked'] = True
+    frame = delta.diff(1, base, 2, flat)
+    assert sorted(frame['fish']['del']) == sorted(base['fish'])
+    assert frame['fish']['add'] == [flat['fish'][10 ** 6]]
+    assert len(frame['casts']['add']) == len(flat['casts'])
+    assert delta.apply(base, over_the_wire(frame)) == flat
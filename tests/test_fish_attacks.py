@@ -0,0 +1,102 @@
+import math
+
+import pytest
+
+import snake_game
+from entities import Fish, Projectile
+
+# On the lake level, a wall stands at column 9 of rows 1 and 2
+PLAYER = (8.5, 1.5)
+BEHIND_WALL = (10.5, 1.5)
+IN_SIGHT = (8.5, 3.5)
+
+ENGINES = ['python', 'numpy']
+
+
+def make_game(engine):
+    if engine == 'numpy':
+        if snake_game.FishArrays is None:
+            pytest.skip('NumPy is not installed')
+        game = snake_game.NumpyGame(seed=1, clock=lambda: 0.0)
+    else:
+        game = snake_game.Game(seed=1, clock=lambda: 0.0)
+    game.clear_fish()
+    game.player.x, game.player.y = PLAYER
+    # Fire whenever a projectile fish may
+    game.rng.random = lambda: 0.0
+    return game
+
+
+def add_fish(game, fish_type, position):
+    props = snake_game.FISH_TYPES[fish_type]
+    game.add_fish(Fish(game.new_id(), position[0], position[1], fish_type, props['speed'],
+                       props['health'], 0.0))
+
+
+def fish_state(game):
+    fish = game.fish[0]
+    return fish['state'] if isinstance(fish, dict) else fish.state
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_fish_behind_a_wall_does_not_charge(engine):
+    game = make_game(engine)
+    add_fish(game, 'bass', BEHIND_WALL)
+    game._fish_attacks()
+    assert fish_state(game) == 'patrol'
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_fish_in_sight_charges(engine):
+    game = make_game(engine)
+    add_fish(game, 'bass', IN_SIGHT)
+    game._fish_attacks()
+    assert fish_state(game) == 'charge'
+    assert (game.fish[0]['target_x'] if engine == 'numpy' else game.fish[0].target_x) == PLAYER[0]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_fish_behind_a_wall_does_not_shoot(engine):
+    game = make_game(engine)
+    add_fish(game, 'pike', BEHIND_WALL)
+    game._fish_attacks()
+    assert len(game.projectiles) == 0
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_fish_in_sight_shoots(engine):
+    game = make_game(engine)
+    add_fish(game, 'pike', IN_SIGHT)
+    game._fish_attacks()
+    assert len(game.projectiles) == 1
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_charging_fish_closes_in(engine):
+    game = make_game(engine)
+    add_fish(game, 'bass', IN_SIGHT)
+    game._fish_attacks()
+    before = math.dist(PLAYER, game.fish_positions()[0])
+    game._update_fish()
+    assert fish_state(game) == 'charge'
+    assert math.dist(PLAYER, game.fish_positions()[0]) < before
+
+
+def test_projectile_hits_the_player():
+    game = make_game('python')
+    health = game.player.health
+    game.projectiles.add(Projectile(game.new_id(), IN_SIGHT[0], IN_SIGHT[1], -math.pi / 2, 0.1, 2, 10))
+    for _ in range(30):
+        game._update_projectiles()
+    assert len(game.projectiles) == 0
+    assert game.player.health == health - 2
+
+
+def test_projectile_stops_at_a_wall():
+    game = make_game('python')
+    health = game.player.health
+    game.projectiles.add(Projectile(game.new_id(), BEHIND_WALL[0], BEHIND_WALL[1], math.pi, 0.1, 2, 10))
+    for _ in range(30):
+        game._update_projectiles()
+    assert len(game.projectiles) == 0
+    assert game.player.health == health
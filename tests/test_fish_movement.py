@@ -0,0 +1,84 @@
+import json
+import random
+
+import pytest
+
+import levels
+import snake_game
+from collision import CollisionMap
+from entities import Fish
+from test_collision import random_grid
+
+np = pytest.importorskip('numpy')
+from fish_engine import FishArrays  # noqa: E402
+
+# On the lake level, a wall one cell thick stands at column 9 of rows 1
+# and 2, with open water either side
+BEFORE_WALL = (8.7, 1.5)
+PAST_WALL = (10.3, 1.5)
+PLAYER = (8.5, 3.5)
+
+ENGINES = ['python', 'numpy']
+
+
+def chunked_level(grid, monkeypatch):
+    monkeypatch.setattr(levels, 'FLAT_LEVEL_CELLS', 0)
+    source = json.dumps({'grid': [''.join(map(str, row)) for row in grid]}).encode()
+    return levels.Level('test', levels.compile_level(source))
+
+
+def random_segments(width, height, seed, count=2000):
+    rng = random.Random(seed)
+    segments = []
+    for _ in range(count):
+        x0 = rng.uniform(-0.5, width + 0.5)
+        y0 = rng.uniform(-0.5, height + 0.5)
+        length = rng.uniform(0, 3)
+        angle = rng.uniform(0, 6.3)
+        segments.append((x0, y0, x0 + length * np.cos(angle), y0 + length * np.sin(angle)))
+    return np.array(segments).T
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_clear_paths_match_sweep(seed):
+    grid = random_grid(24, 20, seed)
+    collision = CollisionMap(grid)
+    arrays = FishArrays(snake_game.FISH_TYPES, np.array(grid, dtype=np.uint8))
+    x0, y0, x1, y1 = random_segments(24, 20, seed)
+    clear = arrays.clear_paths(x0, y0, x1, y1)
+    expected = [not collision.sweep(*segment)[0] for segment in zip(x0, y0, x1, y1)]
+    assert clear.tolist() == expected
+
+
+def test_clear_paths_match_sweep_on_chunks(monkeypatch):
+    grid = random_grid(40, 36, 7)
+    collision = CollisionMap(grid)
+    arrays = FishArrays(snake_game.FISH_TYPES, chunked_level(grid, monkeypatch).wall_array())
+    assert arrays.chunk_size is not None
+    x0, y0, x1, y1 = random_segments(40, 36, 7)
+    expected = [not collision.sweep(*segment)[0] for segment in zip(x0, y0, x1, y1)]
+    assert arrays.clear_paths(x0, y0, x1, y1).tolist() == expected
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_fish_do_not_cross_a_thin_wall(engine):
+    if engine == 'numpy':
+        if snake_game.FishArrays is None:
+            pytest.skip('NumPy is not installed')
+        game = snake_game.NumpyGame(seed=1, clock=lambda: 0.0)
+    else:
+        game = snake_game.Game(seed=1, clock=lambda: 0.0)
+    game.clear_fish()
+    game.player.x, game.player.y = PLAYER
+
+    # Fast enough to jump the wall's width in one tick, ending in open water
+    fish = Fish(game.new_id(), BEFORE_WALL[0], BEFORE_WALL[1], 'bluegill', 0.8, 3, 0.0)
+    fish.state = 'charge'
+    fish.state_timer = 100
+    fish.target_x, fish.target_y = PAST_WALL
+    game.add_fish(fish)
+    assert snake_game.COLLISION.is_free(*PAST_WALL)
+
+    game._update_fish()
+    x, y = game.fish_positions()[0]
+    assert (x, y) == BEFORE_WALL
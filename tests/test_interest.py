@@ -0,0 +1,59 @@
+import json
+import math
+
+import pytest
+
+import snake_game
+from entities import Fish
+from interest import INTEREST_REFRESH_TICKS
+
+# An open row of the lake level
+PLAYER = (12.5, 10.5)
+FISH = (15.5, 10.5)
+
+ENGINES = ['python', 'numpy']
+
+
+def make_game(engine):
+    if engine == 'numpy':
+        if snake_game.FishArrays is None:
+            pytest.skip('NumPy is not installed')
+        game = snake_game.NumpyGame(seed=1, clock=lambda: 0.0)
+    else:
+        game = snake_game.Game(seed=1, clock=lambda: 0.0)
+    game.clear_fish()
+    game.player.x, game.player.y = PLAYER
+    fish = Fish(game.new_id(), FISH[0], FISH[1], 'bluegill', 0.04, 3, 0.0)
+    game.add_fish(fish)
+    return game, fish.id
+
+
+def snapshots(game):
+    yield json.loads(game.snapshot_json())
+    yield snake_game.WIRE.decode(game.snapshot_binary())
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_fish_leaving_the_view_cone_stays_on_the_client(engine):
+    if not snake_game.INTEREST:
+        pytest.skip('interest management is off')
+    game, fish_id = make_game(engine)
+    kept = {}
+    seen_hidden = False
+    # Turn away from the fish a step at a time on ticks that filter, so it
+    # crosses the edge of the cone
+    for step in range(13):
+        game.tick_count = 1 + step % (INTEREST_REFRESH_TICKS - 1)
+        game.player.angle = step * math.pi / 12
+        game.mark_dirty()
+        for state in snapshots(game):
+            ids = [fish['id'] for fish in state['fish']]
+            hidden = state.get('hidden', {}).get('fish', [])
+            # Every full state either sends the fish or says it left it out
+            assert (fish_id in ids) != (fish_id in hidden)
+            seen_hidden |= fish_id in hidden
+            # ... so a client keeping hidden entities never loses it
+            if fish_id in ids:
+                kept[fish_id] = state['fish'][ids.index(fish_id)]
+            assert fish_id in kept
+    assert seen_hidden
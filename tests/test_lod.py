@@ -0,0 +1,77 @@
+import pytest
+
+import snake_game
+from entities import Fish
+from lod import AIScheduler
+
+# An open row of the lake level; the player faces along it (angle 0)
+PLAYER = (12.5, 10.5)
+IN_VIEW = (15.5, 10.5)
+BEHIND = (3.5, 10.5)
+
+ENGINES = ['python', 'numpy']
+
+
+def make_game(engine):
+    if engine == 'numpy':
+        if snake_game.FishArrays is None:
+            pytest.skip('NumPy is not installed')
+        game = snake_game.NumpyGame(seed=1, clock=lambda: 0.0)
+    else:
+        game = snake_game.Game(seed=1, clock=lambda: 0.0)
+    game.clear_fish()
+    game.player.x, game.player.y = PLAYER
+    game.player.angle = 0.0
+    return game
+
+
+def add_fish(game, position):
+    fish = Fish(game.new_id(), position[0], position[1], 'bluegill', 0.04, 3, 0.0)
+    fish.state_timer = 1000
+    game.add_fish(fish)
+    return fish
+
+
+def test_scheduler_takes_fish_in_view_and_one_bucket():
+    scheduler = AIScheduler(far_ticks=4)
+    game = make_game('python')
+    behind = add_fish(game, BEHIND)
+    in_view = add_fish(game, IN_VIEW)
+    buckets = scheduler.buckets(game.fish)
+
+    runs = []
+    for tick in range(1, 9):
+        due = scheduler.due(game.fish_index, buckets, PLAYER[0], PLAYER[1], 0.0, tick)
+        assert (in_view, 1) in due
+        runs.extend((tick, steps) for fish, steps in due if fish is behind)
+    assert [tick for tick, _ in runs] == [tick for tick in range(1, 9) if (tick + behind.id) % 4 == 0]
+    assert runs[1][1] == 4
+
+
+def test_numpy_due_slots_stagger_far_fish():
+    scheduler = AIScheduler(far_ticks=4)
+    game = make_game('numpy')
+    add_fish(game, BEHIND)
+    add_fish(game, IN_VIEW)
+
+    ran = []
+    for tick in range(1, 9):
+        slots, steps = scheduler.due_slots(game.fish_arrays, PLAYER[0], PLAYER[1], 0.0, tick)
+        assert 1 in slots.tolist()
+        if 0 in slots.tolist():
+            ran.append((tick, int(steps[slots.tolist().index(0)])))
+    assert [tick for tick, _ in ran] == [4, 8]
+    assert ran[1][1] == 4
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_far_fish_only_move_on_their_tick(engine):
+    game = make_game(engine)
+    add_fish(game, BEHIND)
+    moves = 0
+    for tick in range(1, 2 * snake_game.AI_SCHEDULER.far_ticks + 1):
+        game.tick_count = tick
+        before = game.fish_positions()
+        game._update_fish()
+        moves += game.fish_positions() != before
+    assert moves == 2
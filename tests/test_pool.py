@@ -0,0 +1,85 @@
+import pickle
+
+from pool import EntityPool
+
+
+class Thing:
+    def __init__(self, id):
+        self.id = id
+
+    def __repr__(self):
+        return 'Thing(%d)' % self.id
+
+
+def assert_consistent(pool):
+    assert len(pool.positions) == len(pool)
+    for index, entity in enumerate(pool):
+        assert pool.positions[entity.id] == index
+        assert pool.get(entity.id) is entity
+
+
+def test_empty_pool():
+    pool = EntityPool()
+    assert len(pool) == 0
+    assert list(pool) == [] and list(reversed(pool)) == []
+    assert pool.get(1) is None
+    assert not pool.remove(Thing(1))
+    assert Thing(1) not in pool
+    assert_consistent(pool)
+
+
+def test_remove_moves_the_last_entity_into_the_gap():
+    things = [Thing(i) for i in range(5)]
+    pool = EntityPool(things)
+    assert pool.remove(things[1])
+    assert [thing.id for thing in pool] == [0, 4, 2, 3]
+    assert pool.remove(things[3])  # the last one
+    assert [thing.id for thing in pool] == [0, 4, 2]
+    assert things[1] not in pool and things[4] in pool
+    assert_consistent(pool)
+
+
+def test_remove_twice_and_only_entity():
+    thing = Thing(7)
+    pool = EntityPool([thing])
+    assert pool.remove(thing)
+    assert not pool.remove(thing)
+    assert len(pool) == 0
+    assert_consistent(pool)
+
+
+def test_removed_id_is_not_reused():
+    pool = EntityPool([Thing(1), Thing(2)])
+    pool.remove(pool.get(1))
+    assert pool.get(1) is None
+    assert pool.get(2).id == 2
+
+
+def test_remove_while_iterating_in_reverse():
+    pool = EntityPool(Thing(i) for i in range(20))
+    visited = []
+    for thing in reversed(pool):
+        visited.append(thing.id)
+        if thing.id % 3:
+            pool.remove(thing)
+        if thing.id == 10:
+            pool.add(Thing(100))  # not visited
+    assert sorted(visited) == list(range(20))
+    assert sorted(thing.id for thing in pool) == [0, 3, 6, 9, 12, 15, 18, 100]
+    assert_consistent(pool)
+
+
+def test_remove_everything_in_reverse():
+    pool = EntityPool(Thing(i) for i in range(6))
+    for thing in reversed(pool):
+        pool.remove(thing)
+    assert len(pool) == 0
+    assert_consistent(pool)
+
+
+def test_pickle_rebuilds_positions():
+    pool = EntityPool(Thing(i) for i in range(4))
+    pool.remove(pool.get(0))
+    copy = pickle.loads(pickle.dumps(pool))
+    assert [thing.id for thing in copy] == [thing.id for thing in pool]
+    assert_consistent(copy)
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+import snake_game
+
+
+@pytest.fixture
+def client():
+    return snake_game.app.test_client()
+
+
+@pytest.mark.parametrize('body', [
+    {'count': 10000000},
+    {'count': 0},
+    {'count': '3'},
+    {'count': True},
+    [3],
+    None
+])
+def test_spawn_fish_refuses_bad_counts(client, body):
+    response = client.post('/spawn-fish', json=body) if body is not None else client.post('/spawn-fish')
+    assert response.status_code == 400
+
+
+def test_spawn_fish_stops_at_the_cap(client, monkeypatch):
+    monkeypatch.setattr(snake_game, 'MAX_SPAWNED_FISH', 8)
+    for _ in range(3):
+        assert client.post('/spawn-fish', json={'count': 3}).status_code == 200
+    assert len(client.get('/game-state').get_json()['fish']) <= 8
+
+
+@pytest.mark.parametrize('body', [
+    {'index': -1},
+    {'index': 'first'},
+    {'damage': 1e9},
+    {'damage': 0},
+    {'damage': float('nan')},
+    'hit',
+    None
+])
+def test_hit_fish_refuses_bad_input(client, body):
+    response = client.post('/hit-fish', json=body) if body is not None else client.post('/hit-fish')
+    assert response.status_code == 400
+
+
+def test_hit_fish_hits(client):
+    assert client.post('/hit-fish', json={'index': 0, 'damage': 1}).status_code == 200
+
+
+def test_metrics_show_the_stream_limit_and_refusals(client):
+    if snake_game.Sock is None:
+        pytest.skip('flask_sock is not installed')
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'fishing_streams_limit %d' % snake_game.MAX_STREAMS in metrics
+    assert 'fishing_streams_refused_total ' in metrics
+    if 'MAX_STREAMS' not in os.environ:
+        assert snake_game.MAX_STREAMS == snake_game.WEB_THREADS - snake_game.STREAM_RESERVED_THREADS
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+import session_store
+from session_store import SqliteStore, make_store
+
+
+def test_refuses_a_directory_others_can_write(tmp_path):
+    os.chmod(tmp_path, 0o1777)
+    with pytest.raises(PermissionError):
+        SqliteStore(str(tmp_path / 'sessions.db'))
+    assert not (tmp_path / 'sessions.db').exists()
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason='needs root to chown')
+def test_refuses_a_database_of_another_user(tmp_path):
+    os.chmod(tmp_path, 0o700)
+    planted = tmp_path / 'sessions.db'
+    planted.write_bytes(b'')
+    os.chown(planted, 65534, 65534)
+    with pytest.raises(PermissionError):
+        SqliteStore(str(planted))
+
+
+def test_shm_store_makes_a_private_directory(tmp_path, monkeypatch):
+    directory = tmp_path / 'fishing-game'
+    monkeypatch.setattr(session_store, 'SESSION_STORE_DIR', str(directory))
+    store = make_store('shm', 'sessions.db')
+    assert store.path == str(directory / 'sessions.db')
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    assert store.save('sid', 0, b'state') == 1
+    assert store.load('sid') == (1, b'state')
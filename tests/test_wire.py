@@ -0,0 +1,133 @@
+import math
+
+import pytest
+
+import snake_game
+import wire
+from entities import ActivePowerUp, Explosion, TacklePickup
+
+CODEC = snake_game.WIRE
+
+POSITIONS = ('x', 'y')
+ANGLES = ('angle', 'direction', 'rotation', 'bob_offset')
+
+
+def busy_game(engine=snake_game.Game):
+    # A game with something in every record type
+    game = engine(seed=11, clock=lambda: 0.0)
+    player = game.player
+    player.tackle_box = {'flies': 70000, 'spinners': 3, 'crankbaits': 0}
+    for tick in range(30):
+        game.queue_input('FORWARD' if tick % 8 else 'LEFT', 1, False)
+        game.tick()
+    game.create_cast(0.7, 2, 1.5)
+    game.create_cast(-2.5, 3, 1, explosion_radius=2)
+    player.explosions.add(Explosion(game.new_id(), player.x, player.y, 0.5, 10, '#ffff00'))
+    player.explosions.add(Explosion(game.new_id(), player.x + 1, player.y, 0.3, 5))
+    player.power_ups.add(ActivePowerUp(game.new_id(), 'speed', 'lure_speed', 1.5, 30, 12.25))
+    game.pickups.add(TacklePickup(game.new_id(), 'spinners', 12, player.x, player.y + 1, 300))
+    return game
+
+
+def encode(game):
+    fish = game.fish_binary() if isinstance(game, snake_game.NumpyGame) else CODEC.pack_fish(list(game.fish))
+    return CODEC.encode(game, fish, list(game.power_ups), list(game.pickups))
+
+
+def assert_close(decoded, expected, where):
+    for key, value in decoded.items():
+        want = expected[key]
+        if key in POSITIONS:
+            assert abs(value - want) <= 0.5 / wire.POSITION_SCALE + 1e-4, (where, key)
+        elif key in ANGLES:
+            turns = (value - want) / (2 * math.pi)
+            assert abs(turns - round(turns)) <= 1.0 / 0x10000, (where, key)
+        elif key == 'size':
+            assert abs(value - want) <= 0.5 / wire.SIZE_SCALE, (where, key)
+        elif isinstance(value, float):
+            assert value == pytest.approx(want, rel=1e-6), (where, key)
+        else:
+            assert value == want, (where, key)
+
+
+def assert_entities(decoded, expected, where):
+    assert [entity['id'] for entity in decoded] == [entity['id'] for entity in expected], where
+    for entity, want in zip(decoded, expected):
+        assert_close(entity, want, where)
+
+
+def assert_round_trip(game):
+    state = game.get_state()
+    decoded = CODEC.decode(encode(game))
+    assert decoded['score'] == state['score']
+    assert decoded['game_over'] == state['game_over']
+    assert_entities(decoded['fish'], state['fish'], 'fish')
+    assert_entities(decoded['power_ups'], state['power_ups'], 'power_ups')
+    assert_entities(decoded['pickups'], state['pickups'], 'pickups')
+    lists = ('casts', 'explosions', 'power_ups')
+    for name in lists:
+        assert_entities(decoded['player'][name], state['player'][name], name)
+    assert_close({key: value for key, value in decoded['player'].items() if key not in lists},
+                 state['player'], 'player')
+    return decoded
+
+
+def test_round_trip():
+    decoded = assert_round_trip(busy_game())
+    counts = [len(decoded[name]) for name in ('fish', 'power_ups', 'pickups')]
+    counts += [len(decoded['player'][name]) for name in ('casts', 'explosions', 'power_ups')]
+    assert all(counts), counts
+
+
+def test_numpy_engine_round_trip():
+    if snake_game.FishArrays is None:
+        pytest.skip('NumPy is not installed')
+    assert_round_trip(busy_game(snake_game.NumpyGame))
+
+
+def move_everything(game, x, y):
+    player = game.player
+    for entities in (game.power_ups, game.pickups, player.casts, player.explosions):
+        for entity in entities:
+            entity.x, entity.y = x, y
+    if isinstance(game, snake_game.NumpyGame):
+        arrays = game.fish_arrays
+        arrays.x[:arrays.count] = x
+        arrays.y[:arrays.count] = y
+    else:
+        for fish in game.fish:
+            fish.x, fish.y = x, y
+
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+def test_positions_beyond_the_version_1_range(engine):
+    # Version 1 positions stopped at 1024 cells
+    if engine == 'numpy' and snake_game.FishArrays is None:
+        pytest.skip('NumPy is not installed')
+    game = busy_game(snake_game.NumpyGame if engine == 'numpy' else snake_game.Game)
+    move_everything(game, 1500.25, 60000.5)
+    assert_round_trip(game)
+
+
+def test_negative_positions_clamp_to_zero():
+    game = busy_game()
+    move_everything(game, -3.0, 4.5)
+    decoded = CODEC.decode(encode(game))
+    for entity in decoded['fish'] + decoded['pickups'] + decoded['player']['casts']:
+        assert (entity['x'], entity['y']) == (0, 4.5)
+
+
+def test_empty_game():
+    game = busy_game()
+    for entities in (game.fish, game.power_ups, game.pickups, game.player.casts,
+                     game.player.explosions, game.player.power_ups):
+        entities.clear()
+    decoded = assert_round_trip(game)
+    assert decoded['fish'] == [] and decoded['player']['casts'] == []
+
+
+def test_other_versions_are_refused():
+    data = bytearray(encode(busy_game()))
+    data[2] = wire.VERSION - 1
+    with pytest.raises(ValueError):
+        CODEC.decode(bytes(data))
@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger('fishing_game.ticker')
+
+# Simulation rate for every game in this worker
+TICK_RATE = float(os.environ.get('TICK_RATE', 20))  # ticks per second
+
+# Games with no request for this long stop ticking until the player returns
+ACTIVE_WINDOW = float(os.environ.get('ACTIVE_WINDOW', 10))  # seconds
+
+# If we fall this many ticks behind, skip ahead instead of trying to catch up
+MAX_TICK_LAG = 5
+
+
+class TickLoop:
+    def __init__(self, registry, rate=TICK_RATE, active_window=ACTIVE_WINDOW, timer=None, on_sweep=None):
+        self.registry = registry
+        self.timer = timer  # optional histogram for whole-loop tick time
+        self.on_sweep = on_sweep  # optional housekeeping run after each sweep
+        self.interval = 1.0 / rate
+        self.active_window = active_window
+        self.thread = None
+        self.stopping = threading.Event()
+        self.start_lock = threading.Lock()
+
+        # Counters for sizing workers
+        self.ticks = 0
+        self.skipped_ticks = 0
+        self.last_tick_seconds = 0.0
+        self.last_tick_games = 0
+        self.failed_ticks = 0
+        self.restarts = 0
+
+    def alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        # Safe to call on every request; starts the thread if it isn't
+        # running, including again if it has died
+        if self.alive():
+            return
+        with self.start_lock:
+            if not self.alive():
+                if self.thread is not None:
+                    log.error("Tick loop thread died; restarting it")
+                    self.restarts += 1
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self.run, name='tick-loop', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        next_tick = time.monotonic()
+        last_sweep = next_tick
+
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            self.tick_all()
+            finished = time.monotonic()
+            self.last_tick_seconds = finished - started
+            if self.timer is not None:
+                self.timer.observe(self.last_tick_seconds)
+
+            # Drop idle sessions about once a second
+            if finished - last_sweep >= 1.0:
+                try:
+                    self.registry.sweep()
+                    if self.on_sweep is not None:
+                        self.on_sweep()
+                except Exception:
+                    log.exception("Session sweep failed")
+                last_sweep = finished
+
+            next_tick += self.interval
+            lag = finished - next_tick
+            if lag > self.interval * MAX_TICK_LAG:
+                # Too far behind: keep a steady rate rather than bursting
+                self.skipped_ticks += int(lag / self.interval)
+                next_tick = finished + self.interval
+
+            self.stopping.wait(max(0.0, next_tick - time.monotonic()))
+
+    def tick_all(self):
+        games = self.registry.active_games(self.active_window)
+        for game in games:
+            # One broken game must not stop every other game in the worker;
+            # its queued inputs go too, in case they are what broke it
+            try:
+                game.tick()
+            except Exception:
+                log.exception("Tick failed; dropping the game's queued inputs")
+                self.failed_ticks += 1
+                game.drop_inputs()
+        self.ticks += 1
+        self.last_tick_games = len(games)
+
+    def stats(self):
+        return {
+            'tick_rate': 1.0 / self.interval,
+            'ticks': self.ticks,
+            'skipped_ticks': self.skipped_ticks,
+            'last_tick_seconds': self.last_tick_seconds,
+            'last_tick_games': self.last_tick_games,
+            'failed_ticks': self.failed_ticks,
+            'alive': self.alive(),
+            'restarts': self.restarts
+        }
@@ -0,0 +1,273 @@
+import math
+import struct
+
+# Compact binary encoding of the full game state, for clients that send
+# "Accept: application/x-fishing-state". JSON stays the default.
+#
+# Everything is little-endian and laid out as:
+#
+#   header    magic 'FS', version, flags (bit 0 = game over, bit 1 =
+#             filtered), score
+#   player    one PLAYER record
+#   counts    number of fish, casts, explosions, active power-ups,
+#             power-ups and pickups
+#   records   that many FISH, CAST, EXPLOSION, ACTIVE_POWER_UP, POWER_UP
+#             and PICKUP records, in that order
+#   hidden    only when filtered: HIDDEN_COUNTS, then that many uint32 ids
+#             of fish, power-ups and pickups left out of this frame by
+#             interest management (see interest.py), which the client keeps
+#             showing as last sent, as the JSON state's "hidden" says
+#
+# Entity positions are fixed point (POSITION_SCALE steps per cell) and
+# angles are 16-bit fractions of a turn. Names (fish types, rods, power-ups,
+# tackle) travel as indexes into the tables from schema(), which clients
+# fetch once from /wire-schema instead of on every frame. Fields the client
+# never draws (fish speed and timers, cast distance) are left out, as in
+# delta frames.
+
+CONTENT_TYPE = 'application/x-fishing-state'
+MAGIC = b'FS'
+VERSION = 3
+
+# uint32 positions: 1/64 cell steps on maps up to 2^26 cells across.
+# Version 1 sent uint16, which ran out at 1024 cells and pinned anything
+# further out to the edge on chunked levels. Version 2 had no hidden ids,
+# so fish out of view vanished from most frames.
+POSITION_SCALE = 64
+POSITION_MAX = 0xFFFFFFFF
+ANGLE_SCALE = 0x10000 / (2 * math.pi)
+SIZE_SCALE = 100
+
+FLAG_GAME_OVER = 1
+FLAG_FILTERED = 2
+
+HIDDEN_COLLECTIONS = ('fish', 'power_ups', 'pickups')
+
+FISH_STATES = ('patrol', 'chase', 'charge')
+PICKUP_KINDS = ('rod', 'tackle')
+EXPLOSION_COLORS = (None, '#ff0000', '#ffff00')
+
+HEADER = struct.Struct('<2sBBi')
+# x, y, angle, health, armor, current rod, owned rods bitmask, flies,
+# spinners, crankbaits, rod cooldown, lures, lure power, lure speed,
+# casting speed
+PLAYER = struct.Struct('<fffihBBIIIHhfff')
+COUNTS = struct.Struct('<6H')
+HIDDEN_COUNTS = struct.Struct('<3I')
+FISH = struct.Struct('<IIIBBHf')          # id, x, y, type, state, direction, health
+CAST = struct.Struct('<IIIHB')            # id, x, y, angle, explosion radius
+EXPLOSION = struct.Struct('<IIIBBB')      # id, x, y, size, time, colour
+ACTIVE_POWER_UP = struct.Struct('<IBd')   # id, type, start time
+POWER_UP = struct.Struct('<IIIBHH')       # id, x, y, type, rotation, bob offset
+PICKUP = struct.Struct('<IIIBBHH')        # id, x, y, kind, rod or tackle type, amount, time
+
+
+def _position(value):
+    return min(POSITION_MAX, max(0, int(round(value * POSITION_SCALE))))
+
+
+def _angle(value):
+    return int(round(value * ANGLE_SCALE)) & 0xFFFF
+
+
+def _clamp(value, low, high):
+    return min(high, max(low, int(value)))
+
+
+class StateCodec:
+    def __init__(self, fish_types, rods, tackle_types, power_up_types):
+        self.fish_types = list(fish_types)
+        self.rods = list(rods)
+        self.tackle_types = list(tackle_types)
+        self.power_up_types = [dict(power_up) for power_up in power_up_types]
+
+        self.fish_codes = {name: code for code, name in enumerate(self.fish_types)}
+        self.rod_codes = {name: code for code, name in enumerate(self.rods)}
+        self.tackle_codes = {name: code for code, name in enumerate(self.tackle_types)}
+        self.power_up_codes = {power_up['type']: code for code, power_up in enumerate(self.power_up_types)}
+        self.state_codes = {name: code for code, name in enumerate(FISH_STATES)}
+        self.color_codes = {color: code for code, color in enumerate(EXPLOSION_COLORS)}
+
+    def schema(self):
+        # Static tables the client needs to decode frames
+        return {
+            'content_type': CONTENT_TYPE,
+            'version': VERSION,
+            'position_scale': POSITION_SCALE,
+            'angle_scale': ANGLE_SCALE,
+            'size_scale': SIZE_SCALE,
+            'fish_types': self.fish_types,
+            'fish_states': list(FISH_STATES),
+            'rods': self.rods,
+            'tackle_types': self.tackle_types,
+            'power_ups': self.power_up_types,
+            'pickup_kinds': list(PICKUP_KINDS),
+            'explosion_colors': list(EXPLOSION_COLORS)
+        }
+
+    def pack_fish(self, fish_list):
+        # Returns (count, bytes) for Fish objects. Fish only ever stand on
+        # the map, so try without clamping first; this runs for every fish
+        # on every frame.
+        fish_codes = self.fish_codes
+        state_codes = self.state_codes
+        pack = FISH.pack
+        try:
+            return len(fish_list), b''.join([
+                pack(fish.id, round(fish.x * POSITION_SCALE), round(fish.y * POSITION_SCALE),
+                     fish_codes[fish.type], state_codes[fish.state],
+                     round(fish.direction * ANGLE_SCALE) & 0xFFFF, fish.health)
+                for fish in fish_list
+            ])
+        except (struct.error, KeyError):
+            return len(fish_list), b''.join([
+                pack(fish.id, _position(fish.x), _position(fish.y), fish_codes[fish.type],
+                     state_codes.get(fish.state, 0), _angle(fish.direction), fish.health)
+                for fish in fish_list
+            ])
+
+    def encode(self, game, fish_block, power_ups, pickups, hidden=None):
+        # fish_block is (count, bytes) from pack_fish() or an engine's own
+        # packer; power_ups and pickups are the ones this frame sends, and
+        # hidden the ids by collection it leaves out, if it filters
+        player = game.player
+        flags = FLAG_GAME_OVER if game.game_over else 0
+        if hidden is not None:
+            flags |= FLAG_FILTERED
+        tackle = player.tackle_box
+        rods_mask = 0
+        for rod in player.rods:
+            rods_mask |= 1 << self.rod_codes[rod]
+
+        parts = [
+            HEADER.pack(MAGIC, VERSION, flags, game.score),
+            PLAYER.pack(
+                player.x, player.y, player.angle,
+                _clamp(player.health, -0x80000000, 0x7FFFFFFF),
+                _clamp(player.armor, -0x8000, 0x7FFF),
+                self.rod_codes[player.current_rod], rods_mask,
+                _clamp(tackle.get('flies', 0), 0, 0xFFFFFFFF),
+                _clamp(tackle.get('spinners', 0), 0, 0xFFFFFFFF),
+                _clamp(tackle.get('crankbaits', 0), 0, 0xFFFFFFFF),
+                _clamp(player.rod_cooldown, 0, 0xFFFF),
+                _clamp(player.lures, -0x8000, 0x7FFF),
+                player.lure_power, player.lure_speed, player.casting_speed),
+            COUNTS.pack(fish_block[0], len(player.casts), len(player.explosions),
+                        len(player.power_ups), len(power_ups), len(pickups)),
+            fish_block[1]
+        ]
+
+        for cast in player.casts:
+            parts.append(CAST.pack(cast.id, _position(cast.x), _position(cast.y), _angle(cast.angle),
+                                   _clamp(cast.explosion_radius or 0, 0, 0xFF)))
+        for explosion in player.explosions:
+            parts.append(EXPLOSION.pack(
+                explosion.id, _position(explosion.x), _position(explosion.y),
+                _clamp(explosion.size * SIZE_SCALE, 0, 0xFF), _clamp(explosion.time, 0, 0xFF),
+                self.color_codes.get(explosion.color, 0)))
+        for power_up in player.power_ups:
+            parts.append(ACTIVE_POWER_UP.pack(power_up.id, self.power_up_codes[power_up.type],
+                                              power_up.start_time))
+        for power_up in power_ups:
+            parts.append(POWER_UP.pack(
+                power_up.id, _position(power_up.x), _position(power_up.y),
+                self.power_up_codes[power_up.type], _angle(power_up.rotation), _angle(power_up.bob_offset)))
+        for pickup in pickups:
+            if pickup.type == 'rod':
+                kind, item, amount = 0, self.rod_codes[pickup.rod], 0
+            else:
+                kind, item, amount = 1, self.tackle_codes[pickup.tackle_type], pickup.amount
+            parts.append(PICKUP.pack(pickup.id, _position(pickup.x), _position(pickup.y), kind, item,
+                                     _clamp(amount, 0, 0xFFFF), _clamp(pickup.time, 0, 0xFFFF)))
+        if hidden is not None:
+            ids = [hidden[name] for name in HIDDEN_COLLECTIONS]
+            parts.append(HIDDEN_COUNTS.pack(*map(len, ids)))
+            for each in ids:
+                parts.append(struct.pack('<%dI' % len(each), *each))
+        return b''.join(parts)
+
+    def decode(self, data):
+        # Back to the JSON state shape, less the fields the encoding drops;
+        # for tests, tools and debugging
+        magic, version, flags, score = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version %d state frame' % VERSION)
+        offset = HEADER.size
+
+        (x, y, angle, health, armor, current_rod, rods_mask, flies, spinners, crankbaits,
+         rod_cooldown, lures, lure_power, lure_speed, casting_speed) = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        counts = COUNTS.unpack_from(data, offset)
+        offset += COUNTS.size
+
+        def records(layout, count):
+            nonlocal offset
+            rows = [layout.unpack_from(data, offset + i * layout.size) for i in range(count)]
+            offset += layout.size * count
+            return rows
+
+        def position(value):
+            return value / POSITION_SCALE
+
+        def angle_of(value):
+            return value / ANGLE_SCALE
+
+        fish = [{'id': fish_id, 'x': position(fx), 'y': position(fy), 'type': self.fish_types[kind],
+                 'state': FISH_STATES[state], 'direction': angle_of(direction), 'health': fish_health}
+                for fish_id, fx, fy, kind, state, direction, fish_health in records(FISH, counts[0])]
+        casts = [{'id': cast_id, 'x': position(cx), 'y': position(cy), 'angle': angle_of(cast_angle),
+                  'explosion_radius': radius}
+                 for cast_id, cx, cy, cast_angle, radius in records(CAST, counts[1])]
+        explosions = []
+        for explosion_id, ex, ey, size, time, color in records(EXPLOSION, counts[2]):
+            explosion = {'id': explosion_id, 'x': position(ex), 'y': position(ey),
+                         'size': size / SIZE_SCALE, 'time': time}
+            if EXPLOSION_COLORS[color] is not None:
+                explosion['color'] = EXPLOSION_COLORS[color]
+            explosions.append(explosion)
+        active_power_ups = []
+        for power_up_id, kind, start_time in records(ACTIVE_POWER_UP, counts[3]):
+            power_up = dict(self.power_up_types[kind], id=power_up_id, start_time=start_time)
+            power_up.pop('color', None)
+            active_power_ups.append(power_up)
+        power_ups = [dict(self.power_up_types[kind], id=power_up_id, x=position(px), y=position(py),
+                          rotation=angle_of(rotation), bob_offset=angle_of(bob))
+                     for power_up_id, px, py, kind, rotation, bob in records(POWER_UP, counts[4])]
+        pickups = []
+        for pickup_id, px, py, kind, item, amount, time in records(PICKUP, counts[5]):
+            pickup = {'id': pickup_id, 'type': PICKUP_KINDS[kind], 'x': position(px), 'y': position(py),
+                      'time': time}
+            if kind == 0:
+                pickup['rod'] = self.rods[item]
+            else:
+                pickup['tackle_type'] = self.tackle_types[item]
+                pickup['amount'] = amount
+            pickups.append(pickup)
+
+        state = {
+            'player': {
+                'x': x, 'y': y, 'angle': angle, 'health': health, 'armor': armor,
+                'current_rod': self.rods[current_rod],
+                'rods': [rod for code, rod in enumerate(self.rods) if rods_mask & (1 << code)],
+                'tackle_box': {'flies': flies, 'spinners': spinners, 'crankbaits': crankbaits},
+                'rod_cooldown': rod_cooldown,
+                'casts': casts,
+                'explosions': explosions,
+                'power_ups': active_power_ups,
+                'lures': lures, 'lure_power': lure_power, 'lure_speed': lure_speed,
+                'casting_speed': casting_speed
+            },
+            'fish': fish,
+            'power_ups': power_ups,
+            'score': score,
+            'game_over': bool(flags & FLAG_GAME_OVER),
+            'pickups': pickups
+        }
+        if flags & FLAG_FILTERED:
+            hidden_counts = HIDDEN_COUNTS.unpack_from(data, offset)
+            offset += HIDDEN_COUNTS.size
+            state['hidden'] = {}
+            for name, count in zip(HIDDEN_COLLECTIONS, hidden_counts):
+                state['hidden'][name] = list(struct.unpack_from('<%dI' % count, data, offset))
+                offset += 4 * count
+        return state